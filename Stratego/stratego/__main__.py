@@ -1,8 +1,12 @@
 import arcade
 from views import IntroView
 from config import config
+from stratego_game import game
 
 window = arcade.Window(config['window']['width'], config['window']['height'], config['window']['title'])
 intro_view = IntroView()
 window.show_view(intro_view)
-arcade.run()
+try:
+    arcade.run()
+finally:
+    game.close_strategies()
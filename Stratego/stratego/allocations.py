@@ -0,0 +1,235 @@
+"""
+Allocations
+
+Opt-in memory profiling with tracemalloc. Every game carries a profiler that
+does nothing until it is started, once started the engine's scopes report how
+much memory they allocate: whole games, every turn and the phases of a turn
+(generating moves, choosing one and taking it), and rebuilding the armies.
+With profiling turned on in the config every game is traced from start_game
+to end_game, which publishes the game's totals and prints them.
+
+For every scope the profiler keeps the peak, the most memory held above what
+was allocated when the scope started, and what the scope still held when it
+ended. Scopes nest, an outer scope's peak covers everything inside it. Only
+running totals are kept, so long sessions can stay profiled.
+
+Budgets are given in bytes per piece on the board, so one set of budgets
+holds for every board size. The benchmark and the tests check them, a scope
+going over its budget raises.
+"""
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, replace
+
+from config import config
+
+# Scopes measured by the engine
+GAME = 'game'
+TURN = 'turn'
+MOVES = 'moves'
+CHOOSE = 'choose'
+TAKE = 'take'
+RESET = 'reset'
+
+# Handed out by profilers that are not running, reusable
+_IDLE = nullcontext()
+
+# Profilers that started tracing and are still running, tracing stops with the last of them
+_tracers = 0
+
+
+@dataclass
+class AllocationStats:
+    """
+    Running totals of one scope
+
+    Attributes
+    ----------
+    calls : int
+        times the scope was measured
+    total_peak : int
+        summed peak bytes of every call
+    max_peak : int
+        largest peak bytes of a single call
+    total_retained : int
+        summed bytes still held at the end of every call, negative if the scope freed more than it allocated
+    """
+    calls: int = 0
+    total_peak: int = 0
+    max_peak: int = 0
+    total_retained: int = 0
+
+    @property
+    def mean_peak(self) -> float:
+        return self.total_peak / self.calls if self.calls else 0.0
+
+    @property
+    def mean_retained(self) -> float:
+        return self.total_retained / self.calls if self.calls else 0.0
+
+
+class AllocationProfiler:
+    """
+    Measures the memory allocated by named scopes while tracemalloc is tracing
+
+    Attributes
+    ----------
+    stats : dict[str, AllocationStats]
+        totals of every scope measured so far
+    """
+
+    def __init__(self):
+        self.stats: dict[str, AllocationStats] = {}
+        self.running = False
+        self._tracing = False
+        # [traced bytes at the start, peak so far, scope] of every open scope, innermost last
+        self._open: list[list] = []
+
+    def start(self) -> None:
+        """
+        Starts measuring, and tracing unless something else traces already
+        :return: None
+        """
+        global _tracers
+        if self.running:
+            return
+        if not tracemalloc.is_tracing() or _tracers:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            _tracers += 1
+            self._tracing = True
+        self.running = True
+
+    def stop(self) -> None:
+        """
+        Stops measuring, the totals are kept. Tracing stops once no profiler that started it is running.
+        :return: None
+        """
+        global _tracers
+        self.running = False
+        self._open.clear()
+        if self._tracing:
+            self._tracing = False
+            _tracers -= 1
+            if _tracers == 0:
+                tracemalloc.stop()
+
+    def reset(self) -> None:
+        self.stats.clear()
+
+    def measure(self, scope: str):
+        """
+        :param scope: Name the allocations are counted under
+        :return: Context manager measuring the allocations inside it, doing nothing if the profiler isn't running
+        """
+        if not self.running or not tracemalloc.is_tracing():
+            return _IDLE
+        return self._measure(scope)
+
+    @contextmanager
+    def _measure(self, scope: str):
+        frame = self._begin(scope)
+        try:
+            yield
+        finally:
+            if self._open and self._open[-1] is frame:
+                self._end()
+
+    def begin(self, scope: str) -> None:
+        """
+        Opens a scope that ends with a later call to end, for scopes that don't fit a with block
+        :param scope: Name the allocations are counted under
+        :return: None
+        """
+        if self.running and tracemalloc.is_tracing():
+            self._begin(scope)
+
+    def end(self, scope: str) -> AllocationStats | None:
+        """
+        Ends the innermost open scope of a name, scopes opened inside it and never ended are dropped
+        :param scope: Name given to begin
+        :return: Totals of the scope, None if it wasn't open
+        """
+        if not tracemalloc.is_tracing():
+            self._open.clear()
+            return None
+        for depth in range(len(self._open) - 1, -1, -1):
+            if self._open[depth][2] == scope:
+                # Dropped scopes still count towards the peak of the one ended
+                for frame in self._open[depth + 1:]:
+                    self._open[depth][1] = max(self._open[depth][1], frame[1])
+                del self._open[depth + 1:]
+                self._end()
+                return self.stats[scope]
+        return None
+
+    def _begin(self, scope: str) -> list:
+        current, peak = tracemalloc.get_traced_memory()
+        if self._open:
+            # The peak is about to be reset, the enclosing scope keeps what it reached so far
+            self._open[-1][1] = max(self._open[-1][1], peak)
+        tracemalloc.reset_peak()
+        frame = [current, current, scope]
+        self._open.append(frame)
+        return frame
+
+    def _end(self) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        start, frame_peak, scope = self._open.pop()
+        frame_peak = max(frame_peak, peak)
+        if self._open:
+            self._open[-1][1] = max(self._open[-1][1], frame_peak)
+        stats = self.stats.get(scope)
+        if stats is None:
+            stats = self.stats[scope] = AllocationStats()
+        stats.calls += 1
+        stats.total_peak += frame_peak - start
+        stats.max_peak = max(stats.max_peak, frame_peak - start)
+        stats.total_retained += current - start
+
+    def snapshot(self) -> dict[str, AllocationStats]:
+        """
+        :return: Copy of the totals of every scope, unaffected by later measurements
+        """
+        return {scope: replace(stats) for scope, stats in self.stats.items()}
+
+    def over_budget(self, budgets: dict[str, int], pieces: int) -> list[str]:
+        """
+        Compares the largest peak of every scope with its budget
+        :param budgets: Bytes per piece on the board of every budgeted scope
+        :param pieces: Pieces on the board
+        :return: Description of every scope over its budget, empty if all are within
+        """
+        return [f'{scope} peaked at {self.stats[scope].max_peak} bytes, '
+                f'the budget is {budget * pieces} bytes for {pieces} pieces'
+                for scope, budget in budgets.items()
+                if scope in self.stats and self.stats[scope].max_peak > budget * pieces]
+
+    def check(self, budgets: dict[str, int], pieces: int) -> None:
+        """
+        :param budgets: Bytes per piece on the board of every budgeted scope
+        :param pieces: Pieces on the board
+        :return: None
+        :raises:
+            :exception: Raised if any scope went over its budget
+        """
+        breaches = self.over_budget(budgets, pieces)
+        if breaches:
+            raise Exception('Allocation budget exceeded: ' + '; '.join(breaches))
+
+    def report(self) -> str:
+        """
+        :return: Table of the totals of every scope, in KiB
+        """
+        lines = [f'{"scope":<16}{"calls":>8}{"mean peak":>11}{"max peak":>10}{"mean retained":>15}']
+        for scope, stats in self.stats.items():
+            lines.append(f'{scope:<16}{stats.calls:>8}{stats.mean_peak / 1024:>11.1f}{stats.max_peak / 1024:>10.1f}'
+                         f'{stats.mean_retained / 1024:>15.1f}')
+        return '\n'.join(lines)
+
+
+def budgets() -> dict[str, int]:
+    """
+    :return: Configured bytes per piece on the board of every budgeted scope
+    """
+    return dict(config['profiling']['budgets'])
@@ -0,0 +1,373 @@
+"""
+Batch
+
+Lockstep simulation of many Stratego games at once. Every game is held as
+rows of stacked NumPy arrays (rank codes, owners and hidden flags per square)
+so that move generation and attack resolution run vectorized over all games
+instead of one Python object graph at a time.
+"""
+import numpy as np
+
+from config import config
+from geometry import DIRECTIONS, configured_lakes
+from observation import OPPONENT, USER
+from pieces import army_counts, load_units
+from outcomes import NO_ATTACK, ATTACKER_WINS, DEFENDER_WINS, BOTH_LOSE, build_table
+
+# Square contents
+EMPTY = -1
+# Owner code used for padding outside the board
+WALL = 3
+
+# Game results, a side that wins is its own result
+ONGOING = -1
+DRAW = 2
+
+FLAG = 0
+
+
+def army_ranks(counts: dict[int, int] = None) -> np.ndarray:
+    """
+    Builds the list of ranks making up a single army
+    :param counts: Mapping of piece strength to piece count, defaults to the configured army
+    :return: Array of ranks, one entry per piece
+    """
+    if counts is None:
+        counts = army_counts()
+    ranks = []
+    for strength, count in counts.items():
+        ranks.extend([strength] * count)
+    return np.array(ranks, dtype=np.int8)
+
+
+class BatchSimulator:
+    """
+    A class holding K games as stacked arrays and stepping them in lockstep
+
+    Attributes
+    ----------
+    count : int
+        number of games held by the simulator
+    ranks : np.ndarray
+        (K, rows * columns) piece strength on each square, EMPTY if no piece
+    owners : np.ndarray
+        (K, rows * columns) side owning the piece on each square, EMPTY if no piece
+    hidden : np.ndarray
+        (K, rows * columns) whether the piece on each square is still hidden
+    turn : np.ndarray
+        (K,) side to move in each game
+    winners : np.ndarray
+        (K,) ONGOING, USER, OPPONENT or DRAW
+    plies : np.ndarray
+        (K,) number of plies played in each game
+    """
+
+    def __init__(self, count: int, rows: int = None, columns: int = None, setup_rows: int = None,
+                 policy: str = 'random', seed: int | None = None, units: list[dict] = None,
+                 no_capture_limit: int = None, lakes: frozenset[tuple[int, int]] = None):
+        if no_capture_limit is None:
+            no_capture_limit = config['rules']['no_capture_limit']
+        if rows is None:
+            rows = config['board']['rows']
+        if columns is None:
+            columns = config['board']['columns']
+        if setup_rows is None:
+            setup_rows = config['board']['setup_rows']
+        if lakes is None:
+            lakes = configured_lakes(rows, columns, setup_rows)
+        if policy not in ('random', 'attack'):
+            raise Exception(f'Unknown batch policy {policy}')
+
+        self._count = count
+        self._rows = rows
+        self._columns = columns
+        self._setup_rows = setup_rows
+        self._squares = rows * columns
+        self._policy = policy
+        self._no_capture_limit = no_capture_limit
+        self._rng = np.random.default_rng(seed)
+
+        if units is None:
+            units = load_units()
+        self._unit_names = [unit['name'] for unit in units]
+
+        # Per-rank lookup tables
+        max_range = max(rows, columns) - 1
+        move_range = []
+        for unit in units:
+            limit = unit['move_limit']
+            move_range.append(max_range if limit is None else limit)
+        self._move_range = np.array(move_range, dtype=np.int16)
+        self._outcomes = np.array(build_table(units), dtype=np.int8)
+        self._max_range = max_range
+
+        # Geometry: destination square for every (square, direction, distance), -1 if off the board
+        targets = np.full((self._squares, len(DIRECTIONS), max_range), -1, dtype=np.int32)
+        for square in range(self._squares):
+            x, y = square % columns, square // columns
+            for d, (dx, dy) in enumerate(DIRECTIONS):
+                for step in range(1, max_range + 1):
+                    tx, ty = x + dx * step, y + dy * step
+                    if 0 <= tx < columns and 0 <= ty < rows:
+                        targets[square, d, step - 1] = ty * columns + tx
+        self._targets = targets
+        # Lake squares are walled off like the edges of the board
+        self._lake_columns = np.array([x for x, y in sorted(lakes)], dtype=np.int32)
+        self._lake_rows = np.array([y for x, y in sorted(lakes)], dtype=np.int32)
+
+        # Game state
+        self.ranks = np.full((count, self._squares), EMPTY, dtype=np.int8)
+        self.owners = np.full((count, self._squares), EMPTY, dtype=np.int8)
+        self.hidden = np.zeros((count, self._squares), dtype=bool)
+        self.turn = np.full(count, USER, dtype=np.int8)
+        self.winners = np.full(count, ONGOING, dtype=np.int8)
+        self.plies = np.zeros(count, dtype=np.int32)
+        self._passes = np.zeros(count, dtype=np.int8)
+        self._quiet = np.zeros(count, dtype=np.int32)
+
+    # PROPERTIES
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def rows(self) -> int:
+        return self._rows
+
+    @property
+    def columns(self) -> int:
+        return self._columns
+
+    @property
+    def active(self) -> np.ndarray:
+        return self.winners == ONGOING
+
+    # SETUP
+    def setup_squares(self, side: int) -> np.ndarray:
+        """
+        Squares of a side's setup zone, in the same order that presets are applied
+        :param side: USER or OPPONENT
+        :return: Array of square indices
+        """
+        if side == USER:
+            rows = range(0, self._setup_rows)
+        else:
+            rows = range(self._rows - 1, self._rows - 1 - self._setup_rows, -1)
+        return np.array([y * self._columns + x for y in rows for x in range(self._columns)], dtype=np.int32)
+
+    def _place(self, side: int, layouts: np.ndarray) -> None:
+        squares = self.setup_squares(side)
+        self.ranks[:, squares] = layouts
+        self.owners[:, squares] = side
+        self.hidden[:, squares] = True
+
+    def _reset_state(self) -> None:
+        self.ranks.fill(EMPTY)
+        self.owners.fill(EMPTY)
+        self.hidden.fill(False)
+        self.turn.fill(USER)
+        self.winners.fill(ONGOING)
+        self.plies.fill(0)
+        self._passes.fill(0)
+        self._quiet.fill(0)
+
+    def setup_random(self, counts: dict[int, int] = None) -> None:
+        """
+        Shuffles a full army into each side's setup zone for every game
+        :param counts: Mapping of piece strength to piece count, defaults to the configured army scaled to the board
+        """
+        if counts is None:
+            counts = army_counts(self._columns, self._setup_rows)
+        army = army_ranks(counts)
+        zone = len(self.setup_squares(USER))
+        if len(army) != zone:
+            raise Exception(f'Army of {len(army)} pieces does not fit a setup zone of {zone} squares')
+
+        self._reset_state()
+        for side in (USER, OPPONENT):
+            order = np.argsort(self._rng.random((self._count, zone)), axis=1)
+            self._place(side, army[order])
+
+    def setup_presets(self, user_layouts: list[list[str]], opponent_layouts: list[list[str]]) -> None:
+        """
+        Places preset layouts for every game. Layouts are indexed per game, cycling if fewer than K are given.
+        :param user_layouts: Layouts (lists of piece names) for the user side
+        :param opponent_layouts: Layouts (lists of piece names) for the opponent side
+        """
+        self._reset_state()
+        for side, layouts in ((USER, user_layouts), (OPPONENT, opponent_layouts)):
+            encoded = np.array([[self._unit_names.index(name) for name in layout] for layout in layouts],
+                               dtype=np.int8)
+            self._place(side, encoded[np.arange(self._count) % len(encoded)])
+
+    def load(self, ranks: np.ndarray, owners: np.ndarray, hidden: np.ndarray, turn: np.ndarray) -> None:
+        """
+        Loads explicit game states, e.g. positions taken from a running game
+        """
+        self._reset_state()
+        self.ranks[:] = ranks
+        self.owners[:] = owners
+        self.hidden[:] = hidden
+        self.turn[:] = turn
+
+    # RULES
+    def resolve(self, attackers: np.ndarray, defenders: np.ndarray) -> np.ndarray:
+        """
+        Looks up attack outcomes in the shared rank-vs-rank table
+        :param attackers: Ranks of the attacking pieces
+        :param defenders: Ranks of the defending pieces
+        :return: ATTACKER_WINS, DEFENDER_WINS or BOTH_LOSE for every pair
+        """
+        return self._outcomes[attackers, defenders]
+
+    def legal_moves(self, games: np.ndarray = None) -> np.ndarray:
+        """
+        Generates the legal move mask for the side to move
+        :param games: Indices of the games to generate moves for, defaults to every game
+        :return: (games, directions, distance, rows, columns) boolean mask
+        """
+        if games is None:
+            games = np.arange(self._count)
+        pad = self._max_range
+        shape = (len(games), self._rows, self._columns)
+        owners = self.owners[games].reshape(shape)
+        ranks = self.ranks[games].reshape(shape)
+        turn = self.turn[games][:, None, None]
+
+        # Surround the boards with walls so that every shifted view stays in bounds
+        walled = np.full((len(games), self._rows + 2 * pad, self._columns + 2 * pad), WALL, dtype=np.int8)
+        walled[:, pad:pad + self._rows, pad:pad + self._columns] = owners
+        walled[:, pad + self._lake_rows, pad + self._lake_columns] = WALL
+
+        own = owners == turn
+        reach = np.where(own, self._move_range[np.where(own, ranks, 0)], 0)
+
+        legal = np.zeros((len(games), len(DIRECTIONS), self._max_range, self._rows, self._columns), dtype=bool)
+        for d, (dx, dy) in enumerate(DIRECTIONS):
+            # Path stays clear while every square passed through so far is empty
+            clear = np.ones(shape, dtype=bool)
+            for step in range(self._max_range):
+                if not (clear & (reach > step)).any():
+                    break
+                top = pad + dy * (step + 1)
+                left = pad + dx * (step + 1)
+                target = walled[:, top:top + self._rows, left:left + self._columns]
+                legal[:, d, step] = clear & (reach > step) & (target != turn) & (target != WALL)
+                clear &= target == EMPTY
+        return legal
+
+    def _choose(self, games: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        legal = self.legal_moves(games)
+        entry, rest = np.divmod(np.flatnonzero(legal), legal[0].size)
+        direction, rest = np.divmod(rest, self._max_range * self._squares)
+        step, square = np.divmod(rest, self._squares)
+        target = self._targets[square, direction, step]
+        owner = games[entry]
+
+        # Random policy: every legal move gets a random score
+        scores = self._rng.random(len(entry))
+        if self._policy == 'attack':
+            # Prefer captures we know we win, then probing hidden pieces, then advancing
+            enemy = self.owners[owner, target] == 1 - self.turn[owner]
+            hidden = self.hidden[owner, target]
+            outcome = self.resolve(self.ranks[owner, square], np.maximum(self.ranks[owner, target], 0))
+            scores += 4 * (enemy & ~hidden & (outcome == ATTACKER_WINS))
+            scores += 2 * (enemy & hidden)
+            forward = np.where(self.turn[owner] == USER, 1, -1)
+            scores += (target // self._columns - square // self._columns) * forward > 0
+
+        # Best scoring move of every game is the first entry of its group
+        order = np.lexsort((-scores, entry))
+        first = order[np.flatnonzero(np.r_[True, entry[order][1:] != entry[order][:-1]])] if len(order) else order
+
+        has_move = np.zeros(len(games), dtype=bool)
+        source = np.zeros(len(games), dtype=np.int32)
+        destination = np.zeros(len(games), dtype=np.int32)
+        has_move[entry[first]] = True
+        source[entry[first]] = square[first]
+        destination[entry[first]] = target[first]
+        return has_move, source, destination
+
+    def step(self) -> int:
+        """
+        Plays one ply in every unfinished game
+        :return: Number of games still in progress afterwards
+        """
+        active = np.flatnonzero(self.active)
+        if not len(active):
+            return 0
+        has_move, source, target = self._choose(active)
+
+        # A side without moves passes, if both sides pass in a row nobody can win
+        passing = active[~has_move]
+        self._passes[passing] += 1
+        self._passes[active[has_move]] = 0
+        self.winners[passing[self._passes[passing] >= 2]] = DRAW
+
+        self.plies[passing] += 1
+        self.turn[passing] = 1 - self.turn[passing]
+        self.apply_moves(active[has_move], source[has_move], target[has_move])
+        return int(np.count_nonzero(self.active))
+
+    def apply_moves(self, games: np.ndarray, source: np.ndarray, target: np.ndarray) -> None:
+        """
+        Plays one given move in each of the listed games, then hands the turn over
+        Assumes the moves are legal for the side to move.
+        :param games: Indices of the games to move in
+        :param source: Square moved from in each game
+        :param target: Square moved or attacked to in each game
+        :return: None
+        """
+        attacker = self.ranks[games, source]
+        attacker_side = self.owners[games, source]
+        defender = self.ranks[games, target]
+        is_attack = self.owners[games, target] != EMPTY
+
+        outcome = np.full(len(games), NO_ATTACK, dtype=np.int8)
+        outcome[is_attack] = self.resolve(attacker[is_attack], defender[is_attack])
+
+        # Attacker ends up on the target square when it moves freely or wins
+        advance = (outcome == NO_ATTACK) | (outcome == ATTACKER_WINS)
+        self.hidden[games[advance], target[advance]] = (self.hidden[games[advance], source[advance]]
+                                                        & (outcome[advance] == NO_ATTACK))
+        self.ranks[games[advance], target[advance]] = attacker[advance]
+        self.owners[games[advance], target[advance]] = attacker_side[advance]
+
+        # Defender stays revealed when it holds the square
+        held = outcome == DEFENDER_WINS
+        self.hidden[games[held], target[held]] = False
+
+        # Both gone
+        both = outcome == BOTH_LOSE
+        self.ranks[games[both], target[both]] = EMPTY
+        self.owners[games[both], target[both]] = EMPTY
+        self.hidden[games[both], target[both]] = False
+
+        # The source square is always vacated
+        self.ranks[games, source] = EMPTY
+        self.owners[games, source] = EMPTY
+        self.hidden[games, source] = False
+
+        # Too long without an attack is a draw
+        self._quiet[games] = np.where(is_attack, 0, self._quiet[games] + 1)
+        self.winners[games[self._quiet[games] >= self._no_capture_limit]] = DRAW
+
+        # Capturing the flag ends the game
+        captured_flag = (outcome == ATTACKER_WINS) & (defender == FLAG)
+        self.winners[games[captured_flag]] = attacker_side[captured_flag]
+
+        self.plies[games] += 1
+        self.turn[games] = 1 - self.turn[games]
+
+    def run(self, max_plies: int = 2000) -> np.ndarray:
+        """
+        Steps all games until they finish or reach the ply limit. Unfinished games are scored as draws.
+        :param max_plies: Maximum number of plies per game
+        :return: Array of winners per game
+        """
+        for _ in range(max_plies):
+            if not self.step():
+                break
+        self.winners[self.winners == ONGOING] = DRAW
+        return self.winners
+
@@ -0,0 +1,190 @@
+"""
+Benchmark
+
+Times move generation and AI turns on growing boards to show how the engine
+scales. Every size gets a square board with setup zones of the configured
+share of its rows and an army scaled to fill them, both armies are dealt out
+randomly from a fixed seed. For every size the benchmark times a full
+update_moves pass, heuristic and random AI turns, and batch legal move
+generation. Whole batch games are timed on the configured board:
+
+    python stratego/benchmark.py --sizes 10 20 40 --turns 4 --batch-run 1000
+
+With --allocations every size is played again under tracemalloc, the memory
+allocated by games, turns, their phases and the piece list helpers is reported
+and checked against the configured budgets. Going over a budget fails the run.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from allocations import AllocationProfiler, GAME, budgets
+from batch import BatchSimulator, DRAW
+from config import config
+from stratego_game import Stratego, USER, OPPONENT
+from strategies import make_strategy
+
+
+def setup_zone_rows(size: int) -> int:
+    """
+    Scales the configured setup zone to a board size
+    :param size: Rows of the board
+    :return: Rows of each side's setup zone
+    """
+    return max(1, size * config['board']['setup_rows'] // config['board']['rows'])
+
+
+def random_game(size: int, seed: int) -> Stratego:
+    """
+    Builds a square game with both armies dealt out randomly over their setup zones
+    :param size: Rows and columns of the board
+    :param seed: Master seed of the game
+    :return: Started game
+    """
+    game = Stratego(seed=seed, rows=size, columns=size, setup_rows=setup_zone_rows(size))
+    for side, player in ((USER, game.user), (OPPONENT, game.opponent)):
+        pieces = player.alive_pieces.copy()
+        game.rng.shuffle(pieces)
+        for y in game.setup_zone(side):
+            for x in range(size):
+                piece = pieces.pop()
+                piece.move(x, y)
+                game.board.pieces.append(piece)
+    game.start_game()
+    return game
+
+
+def time_calls(function, repeats: int) -> float:
+    """
+    :return: Mean seconds per call
+    """
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats
+
+
+def benchmark_size(size: int, turns: int, batch_games: int, seed: int) -> dict:
+    """
+    Times the engine on one board size
+    :param size: Rows and columns of the board
+    :param turns: AI turns timed per strategy
+    :param batch_games: Games in the batch legal move timing
+    :param seed: Master seed
+    :return: Timings in milliseconds
+    """
+    game = random_game(size, seed)
+    row = {'size': size, 'pieces': len(game.board.pieces)}
+    row['update_moves'] = time_calls(game.update_moves, 1) * 1000
+
+    for name in ('heuristic', 'random'):
+        # Every strategy starts from the same position
+        game = random_game(size, seed)
+        strategy = make_strategy(name)
+        side = OPPONENT
+        for _ in range(turns):
+            if game.check_game_over() is not None:
+                break
+            game.play_turn(side, strategy)
+            side = USER if side == OPPONENT else OPPONENT
+        row[name] = strategy.mean_time * 1000
+        strategy.close()
+
+    simulator = BatchSimulator(batch_games, size, size, setup_rows=setup_zone_rows(size), seed=seed)
+    simulator.setup_random()
+    row['batch_legal_moves'] = time_calls(simulator.legal_moves, 3) * 1000
+    return row
+
+
+def profile_allocations(size: int, turns: int, seed: int | None) -> tuple[AllocationProfiler, int]:
+    """
+    Measures the memory allocated on one board size, tracing only while it runs
+    :param size: Rows and columns of the board
+    :param turns: AI turns played per strategy
+    :param seed: Master seed
+    :return: (profiler holding the totals, pieces on the board at the start)
+    """
+    profiler = AllocationProfiler()
+    profiler.start()
+    try:
+        for name in ('heuristic', 'random'):
+            game = random_game(size, seed)
+            pieces = len(game.board.pieces)
+            # Every game of the size adds to the same totals
+            game.allocations = profiler
+            strategy = make_strategy(name)
+            side = OPPONENT
+            with profiler.measure(GAME):
+                for _ in range(turns):
+                    if game.check_game_over() is not None:
+                        break
+                    game.play_turn(side, strategy)
+                    side = USER if side == OPPONENT else OPPONENT
+            strategy.close()
+
+            # The helpers every strategy leans on, once over the whole army
+            for player in (game.user, game.opponent):
+                with profiler.measure('alive_pieces'):
+                    player.alive_pieces
+                with profiler.measure('movable_pieces'):
+                    player.movable_pieces
+            placed = [piece for piece in game.board.pieces if piece.x_pos is not None]
+            with profiler.measure('get_moves'):
+                for piece in placed:
+                    game.board.get_moves(piece, update_piece=False)
+            game.reset_pieces()
+    finally:
+        profiler.stop()
+    return profiler, pieces
+
+
+def benchmark_batch(games: int, seed: int | None) -> tuple[float, np.ndarray]:
+    """
+    Plays whole games on the configured board with the batch simulator
+    :param games: Games played at once
+    :param seed: Seed of the simulator
+    :return: (seconds taken, winner of every game)
+    """
+    simulator = BatchSimulator(games, policy='attack', seed=seed)
+    simulator.setup_random()
+    start = time.perf_counter()
+    winners = simulator.run()
+    return time.perf_counter() - start, winners
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time move generation and AI turns on growing boards')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 20, 40], help='board sizes to time')
+    parser.add_argument('--turns', type=int, default=4, help='AI turns timed per strategy')
+    parser.add_argument('--batch-games', type=int, default=256, help='games in the batch move generation timing')
+    parser.add_argument('--batch-run', type=int, default=1000, help='whole batch games to play, 0 to skip')
+    parser.add_argument('--seed', type=int, default=config['seed'])
+    parser.add_argument('--allocations', action='store_true',
+                        help='profile memory allocations of every size and check them against the budgets')
+    args = parser.parse_args()
+
+    print(f'{"board":>7}{"pieces":>8}{"update ms":>12}{"heuristic ms":>14}{"random ms":>11}{"batch ms":>10}')
+    for board_size in args.sizes:
+        timings = benchmark_size(board_size, args.turns, args.batch_games, args.seed)
+        print(f'{board_size:>3}x{board_size:<3}{timings["pieces"]:>8}{timings["update_moves"]:>12.1f}'
+              f'{timings["heuristic"]:>14.1f}{timings["random"]:>11.1f}{timings["batch_legal_moves"]:>10.2f}')
+    print(f'batch timings are for {args.batch_games} games at once')
+
+    if args.batch_run:
+        elapsed, winners = benchmark_batch(args.batch_run, args.seed)
+        print(f'{args.batch_run} batch games in {elapsed:.2f}s ({args.batch_run / elapsed:.0f} games/s), '
+              f'user {np.count_nonzero(winners == USER)}, opponent {np.count_nonzero(winners == OPPONENT)}, '
+              f'draw {np.count_nonzero(winners == DRAW)}')
+
+    if args.allocations:
+        breaches = []
+        for board_size in args.sizes:
+            allocations, board_pieces = profile_allocations(board_size, args.turns, args.seed)
+            print(f'\nallocations on {board_size}x{board_size} with {board_pieces} pieces, KiB')
+            print(allocations.report())
+            breaches += [f'{board_size}x{board_size}: {breach}'
+                         for breach in allocations.over_budget(budgets(), board_pieces)]
+        if breaches:
+            raise Exception('Allocation budgets exceeded:\n' + '\n'.join(breaches))
+        print('\nevery scope is within its allocation budget')
@@ -1,13 +1,57 @@
 import random
+from dataclasses import dataclass
 
+from config import config
+from geometry import Geometry, board_geometry, configured_lakes
 from pieces import Piece
 from player import Player
 
 
+@dataclass(slots=True)
+class MoveDelta:
+    """
+    Undo information recorded by Board.make_move
+
+    Attributes
+    ----------
+    piece : Piece
+        piece that moved
+    source : (int, int)
+        coordinates the piece moved from
+    piece_hidden : bool
+        hidden flag of the piece before the move
+    target : Piece | None
+        piece that was attacked, None for a plain move
+    target_coords : (int, int) | None
+        coordinates of the attacked piece
+    target_hidden : bool
+        hidden flag of the attacked piece before the move
+    moves : list[tuple[Piece, list[tuple[int, int]]]]
+        move lists replaced by the move, with the lists they held before
+    """
+    piece: Piece
+    source: tuple[int, int]
+    piece_hidden: bool
+    target: Piece | None
+    target_coords: tuple[int, int] | None
+    target_hidden: bool
+    moves: list[tuple[Piece, list[tuple[int, int]]]]
+
+
 class Board:
-    def __init__(self, rows: int, columns: int, player0: Player, player1: Player, pieces: list[Piece] = None):
+    def __init__(self, rows: int, columns: int, player0: Player, player1: Player, pieces: list[Piece] = None,
+                 setup_rows: int = None, lakes: frozenset[tuple[int, int]] = None):
         self._rows = rows
         self._columns = columns
+        if setup_rows is None:
+            setup_rows = config['board']['setup_rows']
+        self._setup_rows = setup_rows
+        if lakes is None:
+            lakes = configured_lakes(rows, columns, setup_rows)
+        # Terrain and move tables shared by every board of this shape
+        self._geometry = board_geometry(rows, columns, frozenset(lakes))
+        # Square to piece index, only kept while update_moves runs
+        self._squares = None
         self._row_index = rows - 1
         self._column_index = columns - 1
         self._player0 = player0
@@ -15,6 +59,10 @@ class Board:
         if pieces is None:
             pieces = []
         self._pieces = pieces
+        # Square -> (player0 pieces, player1 pieces) that can move onto it, keyed by piece id
+        self._threats: dict[tuple[int, int], tuple[dict[int, Piece], dict[int, Piece]]] = {}
+        # Piece id -> (piece, side), holding the piece keeps its id from being reused while cached
+        self._piece_sides: dict[int, tuple[Piece, int]] = {}
 
     @property
     def pieces(self) -> list[Piece]:
@@ -32,66 +80,137 @@ class Board:
     def rows(self) -> int:
         return self._rows
 
+    @property
+    def setup_rows(self) -> int:
+        return self._setup_rows
+
+    @property
+    def geometry(self) -> Geometry:
+        return self._geometry
+
+    @property
+    def lakes(self) -> frozenset[tuple[int, int]]:
+        return self._geometry.lakes
+
     def reset_pieces(self) -> None:
         self._pieces = []
+        self._threats = {}
+        self._piece_sides = {}
 
-    def can_move(self, x: int, y: int, piece: Piece) -> bool:
-        # Movement coordinates
-        coords = (x, y)
-        # Individual axis differences
-        # In the case of a valid move one should always be zero
-        x_diff = piece.x_pos - x
-        y_diff = piece.y_pos - y
+    def restore_pieces(self, pieces: list[Piece], moves: list[tuple[Piece, list[tuple[int, int]]]]) -> None:
+        """
+        Puts back pieces and their cached moves saved earlier, without generating any moves
+        :param pieces: Pieces of the board, in their saved order
+        :param moves: (piece, moves) of every piece with a move list to restore
+        :return: None
+        """
+        self._pieces = pieces
+        # Built straight from the saved moves, none of the old moves are left to take out
+        threats = self._threats = {}
+        for piece, piece_moves in moves:
+            side = self._side(piece)
+            key = id(piece)
+            for move in piece_moves:
+                entry = threats.get(move)
+                if entry is None:
+                    entry = threats[move] = ({}, {})
+                entry[side][key] = piece
+            piece.moves = piece_moves
+
+    def _side(self, piece: Piece) -> int:
+        entry = self._piece_sides.get(id(piece))
+        if entry is None or entry[0] is not piece:
+            entry = self._piece_sides[id(piece)] = (piece, 0 if self._player0.is_owner(piece) else 1)
+        return entry[1]
+
+    def set_moves(self, piece: Piece, moves: list[tuple[int, int]]) -> None:
+        """
+        Replaces a piece's move list and keeps the threat map in step with it
+        :param piece: Piece to update
+        :param moves: New list of moves
+        :return: None
+        """
+        side = self._side(piece)
+        key = id(piece)
+        for move in piece.moves:
+            # Moves set before the map was last cleared are not in it
+            entry = self._threats.get(move)
+            if entry is not None:
+                entry[side].pop(key, None)
+        for move in moves:
+            entry = self._threats.get(move)
+            if entry is None:
+                entry = self._threats[move] = ({}, {})
+            entry[side][key] = piece
+        piece.moves = moves
+
+    def threatened_by(self, x: int, y: int, player: Player) -> list[Piece]:
+        """
+        Lists the pieces of a player that can currently move onto a square
+        :param x: x-coordinate of the square
+        :param y: y-coordinate of the square
+        :param player: Player whose pieces to report
+        :return: Pieces that have the square in their moves
+        """
+        entry = self._threats.get((x, y))
+        if entry is None:
+            return []
+        return list(entry[0 if player is self._player0 else 1].values())
+
+    def threatens(self, piece: Piece, x: int, y: int) -> bool:
+        """
+        Checks if a square is in a piece's current moves without walking them
+        """
+        entry = self._threats.get((x, y))
+        return entry is not None and id(piece) in entry[self._side(piece)]
+
+    def update_moves(self) -> None:
+        """
+        Regenerates the moves of every live piece and drops the moves of captured ones
+        :return: None
+        """
+        # Nothing moves during the pass, so squares are looked up in an index instead of scanning every piece
+        self._squares = {piece.coords: piece for piece in reversed(self._pieces)}
+        try:
+            for piece in self._pieces:
+                if piece.is_captured:
+                    if piece.moves:
+                        self.set_moves(piece, [])
+                else:
+                    self.get_moves(piece)
+        finally:
+            self._squares = None
 
+    def can_move(self, x: int, y: int, piece: Piece) -> bool:
         # POSITIONAL CHECKS
 
         # Check case: no movement
-        if piece.coords == coords:
+        if piece.coords == (x, y):
             return False
         # Check case: not a straight line
         elif piece.x_pos != x and piece.y_pos != y:
             return False
+        # Check case: not on board or a lake
+        elif not self._geometry.is_open(x, y):
+            return False
         # Check case: occupied by friendly piece
         elif self.are_friendly(piece, self.is_occupied(x, y)):
             return False
-        # Check case: not on board
-        elif min(coords) < 0 or max(coords) > self._rows:
+        # Check case: move limit 0
+        elif piece.move_limit == 0:
             return False
 
-        # MOVE LIMIT CHECKS
+        # PATH CHECKS
 
-        # Check case: outside move limit
-        # Excludes pieces with no move limit
-        if piece.move_limit:
-            if abs(x_diff) > piece.move_limit or abs(y_diff) > piece.move_limit:
+        # Walk the ray towards the target, it must come up before the move limit, a lake or a piece in the way
+        for step, square in enumerate(self._geometry.ray(piece.coords, x, y), 1):
+            if piece.move_limit and step > piece.move_limit:
                 return False
-        # Check case: move limit 0
-        elif piece.move_limit == 0:
-            return False
-        # Check case: piece(s) in the way
-        else:
-            # Put coordinates into range-friendly order
-            x_range = sorted((x, piece.x_pos))
-            y_range = sorted((y, piece.y_pos))
-
-            x_range[0] = x_range[0] + 1
-            y_range[0] = y_range[0] + 1
-
-            if x_diff:
-                # Iterate over pieces in between x-axis coords
-                for i in range(*x_range):
-                    if other := self.is_occupied(i, y):
-                        if other is not piece:
-                            return False
-            elif y_diff:
-                # Iterate over pieces in between y-axis coords
-                for i in range(*y_range):
-                    if other := self.is_occupied(x, i):
-                        if other is not piece:
-                            return False
-
-        # All checks passed
-        return True
+            if square == (x, y):
+                return True
+            if self.is_occupied(*square):
+                return False
+        return False
 
     def is_occupied(self, x: int, y: int) -> Piece | None:
         """
@@ -100,6 +219,8 @@ class Board:
         :param y: y-coordinate to check
         :return: Returns Piece if present, false otherwise
         """
+        if self._squares is not None:
+            return self._squares.get((x, y))
         for piece in self._pieces:
             if (x, y) == piece.coords:
                 return piece
@@ -107,17 +228,76 @@ class Board:
 
     def get_moves(self, piece: Piece, update_piece=True) -> list[tuple[int, int]]:
         moves = []
-        # Try all positions on board
-        for i in range(self._columns):
-            for j in range(self._rows):
-                if self.can_move(i, j, piece):
-                    moves.append((i, j))
+        if piece.move_limit != 0:
+            # Follow each ray until the move limit, a lake or the first piece, which can be attacked if it's an enemy
+            for ray in self._geometry.rays[piece.coords]:
+                for square in ray[:piece.move_limit]:
+                    other = self.is_occupied(*square)
+                    if other is None:
+                        moves.append(square)
+                        continue
+                    if not self.are_friendly(piece, other):
+                        moves.append(square)
+                    break
+            # Same order as a scan of the whole board
+            moves.sort()
 
         # Handle reporting
         if update_piece:
-            piece.moves = moves
+            self.set_moves(piece, moves)
         return moves
 
+    def make_move(self, piece: Piece, x: int, y: int, update_moves: bool = True) -> MoveDelta:
+        """
+        Plays a move that can be taken back with unmake_move.
+        Assumes that the move is valid. Only the moving piece, the attacked piece and, if requested, the move lists
+        of pieces sharing a row or column with either square are touched.
+        :param piece: Piece to move
+        :param x: x-coordinate to move to
+        :param y: y-coordinate to move to
+        :param update_moves: Whether to refresh the move lists affected by the move
+        :return: Delta needed to undo the move
+        """
+        source = piece.coords
+        target = self.is_occupied(x, y)
+        delta = MoveDelta(piece, source, piece.is_hidden, target, None, False, [])
+        if target is None:
+            piece.move(x, y)
+        else:
+            delta.target_coords = target.coords
+            delta.target_hidden = target.is_hidden
+            piece.attack(target)
+
+        if update_moves:
+            # Only pieces in line with the two squares can gain or lose moves
+            for other in self._pieces:
+                if other is piece or other is target or other.x_pos in (source[0], x) or other.y_pos in (source[1], y):
+                    delta.moves.append((other, other.moves))
+                    if other.is_captured:
+                        self.set_moves(other, [])
+                    else:
+                        self.get_moves(other)
+        return delta
+
+    def unmake_move(self, delta: MoveDelta) -> None:
+        """
+        Restores the board to the state before a make_move
+        :param delta: Delta returned by make_move
+        :return: None
+        """
+        piece = delta.piece
+        piece.move(*delta.source)
+        piece.is_hidden = delta.piece_hidden
+        piece.is_captured = False
+
+        if delta.target is not None:
+            delta.target.move(*delta.target_coords)
+            delta.target.is_hidden = delta.target_hidden
+            delta.target.is_captured = False
+
+        for other, moves in delta.moves:
+            self.set_moves(other, moves)
+
     def are_friendly(self, piece0: Piece, piece1: Piece) -> bool:
         """
         Checks if two given pieces have the same owner
@@ -138,8 +318,8 @@ class Board:
             return not self._player0.is_owner(piece0) != self._player0.is_owner(piece1)
 
     def add_piece(self, x: int, y: int, piece: Piece) -> bool:
-        if y >= 4:
-            # Don't allow user to place pieces on the 5th rank
+        if y >= self._setup_rows:
+            # Don't allow user to place pieces outside their setup zone
             return False
         for board_piece in self._pieces:
             if board_piece.coords == (x, y):
@@ -149,11 +329,20 @@ class Board:
         self._pieces.append(piece)
         return True
 
-    def add_opponent_pieces(self, player: Player):
+    def add_user_pieces(self, player: Player, rng: random.Random):
+        pieces = player.alive_pieces.copy()
+        rng.shuffle(pieces)
+        for x in range(self._columns):
+            for y in range(self._setup_rows):
+                piece = pieces.pop()
+                piece.move(x, y)
+                self._pieces.append(piece)
+
+    def add_opponent_pieces(self, player: Player, rng: random.Random):
         pieces = player.alive_pieces.copy()
-        random.shuffle(pieces)
-        for i in range(self._rows):
-            for j in range(6, self._columns):
+        rng.shuffle(pieces)
+        for x in range(self._columns):
+            for y in range(self._rows - self._setup_rows, self._rows):
                 piece = pieces.pop()
-                piece.move(i, j)
+                piece.move(x, y)
                 self._pieces.append(piece)
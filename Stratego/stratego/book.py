@@ -0,0 +1,217 @@
+"""
+Book
+
+Opening book of moves for positions that come up again and again. The first
+moves after two presets meet are always decided from the same few positions,
+so the book maps a hash of the position as the side to move sees it to the
+move a strategy picked there. Books are filled offline by self-play, hold a
+bounded number of entries and drop the least recently used one when full.
+
+Book files are a 16 byte header followed by fixed-width entries, oldest first:
+
+    python stratego/book.py --presets 1 2 3 --games 4
+"""
+import argparse
+import functools
+import hashlib
+import os
+import struct
+from collections import OrderedDict
+
+from config import config
+from observation import OPPONENT, USER
+
+MAGIC = b'STRGBOOK'
+VERSION = 1
+
+# magic, version, columns, entry count
+HEADER = struct.Struct('<8sHHI')
+# position hash, source square, target square
+ENTRY = struct.Struct('<QHH')
+
+# Rank code of pieces the side to move has not seen
+UNKNOWN = 255
+
+
+def position_key(game, side: int) -> int:
+    """
+    Hashes the position as a side sees it: its own pieces, the enemy pieces it has seen and where the rest stand
+    :param game: Game to hash
+    :param side: Side to move
+    :return: 64 bit position hash, stable across processes and runs
+    """
+    observation = game.observe(side)
+    squares = []
+    for mine, army in ((1, observation.own), (0, observation.enemy)):
+        for piece in army:
+            rank = UNKNOWN if piece.strength is None else piece.strength
+            squares.append((piece.y_pos * game.board.columns + piece.x_pos, mine, rank))
+    squares.sort()
+
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(bytes((side,)))
+    for square, mine, rank in squares:
+        digest.update(struct.pack('<HBB', square, mine, rank))
+    return int.from_bytes(digest.digest(), 'little')
+
+
+class OpeningBook:
+    """
+    Bounded position to move map with least recently used eviction
+
+    Attributes
+    ----------
+    max_entries : int
+        most positions kept, the least recently used one is dropped beyond that
+    columns : int
+        board columns, used to turn squares back into coordinates
+    hits : int
+        lookups that found a move
+    misses : int
+        lookups that found nothing
+    """
+
+    def __init__(self, max_entries: int, columns: int):
+        self.max_entries = max_entries
+        self.columns = columns
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, tuple[int, int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._entries
+
+    def _coords(self, square: int) -> tuple[int, int]:
+        y, x = divmod(square, self.columns)
+        return x, y
+
+    def lookup(self, key: int) -> tuple[tuple[int, int], tuple[int, int]] | None:
+        """
+        Finds the move stored for a position and marks it as recently used
+        :param key: Position hash
+        :return: (square moved from, square moved to), None if the position is not in the book
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return self._coords(entry[0]), self._coords(entry[1])
+
+    def add(self, key: int, source: tuple[int, int], target: tuple[int, int]) -> None:
+        """
+        Stores the move for a position, evicting the least recently used positions if the book is full
+        :param key: Position hash
+        :param source: Square moved from
+        :param target: Square moved to
+        :return: None
+        """
+        self._entries[key] = (source[1] * self.columns + source[0], target[1] * self.columns + target[0])
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def save(self, name: str) -> None:
+        directory = os.path.dirname(name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(name, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, self.columns, len(self._entries)))
+            for key, (source, target) in self._entries.items():
+                file.write(ENTRY.pack(key, source, target))
+
+    @classmethod
+    def load(cls, name: str, max_entries: int, columns: int | None = None):
+        """
+        Reads a book file, keeping the most recently used entries if it holds more than max_entries
+        :param name: Path of the book file
+        :param max_entries: Most positions kept
+        :param columns: Columns of the board the book will be used on, None to accept any
+        :return: Opening book
+        :raises:
+            :exception: Raised if the file is not a book file or was filled on a board with other columns
+        """
+        with open(name, 'rb') as file:
+            data = file.read()
+        magic, version, book_columns, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise Exception(f'{name} is not a version {VERSION} opening book')
+        if columns is not None and columns != book_columns:
+            # Squares would turn into the wrong coordinates
+            raise Exception(f'{name} was filled on a board with {book_columns} columns, not {columns}')
+
+        book = cls(max_entries, book_columns)
+        for key, source, target in ENTRY.iter_unpack(data[HEADER.size:HEADER.size + count * ENTRY.size]):
+            book._entries[key] = (source, target)
+        while len(book._entries) > max_entries:
+            book._entries.popitem(last=False)
+        return book
+
+
+@functools.cache
+def open_book() -> OpeningBook:
+    """
+    Opens the configured book file once per process, or starts an empty book if there is none yet
+    """
+    settings = config['book']
+    if os.path.exists(settings['data_file']):
+        return OpeningBook.load(settings['data_file'], settings['max_entries'], config['board']['columns'])
+    return OpeningBook(settings['max_entries'], config['board']['columns'])
+
+
+def record_self_play(book: OpeningBook, game, strategies: dict, plies: int) -> None:
+    """
+    Plays the opening of a game with both sides' strategies and stores every move they pick
+    :param book: Book to fill
+    :param game: Game with both setups on the board
+    :param strategies: Strategy playing each side
+    :param plies: Moves to play and store
+    :return: None
+    """
+    game.start_game()
+    side = USER
+    for _ in range(plies):
+        if game.check_game_over() is not None:
+            break
+        game.update_moves()
+        key = position_key(game, side)
+        report = game.play_turn(side, strategies[side])
+        if report.target is not None:
+            book.add(key, report.source, report.target)
+        side = OPPONENT if side == USER else USER
+
+
+if __name__ == "__main__":
+    # Imported here, the game imports this module through its strategies
+    from stratego_game import Stratego
+    from strategies import STRATEGIES, make_strategy
+
+    settings = config['book']
+    parser = argparse.ArgumentParser(description='Fill the opening book by self-play')
+    parser.add_argument('--presets', type=int, nargs='+', help='preset ids, defaults to every preset')
+    parser.add_argument('--games', type=int, default=1, help='games per preset pairing')
+    parser.add_argument('--plies', type=int, default=settings['plies'])
+    parser.add_argument('--strategy', default=config['strategies']['opponent'], choices=sorted(STRATEGIES))
+    args = parser.parse_args()
+
+    opening_book = open_book()
+    builder = Stratego()
+    preset_ids = args.presets if args.presets else sorted(builder.presets.keys())
+    players = {USER: make_strategy(args.strategy), OPPONENT: make_strategy(args.strategy)}
+    try:
+        for user_preset in preset_ids:
+            for opponent_preset in preset_ids:
+                for number in range(args.games):
+                    builder.reset_pieces()
+                    builder.apply_user_preset(user_preset)
+                    builder.apply_opponent_preset(opponent_preset)
+                    record_self_play(opening_book, builder, players, args.plies)
+                print(f'{user_preset} vs {opponent_preset}: {len(opening_book)} positions')
+    finally:
+        for player in players.values():
+            player.close()
+    opening_book.save(settings['data_file'])
@@ -5,11 +5,11 @@ with open("config.yml", "r") as yml_file:
 
 # BOARD CHECKS
 
-# Make sure we have a square
-assert (config['board']['rows'] == config['board']['columns'])
-
 # Don't allow board size and row/column count that don't evenly divide
-assert (config['board']['size'] % config['board']['rows'] == 0)
+assert (config['board']['size'] % max(config['board']['rows'], config['board']['columns']) == 0)
+
+# Both setup zones have to fit on the board
+assert (2 * config['board']['setup_rows'] <= config['board']['rows'])
 
 
 # WINDOW CHECKS
@@ -0,0 +1,386 @@
+"""
+Dataset
+
+Self-play training data for learned strategies. Every position a strategy
+moves from is encoded as fixed-size planes from the point of view of the side
+to move, the board turned so that side's army is always at the bottom:
+
+    own ranks       rank + 1 of every own piece, 0 for any other square
+    enemy ranks     rank + 1 of every enemy piece that has been seen
+    hidden          enemy pieces whose rank has not been seen
+    history         two planes per earlier ply, most recent first: the squares
+                    moved from and the squares moved to
+
+Each position is labelled with the move chosen there and the final outcome
+for the side to move: 1 for a win, -1 for a loss, 0 for a draw. The labels of
+a game are only known once it ends, so positions wait in a buffer of one game
+before they are written.
+
+Records stream into shards of a bounded size. Rank planes are packed two
+squares to a byte and the binary planes a bit per square, so a record on the
+standard board takes a few hundred bytes. Shards are plain .npy files of
+packed records and are memory-mapped back for training, with a manifest
+listing them. Exports only ever hold one shard and one game in memory however
+many positions they write, and a later export into the same directory adds
+shards after the ones already there:
+
+    python stratego/dataset.py --games 1000 --strategy heuristic
+"""
+import argparse
+import json
+import os
+from collections import deque
+
+import numpy as np
+
+from batch import DRAW
+from config import config
+from observation import OPPONENT, USER
+
+VERSION = 1
+MANIFEST = 'manifest.json'
+
+# Planes
+OWN_RANKS = 0
+ENEMY_RANKS = 1
+HIDDEN = 2
+HISTORY = 3
+
+# Outcome labels
+WON = 1
+DRAWN = 0
+LOST = -1
+
+
+def plane_count(history: int) -> int:
+    return HISTORY + 2 * history
+
+
+def record_dtype(squares: int, history: int) -> np.dtype:
+    """
+    Packed record of one position
+    :param squares: Squares on the board
+    :param history: Earlier plies in the history planes
+    :return: Structured dtype of a record
+    """
+    bits = (squares + 7) // 8
+    return np.dtype([
+        ('own', 'u1', ((squares + 1) // 2,)),
+        ('enemy', 'u1', ((squares + 1) // 2,)),
+        ('hidden', 'u1', (bits,)),
+        ('history', 'u1', (2 * history * bits,)),
+        ('game', '<u4'),
+        ('ply', '<u4'),
+        ('side', 'u1'),
+        ('source', '<u2'),
+        ('target', '<u2'),
+        ('outcome', 'i1'),
+    ])
+
+
+def pack_ranks(ranks: np.ndarray) -> np.ndarray:
+    # Two squares to a byte, the first in the high nibble
+    if ranks.shape[-1] % 2:
+        ranks = np.concatenate((ranks, np.zeros(ranks.shape[:-1] + (1,), np.uint8)), axis=-1)
+    return (ranks[..., 0::2] << 4) | ranks[..., 1::2]
+
+
+def unpack_ranks(packed: np.ndarray, squares: int) -> np.ndarray:
+    ranks = np.empty(packed.shape[:-1] + (2 * packed.shape[-1],), np.uint8)
+    ranks[..., 0::2] = packed >> 4
+    ranks[..., 1::2] = packed & 0xF
+    return ranks[..., :squares]
+
+
+class PositionEncoder:
+    """
+    Encodes positions of games on one board shape
+
+    Attributes
+    ----------
+    rows : int
+        board rows
+    columns : int
+        board columns
+    history : int
+        earlier plies in the history planes
+    dtype : np.dtype
+        dtype of the records
+    """
+
+    def __init__(self, rows: int, columns: int, history: int):
+        self.rows = rows
+        self.columns = columns
+        self.history = history
+        self.dtype = record_dtype(rows * columns, history)
+        self._bits = (rows * columns + 7) // 8
+
+    def square(self, coords: tuple[int, int], side: int) -> int:
+        """
+        Index of a square as a side sees the board, with its own army at the bottom
+        """
+        x, y = coords
+        if side == OPPONENT:
+            y = self.rows - 1 - y
+        return y * self.columns + x
+
+    def encode(self, game, side: int, moves: deque, record: np.ndarray) -> None:
+        """
+        Fills the planes of a record with a position as a side sees it
+        :param game: Game to encode
+        :param side: Side to move
+        :param moves: (source, target) of the earlier plies, most recent first
+        :param record: Record to fill
+        :return: None
+        """
+        squares = self.rows * self.columns
+        own_ranks = np.zeros(squares, np.uint8)
+        enemy_ranks = np.zeros(squares, np.uint8)
+        hidden = np.zeros(squares, bool)
+        own, enemy = game.players(side)
+        for piece in own.alive_pieces:
+            if piece.x_pos is not None:
+                own_ranks[self.square(piece.coords, side)] = piece.strength + 1
+        for piece in enemy.alive_pieces:
+            if piece.x_pos is None:
+                continue
+            if piece.is_hidden:
+                hidden[self.square(piece.coords, side)] = True
+            else:
+                enemy_ranks[self.square(piece.coords, side)] = piece.strength + 1
+
+        history = np.zeros((2 * self.history, squares), bool)
+        for ply, (source, target) in enumerate(moves):
+            history[2 * ply, self.square(source, side)] = True
+            history[2 * ply + 1, self.square(target, side)] = True
+
+        record['own'] = pack_ranks(own_ranks)
+        record['enemy'] = pack_ranks(enemy_ranks)
+        record['hidden'] = np.packbits(hidden)
+        record['history'] = np.packbits(history, axis=1).reshape(-1)
+        record['side'] = side
+        record['ply'] = game.ply
+
+    def planes(self, records: np.ndarray) -> np.ndarray:
+        """
+        Unpacks the planes of records
+        :param records: Records, possibly memory-mapped
+        :return: Array of shape (records, planes, rows, columns)
+        """
+        squares = self.rows * self.columns
+        count = len(records)
+        planes = np.empty((count, plane_count(self.history), squares), np.uint8)
+        planes[:, OWN_RANKS] = unpack_ranks(records['own'], squares)
+        planes[:, ENEMY_RANKS] = unpack_ranks(records['enemy'], squares)
+        planes[:, HIDDEN] = np.unpackbits(records['hidden'], axis=1)[:, :squares]
+        history = records['history'].reshape(count, 2 * self.history, self._bits)
+        planes[:, HISTORY:] = np.unpackbits(history, axis=2)[:, :, :squares]
+        return planes.reshape(count, plane_count(self.history), self.rows, self.columns)
+
+
+class ShardWriter:
+    """
+    Streams records into size-bounded shards of a dataset directory
+
+    Attributes
+    ----------
+    directory : str
+        dataset directory, holding the shards and their manifest
+    encoder : PositionEncoder
+        encoder of the records
+    capacity : int
+        records per shard
+    positions : int
+        records written so far, including earlier exports into the directory
+    games : int
+        games written so far, including earlier exports into the directory
+    """
+
+    def __init__(self, directory: str, encoder: PositionEncoder, shard_bytes: int):
+        self.directory = directory
+        self.encoder = encoder
+        self.capacity = max(1, shard_bytes // encoder.dtype.itemsize)
+        self._buffer = np.zeros(self.capacity, encoder.dtype)
+        self._count = 0
+        os.makedirs(directory, exist_ok=True)
+
+        self._manifest = {'version': VERSION, 'rows': encoder.rows, 'columns': encoder.columns,
+                          'history': encoder.history, 'games': 0, 'shards': []}
+        name = os.path.join(directory, MANIFEST)
+        if os.path.exists(name):
+            with open(name, 'r') as file:
+                manifest = json.load(file)
+            shape = manifest.get('version'), manifest['rows'], manifest['columns'], manifest['history']
+            if shape != (VERSION, encoder.rows, encoder.columns, encoder.history):
+                raise Exception(f'{directory} holds version {shape[0]} records of {shape[1]}x{shape[2]} boards '
+                                f'with {shape[3]} history plies')
+            self._manifest = manifest
+        self.positions = sum(shard['positions'] for shard in self._manifest['shards'])
+        self.games = self._manifest['games']
+
+    def write_game(self, records: np.ndarray) -> None:
+        """
+        Appends the labelled records of one game
+        :param records: Records of the game
+        :return: None
+        """
+        records['game'] = self.games
+        self.games += 1
+        start = 0
+        while start < len(records):
+            taken = min(len(records) - start, self.capacity - self._count)
+            self._buffer[self._count:self._count + taken] = records[start:start + taken]
+            self._count += taken
+            start += taken
+            if self._count == self.capacity:
+                self.flush()
+        self.positions += len(records)
+
+    def flush(self) -> None:
+        """
+        Writes the records waiting in the buffer out as a shard
+        :return: None
+        """
+        if self._count:
+            file_name = f'shard-{len(self._manifest["shards"]):05d}.npy'
+            partial = os.path.join(self.directory, file_name + '.tmp')
+            with open(partial, 'wb') as file:
+                np.save(file, self._buffer[:self._count])
+            os.replace(partial, os.path.join(self.directory, file_name))
+            self._manifest['shards'].append({'file': file_name, 'positions': self._count})
+            self._count = 0
+        self._manifest['games'] = self.games
+        # The manifest only ever lists whole shards
+        partial = os.path.join(self.directory, MANIFEST + '.tmp')
+        with open(partial, 'w') as file:
+            json.dump(self._manifest, file, indent=1)
+        os.replace(partial, os.path.join(self.directory, MANIFEST))
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class DatasetReader:
+    """
+    Memory-mapped reader over the shards of a dataset directory
+
+    Attributes
+    ----------
+    encoder : PositionEncoder
+        encoder of the records, unpacks their planes
+    shards : list[np.ndarray]
+        records of every shard, backed by memory maps
+    """
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, MANIFEST), 'r') as file:
+            manifest = json.load(file)
+        if manifest.get('version') != VERSION:
+            raise Exception(f'{directory} is not a version {VERSION} dataset')
+        self.encoder = PositionEncoder(manifest['rows'], manifest['columns'], manifest['history'])
+        self.games = manifest['games']
+        self.shards = [np.load(os.path.join(directory, shard['file']), mmap_mode='r')
+                       for shard in manifest['shards']]
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self.shards)
+
+    def batches(self, size: int):
+        """
+        Walks every record in batches, only the batch being unpacked is read into memory
+        :param size: Records per batch, the last batch of a shard may be smaller
+        :return: Generator of (planes, source, target, outcome) arrays
+        """
+        for shard in self.shards:
+            for start in range(0, len(shard), size):
+                records = shard[start:start + size]
+                yield (self.encoder.planes(records), np.asarray(records['source']), np.asarray(records['target']),
+                       np.asarray(records['outcome']))
+
+
+def outcome_for(side: int, winner: int) -> int:
+    if winner == side:
+        return WON
+    if winner in (USER, OPPONENT):
+        return LOST
+    return DRAWN
+
+
+def export_game(writer: ShardWriter, game, strategies: dict, max_plies: int | None = None) -> int:
+    """
+    Plays a game to the end with both sides' strategies and writes every position a side moved from
+    :param writer: Writer of the dataset
+    :param game: Game with both setups on the board
+    :param strategies: Strategy playing each side
+    :param max_plies: Moves after which the game is called a draw, None to only stop on the game rules
+    :return: Winner of the game
+    """
+    encoder = writer.encoder
+    game.start_game()
+    moves = deque(maxlen=encoder.history)
+    # Records wait here until the outcome of the game labels them
+    records = []
+    side = USER
+    while (result := game.check_game_over()) is None:
+        if max_plies is not None and game.ply >= max_plies:
+            result = DRAW, None
+            break
+        record = np.zeros((), encoder.dtype)
+        encoder.encode(game, side, moves, record)
+        report = game.play_turn(side, strategies[side])
+        if report.target is not None:
+            record['source'] = encoder.square(report.source, side)
+            record['target'] = encoder.square(report.target, side)
+            records.append(record)
+            moves.appendleft((report.source, report.target))
+        side = OPPONENT if side == USER else USER
+
+    winner = result[0]
+    game_records = np.array(records, encoder.dtype)
+    for side in (USER, OPPONENT):
+        game_records['outcome'][game_records['side'] == side] = outcome_for(side, winner)
+    writer.write_game(game_records)
+    return winner
+
+
+if __name__ == "__main__":
+    # Imported here, the game imports strategies that import from modules like this one
+    from stratego_game import Stratego
+    from strategies import STRATEGIES, make_strategy
+
+    settings = config['dataset']
+    parser = argparse.ArgumentParser(description='Export self-play positions as training data')
+    parser.add_argument('--games', type=int, default=100, help='games to play')
+    parser.add_argument('--strategy', default=config['strategies']['opponent'], choices=sorted(STRATEGIES))
+    parser.add_argument('--max-plies', type=int, default=settings['max_plies'],
+                        help='moves after which a game is called a draw')
+    parser.add_argument('--directory', default=settings['directory'])
+    parser.add_argument('--seed', type=int, default=config['seed'])
+    args = parser.parse_args()
+
+    builder = Stratego(seed=args.seed)
+    players = {USER: make_strategy(args.strategy), OPPONENT: make_strategy(args.strategy)}
+    winners = {USER: 0, OPPONENT: 0, DRAW: 0}
+    with ShardWriter(args.directory, PositionEncoder(builder.board.rows, builder.board.columns, settings['history']),
+                     settings['shard_bytes']) as dataset:
+        try:
+            for number in range(args.games):
+                builder.reset_pieces()
+                if len(builder.presets) == 0:
+                    builder.board.add_user_pieces(builder.user, builder.rng)
+                    builder.board.add_opponent_pieces(builder.opponent, builder.rng)
+                else:
+                    builder.apply_user_preset(builder.rng.choice(list(builder.presets.keys())))
+                    builder.apply_opponent_preset(builder.rng.choice(list(builder.presets.keys())))
+                winners[export_game(dataset, builder, players, args.max_plies)] += 1
+        finally:
+            for player in players.values():
+                player.close()
+    print(f'{args.games} games, {dataset.positions} positions in {args.directory}, '
+          f'user {winners[USER]}, opponent {winners[OPPONENT]}, draw {winners[DRAW]}')
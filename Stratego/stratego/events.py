@@ -0,0 +1,164 @@
+"""
+Events
+
+Typed publish/subscribe bus. A subscriber registers a callable for an event
+class and is called with every event of exactly that class. Subscribers are
+held by weak reference, so an object that goes away drops out of the bus by
+itself instead of being kept alive by it. Subscribing and unsubscribing are a
+single dict insert or removal.
+
+Every game publishes what happens on its board: moves, attacks, captures,
+reveals and the end of the game. The window publishes input on the bus of
+game_object. The UI, recording, remote clients, metrics and the AI hook in
+there instead of polling the game every frame.
+"""
+import weakref
+from dataclasses import dataclass
+from typing import Callable
+
+
+# INPUT EVENTS
+@dataclass(frozen=True, slots=True)
+class KeyPress:
+    symbol: int
+    modifiers: int
+
+
+@dataclass(frozen=True, slots=True)
+class MousePress:
+    x: int
+    y: int
+    button: int
+    modifiers: int
+
+
+@dataclass(frozen=True, slots=True)
+class MouseMotion:
+    x: int
+    y: int
+    dx: int
+    dy: int
+
+
+# GAME EVENTS
+@dataclass(frozen=True, slots=True)
+class PieceMoved:
+    """
+    A piece moved onto an empty square
+    """
+    game: object
+    side: int
+    piece: object
+    source: tuple[int, int]
+    target: tuple[int, int]
+
+
+@dataclass(frozen=True, slots=True)
+class PieceAttacked:
+    """
+    A piece attacked an enemy piece, published after the attack is resolved
+    """
+    game: object
+    side: int
+    attacker: object
+    defender: object
+    source: tuple[int, int]
+    target: tuple[int, int]
+    outcome: int
+
+
+@dataclass(frozen=True, slots=True)
+class PieceCaptured:
+    """
+    A piece was taken off the board, side is the side that lost it and square where it stood
+    """
+    game: object
+    side: int
+    piece: object
+    square: tuple[int, int]
+
+
+@dataclass(frozen=True, slots=True)
+class PieceRevealed:
+    """
+    The enemy saw the rank of a piece for the first time, side is the side owning it
+    """
+    game: object
+    side: int
+    piece: object
+
+
+@dataclass(frozen=True, slots=True)
+class GameOver:
+    game: object
+    winner: int
+    reason: int
+
+
+@dataclass(frozen=True, slots=True)
+class AllocationsMeasured:
+    """
+    A game that was profiled is over, stats are the allocation totals of its scopes by name
+    """
+    game: object
+    stats: dict
+
+
+def subscriber_key(callback: Callable) -> tuple[int, object] | int:
+    # Bound methods are made anew on every attribute access, they are told apart by object and function
+    if hasattr(callback, '__func__'):
+        return id(callback.__self__), callback.__func__
+    return id(callback)
+
+
+class EventBus:
+    """
+    Weakly referenced subscribers by event class.
+    Functions are only held weakly too, keep a reference to a function subscribed on its own.
+    """
+
+    def __init__(self):
+        self._subscribers: dict[type, dict[object, weakref.ref]] = {}
+
+    def subscribe(self, event_type: type, callback: Callable) -> None:
+        """
+        Calls a subscriber with every event of a class, until it is unsubscribed or garbage collected
+        :param event_type: Event class
+        :param callback: Function or bound method taking the event
+        :return: None
+        """
+        key = subscriber_key(callback)
+        subscribers = self._subscribers.setdefault(event_type, {})
+
+        def drop(reference: weakref.ref) -> None:
+            # The key may have been taken by a new subscriber since
+            if subscribers.get(key) is reference:
+                del subscribers[key]
+
+        if hasattr(callback, '__func__'):
+            subscribers[key] = weakref.WeakMethod(callback, drop)
+        else:
+            subscribers[key] = weakref.ref(callback, drop)
+
+    def unsubscribe(self, event_type: type, callback: Callable) -> None:
+        subscribers = self._subscribers.get(event_type)
+        if subscribers is not None:
+            subscribers.pop(subscriber_key(callback), None)
+
+    def has_subscribers(self, event_type: type) -> bool:
+        return bool(self._subscribers.get(event_type))
+
+    def publish(self, event) -> None:
+        """
+        Calls every subscriber of the event's class, in the order they subscribed
+        :param event: Event to publish
+        :return: None
+        """
+        subscribers = self._subscribers.get(type(event))
+        if not subscribers:
+            return
+        # Subscribers may unsubscribe while being called
+        for reference in list(subscribers.values()):
+            callback = reference()
+            if callback is not None:
+                callback(event)
@@ -2,6 +2,8 @@ from dataclasses import dataclass
 from enum import Enum
 from typing import List
 
+from events import EventBus, KeyPress, MouseMotion, MousePress
+
 
 class CallBack(Enum):
     KEY_PRESS = 0
@@ -9,24 +11,40 @@ class CallBack(Enum):
     MOUSE_MOTION = 2
 
 
-key_press = []
-mouse_press = []
-mouse_motion = []
+# Input event of every callback
+CALLBACK_EVENTS = {
+    CallBack.KEY_PRESS: KeyPress,
+    CallBack.MOUSE_PRESS: MousePress,
+    CallBack.MOUSE_MOTION: MouseMotion,
+}
+
+# Input of the window, published by the views. Objects are only held weakly, they drop out once they are gone
+input_events = EventBus()
 
 
 @dataclass
 class GameObject:
     def __init__(self, callbacks: List[CallBack]):
         for callback in callbacks:
-            match callback:
-                case CallBack.KEY_PRESS:
-                    key_press.append(self)
-                case CallBack.MOUSE_PRESS:
-                    mouse_press.append(self)
-                case CallBack.MOUSE_MOTION:
-                    mouse_motion.append(self)
-                case _:
-                    raise Exception(f'Unknown enum callback {callback}')
+            if callback not in CALLBACK_EVENTS:
+                raise Exception(f'Unknown enum callback {callback}')
+            input_events.subscribe(CALLBACK_EVENTS[callback], self.handle_input)
+
+    def unsubscribe(self, callbacks: List[CallBack] = None) -> None:
+        """
+        Stops receiving input, for every callback if none are given
+        """
+        for callback in CALLBACK_EVENTS if callbacks is None else callbacks:
+            input_events.unsubscribe(CALLBACK_EVENTS[callback], self.handle_input)
+
+    def handle_input(self, event) -> None:
+        match event:
+            case KeyPress(symbol, modifiers):
+                self.on_key_press(symbol, modifiers)
+            case MousePress(x, y, button, modifiers):
+                self.on_mouse_press(x, y, button, modifiers)
+            case MouseMotion(x, y, dx, dy):
+                self.on_mouse_motion(x, y, dx, dy)
 
     def setup(self):
         pass
@@ -0,0 +1,127 @@
+"""
+Geometry
+
+Terrain and precomputed move tables for a board shape. Lakes are impassable
+squares, by default the two classic 2x2 lakes in the middle of the board,
+scaled to the board size. For every open square the tables hold its open
+neighbors and the rays of open squares running out from it in each direction,
+cut short by the board edge or a lake. Tables are built once per board shape
+and shared by every board of that shape, so move generation only has to look
+up which squares on a ray are occupied.
+"""
+import functools
+
+from config import config
+
+# Directions: up, down, left, right as (dx, dy)
+DIRECTIONS = ((0, 1), (0, -1), (-1, 0), (1, 0))
+
+# Columns of the classic lakes on a 10 column board
+CLASSIC_LAKE_COLUMNS = (2, 3, 6, 7)
+
+
+class Geometry:
+    """
+    Terrain and move tables of one board shape
+
+    Attributes
+    ----------
+    rows : int
+        rows of the board
+    columns : int
+        columns of the board
+    lakes : frozenset[tuple[int, int]]
+        impassable squares
+    neighbors : dict[tuple[int, int], tuple[tuple[int, int], ...]]
+        open squares next to every open square, in DIRECTIONS order
+    rays : dict[tuple[int, int], tuple[tuple[tuple[int, int], ...], ...]]
+        for every open square, the open squares in each direction up to the edge or the first lake
+    """
+
+    def __init__(self, rows: int, columns: int, lakes: frozenset[tuple[int, int]]):
+        self.rows = rows
+        self.columns = columns
+        self.lakes = lakes
+        self.neighbors = {}
+        self.rays = {}
+        for x in range(columns):
+            for y in range(rows):
+                if (x, y) in lakes:
+                    continue
+                rays = []
+                for dx, dy in DIRECTIONS:
+                    ray = []
+                    tx, ty = x + dx, y + dy
+                    while self._on_board(tx, ty) and (tx, ty) not in lakes:
+                        ray.append((tx, ty))
+                        tx, ty = tx + dx, ty + dy
+                    rays.append(tuple(ray))
+                self.rays[(x, y)] = tuple(rays)
+                self.neighbors[(x, y)] = tuple(ray[0] for ray in rays if ray)
+
+    def _on_board(self, x: int, y: int) -> bool:
+        return 0 <= x < self.columns and 0 <= y < self.rows
+
+    def is_open(self, x: int, y: int) -> bool:
+        """
+        Checks that a square is on the board and not a lake
+        """
+        return (x, y) in self.rays
+
+    def ray(self, source: tuple[int, int], x: int, y: int) -> tuple[tuple[int, int], ...]:
+        """
+        Finds the ray running from a square towards another square in line with it
+        :param source: Square the ray starts from, must be open
+        :param x: x-coordinate of a square in line with the source
+        :param y: y-coordinate of a square in line with the source
+        :return: Open squares from the source towards (x, y)
+        """
+        dx = (x > source[0]) - (x < source[0])
+        dy = (y > source[1]) - (y < source[1])
+        return self.rays[source][DIRECTIONS.index((dx, dy))]
+
+
+def classic_lakes(rows: int, columns: int, setup_rows: int) -> frozenset[tuple[int, int]]:
+    """
+    Places the classic lakes on a board of any size: the lake columns of the 10 column board scaled to the board
+    width, across every row between the two setup zones
+    :param rows: Rows of the board
+    :param columns: Columns of the board
+    :param setup_rows: Rows of each setup zone
+    :return: Lake squares
+    """
+    return frozenset((x, y)
+                     for x in range(columns) if x * 10 // columns in CLASSIC_LAKE_COLUMNS
+                     for y in range(setup_rows, rows - setup_rows))
+
+
+def configured_lakes(rows: int, columns: int, setup_rows: int) -> frozenset[tuple[int, int]]:
+    """
+    Reads the lakes of a board shape from the config file.
+    board.lakes is 'classic' for the classic lakes or a list of [x, y] squares, squares off the board are left out.
+    :param rows: Rows of the board
+    :param columns: Columns of the board
+    :param setup_rows: Rows of each setup zone
+    :return: Lake squares
+    :raises:
+        :exception: Raised if a lake lies in a setup zone
+    """
+    lakes = config['board'].get('lakes', 'classic')
+    if lakes == 'classic':
+        return classic_lakes(rows, columns, setup_rows)
+    if lakes is None:
+        return frozenset()
+
+    squares = frozenset((x, y) for x, y in lakes if 0 <= x < columns and 0 <= y < rows)
+    for x, y in squares:
+        if y < setup_rows or y >= rows - setup_rows:
+            raise Exception(f'Lake at {(x, y)} lies in a setup zone')
+    return squares
+
+
+@functools.cache
+def board_geometry(rows: int, columns: int, lakes: frozenset[tuple[int, int]]) -> Geometry:
+    """
+    Builds the tables of a board shape once per process
+    """
+    return Geometry(rows, columns, lakes)
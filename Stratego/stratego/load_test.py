@@ -0,0 +1,228 @@
+"""
+Load test
+
+Opens many concurrent games against the AI on a game server and plays random
+legal moves in all of them, then reports how many sessions held up and how
+long a turn took from sending a move to getting the move back after the AI
+answered. Runs against a server already listening, or starts one in-process:
+
+    python stratego/load_test.py --serve --sessions 200 --turns 30
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from dataclasses import dataclass, field
+
+import outcomes
+import protocol
+from config import config
+from geometry import DIRECTIONS
+from pieces import load_units
+from server import GameServer
+
+
+class ClientBoard:
+    """
+    Board as a client sees it, kept up to date from the messages of the server
+
+    Attributes
+    ----------
+    side : int
+        side the client plays
+    rows : int
+        rows of the board
+    columns : int
+        columns of the board
+    squares : bytearray
+        square codes, as sent by the server
+    turn : int
+        side to move
+    """
+
+    def __init__(self, side: int, rows: int, columns: int, turn: int, squares: bytes):
+        self.side = side
+        self.rows = rows
+        self.columns = columns
+        self.turn = turn
+        self.squares = bytearray(squares)
+
+    def apply(self, side: int, source: int, target: int, outcome: int, attacker: int, defender: int) -> None:
+        """
+        Plays a move reported by the server on the board
+        """
+        self.turn = 1 - side
+        if source == protocol.NO_SQUARE:
+            return
+        mine = side == self.side
+        mover = self.squares[source]
+        self.squares[source] = protocol.EMPTY
+        match outcome:
+            case outcomes.NO_ATTACK:
+                self.squares[target] = mover
+            case outcomes.ATTACKER_WINS:
+                self.squares[target] = attacker if mine else protocol.REVEALED + attacker
+            case outcomes.DEFENDER_WINS:
+                if mine:
+                    self.squares[target] = protocol.REVEALED + defender
+            case _:
+                self.squares[target] = protocol.EMPTY
+
+    def random_move(self, rng: random.Random, move_limits: list[int | None]) -> tuple[int, int] | None:
+        """
+        Picks a random one square move, always legal whatever the piece's move limit
+        :return: (source, target) squares, None if no piece can move
+        """
+        moves = []
+        for square, code in enumerate(self.squares):
+            if code >= protocol.REVEALED or move_limits[code] == 0:
+                continue
+            x, y = square % self.columns, square // self.columns
+            for dx, dy in DIRECTIONS:
+                tx, ty = x + dx, y + dy
+                if 0 <= tx < self.columns and 0 <= ty < self.rows:
+                    target = ty * self.columns + tx
+                    if self.squares[target] >= protocol.REVEALED and self.squares[target] != protocol.LAKE:
+                        moves.append((square, target))
+        return rng.choice(moves) if moves else None
+
+
+@dataclass
+class LoadStats:
+    """
+    Results of a load test
+
+    Attributes
+    ----------
+    sessions : int
+        sessions that got a game started
+    completed : int
+        sessions that played all their turns or reached the end of the game
+    errors : int
+        sessions that were refused or broke off
+    latencies : list[float]
+        seconds from sending a move until it was our turn again
+    """
+    sessions: int = 0
+    completed: int = 0
+    errors: int = 0
+    latencies: list = field(default_factory=list)
+
+
+async def play_session(host: str, port: int, turns: int, rng: random.Random, stats: LoadStats) -> None:
+    """
+    Plays one game against the AI with random moves
+    :param host: Server address
+    :param port: Server port
+    :param turns: Moves to play before leaving
+    :param rng: Random stream picking the moves
+    :param stats: Results to add to
+    :return: None
+    """
+    move_limits = [unit['move_limit'] for unit in load_units()]
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        stats.errors += 1
+        return
+
+    board = None
+    side = None
+    sent = None
+    played = 0
+    try:
+        writer.write(protocol.encode(protocol.CREATE, protocol.VS_AI, protocol.ANY_PRESET))
+        while (message := await protocol.read_message(reader)) is not None:
+            kind, fields, tail = message
+            if kind == protocol.JOINED:
+                side = fields[1]
+                rows, columns = fields[2], fields[3]
+            elif kind == protocol.SNAPSHOT:
+                board = ClientBoard(side, rows, columns, fields[2], tail)
+                stats.sessions += 1
+            elif kind == protocol.MOVED:
+                # Skip the game id and ply
+                board.apply(*fields[2:])
+            elif kind == protocol.GAME_OVER:
+                stats.completed += 1
+                return
+            elif kind == protocol.ERROR:
+                stats.errors += 1
+                return
+
+            if board is None or board.turn != side:
+                continue
+            if sent is not None:
+                stats.latencies.append(time.perf_counter() - sent)
+                sent = None
+            if played == turns:
+                stats.completed += 1
+                return
+            move = board.random_move(rng, move_limits)
+            if move is None:
+                # The server passes for us
+                continue
+            sent = time.perf_counter()
+            writer.write(protocol.encode(protocol.MOVE, *move))
+            played += 1
+        stats.errors += 1
+    finally:
+        if not writer.is_closing():
+            writer.write(protocol.encode(protocol.LEAVE))
+        writer.close()
+
+
+async def run_load_test(host: str, port: int, sessions: int, turns: int, seed: int | None = None,
+                        serve: bool = False) -> LoadStats:
+    """
+    Plays many sessions at once against a server
+    :param host: Server address
+    :param port: Server port
+    :param sessions: Concurrent sessions to open
+    :param turns: Moves each session plays
+    :param seed: Seed of the clients' moves
+    :param serve: Start a server in this process first, listening on any free port
+    :return: Results of the test
+    """
+    server = None
+    if serve:
+        server = GameServer(host, 0, max_sessions=max(sessions, config['server']['max_sessions']))
+        await server.start()
+        port = server.port
+
+    rng = random.Random(seed)
+    stats = LoadStats()
+    try:
+        await asyncio.gather(*(play_session(host, port, turns, random.Random(rng.getrandbits(64)), stats)
+                               for _ in range(sessions)))
+    finally:
+        if server is not None:
+            await server.close()
+    return stats
+
+
+if __name__ == "__main__":
+    server_settings = config['server']
+    parser = argparse.ArgumentParser(description='Load test a game server with concurrent games against the AI')
+    parser.add_argument('--host', default=server_settings['host'])
+    parser.add_argument('--port', type=int, default=server_settings['port'])
+    parser.add_argument('--sessions', type=int, default=100, help='concurrent sessions')
+    parser.add_argument('--turns', type=int, default=20, help='moves played per session')
+    parser.add_argument('--seed', type=int, default=config['seed'])
+    parser.add_argument('--serve', action='store_true', help='start a server in this process')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = asyncio.run(run_load_test(args.host, args.port, args.sessions, args.turns, args.seed, args.serve))
+    elapsed = time.perf_counter() - start
+
+    print(f'{results.sessions} sessions started, {results.completed} completed, {results.errors} errors '
+          f'in {elapsed:.2f}s')
+    if results.latencies:
+        latencies = sorted(results.latencies)
+        print(f'{len(latencies)} turns, {len(latencies) / elapsed:.0f} turns/s, '
+              f'latency mean {statistics.fmean(latencies) * 1000:.1f} ms, '
+              f'p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, '
+              f'p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f} ms, '
+              f'max {latencies[-1] * 1000:.1f} ms')
@@ -0,0 +1,137 @@
+"""
+Observation
+
+What one player may know about a game, built once per turn and shared by
+everything acting for that player: the window draws it, the AI picks moves
+from it and remote clients are sent it. An observation only ever holds the
+ranks its viewer has seen, so code working from one can't accidentally look at
+hidden enemy pieces.
+
+Observations are immutable and made of plain values, none of the game's piece
+objects leak through them. The game caches one per viewpoint and drops them
+whenever the position changes.
+"""
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from pieces import load_units
+
+# Sides, every other module takes them from here. Each side sees the game from its own viewpoint
+USER = 0
+OPPONENT = 1
+# Viewpoint of spectators
+PUBLIC = 2
+
+
+@dataclass(frozen=True, slots=True)
+class PieceView:
+    """
+    A piece on the board as a viewer sees it
+
+    Attributes
+    ----------
+    x_pos : int
+        x coordinate of the piece
+    y_pos : int
+        y coordinate of the piece
+    strength : int | None
+        rank of the piece, None if the viewer has not seen it
+    is_hidden : bool
+        whether the enemy of the piece's owner has not seen its rank
+    has_moved : bool
+        if the piece has been seen moving, so it can't be a bomb or flag
+    has_moved_far : bool
+        if the piece has been seen moving more than one square at once, so it has no move limit
+    """
+    x_pos: int
+    y_pos: int
+    strength: int | None
+    is_hidden: bool
+    has_moved: bool
+    has_moved_far: bool
+
+    @property
+    def coords(self) -> tuple[int, int]:
+        return self.x_pos, self.y_pos
+
+    @property
+    def name(self) -> str | None:
+        return None if self.strength is None else load_units()[self.strength]['name']
+
+    @property
+    def kill_marshal(self) -> bool:
+        return self.strength is not None and load_units()[self.strength]['kill_marshal']
+
+    @property
+    def defuse_bombs(self) -> bool:
+        return self.strength is not None and load_units()[self.strength]['defuse_bombs']
+
+
+@dataclass(frozen=True, slots=True)
+class Observation:
+    """
+    Everything a viewpoint may know about a game at one ply.
+    Players see their own side as own, spectators watch from the user's seat and only see ranks both sides have seen.
+
+    Attributes
+    ----------
+    viewpoint : int
+        USER, OPPONENT or PUBLIC
+    ply : int
+        moves played when the observation was made
+    rows : int
+        board rows
+    columns : int
+        board columns
+    own : tuple[PieceView, ...]
+        pieces on the board of the side seen from
+    enemy : tuple[PieceView, ...]
+        pieces on the board of the other side
+    squares : MappingProxyType[tuple[int, int], PieceView]
+        every piece on the board by its coordinates
+    own_captured : tuple[int, ...]
+        ranks of the captured pieces of the side seen from, every capture shows both ranks
+    enemy_captured : tuple[int, ...]
+        ranks of the captured pieces of the other side
+    """
+    viewpoint: int
+    ply: int
+    rows: int
+    columns: int
+    own: tuple[PieceView, ...]
+    enemy: tuple[PieceView, ...]
+    squares: MappingProxyType
+    own_captured: tuple[int, ...]
+    enemy_captured: tuple[int, ...]
+
+    @property
+    def visible_enemies(self) -> list[PieceView]:
+        return [piece for piece in self.enemy if piece.strength is not None]
+
+    @property
+    def hidden_enemies(self) -> list[PieceView]:
+        return [piece for piece in self.enemy if piece.strength is None]
+
+
+def observe(game, viewpoint: int, reveal: bool = False) -> Observation:
+    """
+    Builds what a viewpoint may know about a game. Game.observe caches the result, use that instead.
+    :param game: Game to observe
+    :param viewpoint: USER, OPPONENT or PUBLIC
+    :param reveal: Show every rank, for debugging
+    :return: Observation of the current position
+    """
+    own, enemy = game.players(OPPONENT if viewpoint == OPPONENT else USER)
+    views = []
+    for player in (own, enemy):
+        # Players know their own ranks, anyone knows a rank the enemy of its owner has seen
+        known = reveal or (player is own and viewpoint != PUBLIC)
+        views.append(tuple(PieceView(piece.x_pos, piece.y_pos,
+                                     piece.strength if known or not piece.is_hidden else None,
+                                     piece.is_hidden, piece.has_moved, piece.has_moved_far)
+                           for piece in player.alive_pieces if piece.x_pos is not None))
+    squares = {piece.coords: piece for army in views for piece in army}
+    return Observation(viewpoint, game.ply, game.board.rows, game.board.columns, views[0], views[1],
+                       MappingProxyType(squares),
+                       tuple(sorted(piece.strength for piece in own.captured_pieces)),
+                       tuple(sorted(piece.strength for piece in enemy.captured_pieces)))
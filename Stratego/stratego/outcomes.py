@@ -0,0 +1,88 @@
+"""
+Outcomes
+
+Rank-vs-rank attack outcome table. The table is built once from the unit data
+file and is the single source of truth for who wins a fight, used by
+Piece.attack, the opponent AI and the batched engines.
+"""
+import json
+
+from config import config
+
+# Attack outcomes, NO_ATTACK marks a plain move onto an empty square
+NO_ATTACK = 0
+ATTACKER_WINS = 1
+DEFENDER_WINS = 2
+BOTH_LOSE = 3
+
+MARSHAL = 10
+BOMB = 11
+
+
+def _kills(strength: int, kill_marshal: bool, defuse_bombs: bool, other_strength: int) -> bool:
+    # Spy VS Marshal special case
+    if kill_marshal and other_strength == MARSHAL:
+        return True
+    # Miner VS Bomb special case
+    elif defuse_bombs and other_strength == BOMB:
+        return True
+    # Standard case: As strong or stronger strength wins
+    else:
+        return strength >= other_strength
+
+
+def duel(attacker: tuple[int, bool, bool], defender: tuple[int, bool, bool]) -> int:
+    """
+    Applies the combat rules to two units
+    :param attacker: (strength, kill_marshal, defuse_bombs) of the attacking unit
+    :param defender: (strength, kill_marshal, defuse_bombs) of the defending unit
+    :return: ATTACKER_WINS, DEFENDER_WINS or BOTH_LOSE
+    """
+    attacker_kills = _kills(*attacker, defender[0])
+    defender_kills = _kills(*defender, attacker[0])
+
+    if attacker_kills and defender_kills:
+        # Special case for Spy and Marshal or Miner and Bomb, make sure they aren't the same unit
+        if attacker[1] != defender[1] or attacker[2] != defender[2]:
+            return ATTACKER_WINS
+        else:
+            # Same strength - nobody wins
+            return BOTH_LOSE
+    elif attacker_kills:
+        return ATTACKER_WINS
+    else:
+        return DEFENDER_WINS
+
+
+def build_table(unit_info: list[dict]) -> tuple[tuple[int, ...], ...]:
+    """
+    Builds the outcome table for every pair of units
+    :param unit_info: Unit table as stored in the unit data file, indexed by strength
+    :return: Table indexed by [attacker strength][defender strength]
+    """
+    units = [(strength, unit['kill_marshal'], unit['defuse_bombs']) for strength, unit in enumerate(unit_info)]
+    return tuple(tuple(duel(attacker, defender) for defender in units) for attacker in units)
+
+
+def load_table(name: str = None) -> tuple[tuple[int, ...], ...]:
+    if name is None:
+        name = config['pieces']['data_file']
+    with open(name, 'r') as file:
+        return build_table(json.load(file))
+
+
+OUTCOMES = load_table()
+
+
+def resolve(attacker, defender) -> int:
+    """
+    Looks up the outcome of one piece attacking another
+    :param attacker: Attacking piece
+    :param defender: Defending piece
+    :return: ATTACKER_WINS, DEFENDER_WINS or BOTH_LOSE
+    """
+    if 0 <= attacker.strength < len(OUTCOMES) and 0 <= defender.strength < len(OUTCOMES):
+        return OUTCOMES[attacker.strength][defender.strength]
+    # Units outside the data file still follow the same rules
+    return duel((attacker.strength, attacker.kill_marshal, attacker.defuse_bombs),
+                (defender.strength, defender.kill_marshal, defender.defuse_bombs))
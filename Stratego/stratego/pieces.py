@@ -2,10 +2,14 @@ from __future__ import annotations
 
 import json
 import copy
+import functools
 
+import outcomes
 from config import config
 from game_object import GameObject
 
+FLAG = 0
+
 
 class Piece(GameObject):
     """
@@ -35,6 +39,10 @@ class Piece(GameObject):
         if the piece can defuse a bomb
     move_limit : None | int
         max number of spaces a piece can move in a turn, None if no limit
+    has_moved : bool
+        if the piece has been seen moving, so it can't be a bomb or flag
+    has_moved_far : bool
+        if the piece has been seen moving more than one square at once, so it has no move limit
 
     Methods
     -------
@@ -56,6 +64,8 @@ class Piece(GameObject):
         self._defuse_bombs = defuse_bombs
         self._move_limit = move_limit
         self._moves = []
+        self._has_moved = False
+        self._has_moved_far = False
 
     # PROPERTIES
     @property
@@ -114,6 +124,22 @@ class Piece(GameObject):
     def move_limit(self) -> None | int:
         return self._move_limit
 
+    @property
+    def has_moved(self) -> bool:
+        return self._has_moved
+
+    @has_moved.setter
+    def has_moved(self, value: bool):
+        self._has_moved = value
+
+    @property
+    def has_moved_far(self) -> bool:
+        return self._has_moved_far
+
+    @has_moved_far.setter
+    def has_moved_far(self, value: bool):
+        self._has_moved_far = value
+
     @property
     def moves(self) -> list[tuple[int, int]]:
         return self._moves
@@ -140,17 +166,7 @@ class Piece(GameObject):
         :param opponent: Piece object to evaluate an attack against
         :return: Boolean describing whether an attack would kill the opponent
         """
-        # Spy VS Marshal special case
-        if self.kill_marshal and opponent.strength == 10:
-            return True
-        # Miner VS Bomb special case
-        elif self.defuse_bombs and opponent.strength == 11:
-            return True
-        # Standard case: As strong or stronger strength wins
-        elif self.strength >= opponent.strength:
-            return True
-        else:
-            return False
+        return outcomes.resolve(self, opponent) != outcomes.DEFENDER_WINS
 
     def attack(self, opponent: Piece) -> None:
         """
@@ -190,29 +206,73 @@ class Piece(GameObject):
         :param opponent: Opponent to hypothetically attack
         :return: Piece that would win, or None if no winner
         """
-        if self.can_kill(opponent) and opponent.can_kill(self):
-            # Special case for Spy and Marshal, make sure they aren't both spies
-            if self.kill_marshal != opponent.kill_marshal:
+        match outcomes.resolve(self, opponent):
+            case outcomes.ATTACKER_WINS:
                 return self
-            # Special case for Miner and Bomb, make sure they aren't both miners
-            elif self.defuse_bombs != opponent.defuse_bombs:
-                return self
-            else:
+            case outcomes.DEFENDER_WINS:
+                return opponent
+            case _:
                 # Same strength - nobody wins
                 return None
-        elif self.can_kill(opponent):
-            return self
-        else:
-            return opponent
 
 
-def initialize() -> list[Piece]:
+@functools.cache
+def load_units(name: str = None) -> list[dict]:
+    """
+    Reads the unit data file once, later calls share the parsed table
+    :param name: Path of the unit data file, defaults to the configured file
+    :return: Unit info indexed by strength
+    """
+    if name is None:
+        name = config['pieces']['data_file']
+    with open(name, 'r') as file:
+        return json.load(file)
+
+
+def scale_counts(counts: dict[int, int], squares: int) -> dict[int, int]:
+    """
+    Scales an army to fill a number of squares, keeping the proportions of the ranks and a single flag
+    :param counts: Mapping of piece strength to piece count
+    :param squares: Number of pieces the scaled army should have
+    :return: Mapping of piece strength to piece count
+    """
+    total = sum(counts.values())
+    if total == squares:
+        return dict(counts)
+
+    # The flag count never scales, every other rank gets its share of the remaining squares
+    flags = counts.get(FLAG, 0)
+    shares = {strength: count * (squares - flags) / (total - flags)
+              for strength, count in counts.items() if strength != FLAG}
+    scaled = {strength: int(share) for strength, share in shares.items()}
+    # Hand the squares lost to rounding down to the largest remainders
+    leftover = squares - flags - sum(scaled.values())
+    for strength in sorted(shares, key=lambda strength: scaled[strength] - shares[strength])[:leftover]:
+        scaled[strength] += 1
+    return {strength: flags if strength == FLAG else scaled[strength] for strength in counts}
+
+
+def army_counts(columns: int = None, setup_rows: int = None) -> dict[int, int]:
+    """
+    Piece counts of one army, scaled to exactly fill a setup zone
+    :param columns: Board columns, defaults to the configured board
+    :param setup_rows: Rows of each setup zone, defaults to the configured board
+    :return: Mapping of piece strength to piece count
+    """
+    if columns is None:
+        columns = config['board']['columns']
+    if setup_rows is None:
+        setup_rows = config['board']['setup_rows']
+    return scale_counts(config['pieces']['counts'], columns * setup_rows)
+
+
+def initialize(unit_counts: dict[int, int] = None) -> list[Piece]:
     # Get unit info
-    with open(config['pieces']['data_file'], 'r') as file:
-        unit_info = json.load(file)
+    unit_info = load_units()
 
     # Get unit counts
-    unit_counts = config['pieces']['counts']
+    if unit_counts is None:
+        unit_counts = army_counts()
 
     # Initialize list of Piece objects
     pieces = []
@@ -12,11 +12,14 @@ class Player:
         Player Name
     pieces: list[Piece]
         List of pieces owned by this player
+    counts: dict[int, int] | None
+        Piece counts of the army, None for the configured army
     """
 
-    def __init__(self, name: str):
+    def __init__(self, name: str, counts: dict[int, int] = None):
         self._name = name
-        self._pieces = pieces.initialize()
+        self._counts = counts
+        self._pieces = pieces.initialize(counts)
 
     def is_owner(self, piece: Piece) -> bool:
         for p in self._pieces:
@@ -26,11 +29,15 @@ class Player:
         return False
 
     def reset_pieces(self) -> None:
-        self._pieces = pieces.initialize()
+        self._pieces = pieces.initialize(self._counts)
+
+    @property
+    def pieces(self) -> list[Piece]:
+        return self._pieces
 
     @property
     def has_flag(self) -> bool:
-        return bool([p for p in self.alive_pieces if p.strength == 0])
+        return any(p.strength == 0 and not p.is_captured for p in self._pieces)
 
     @property
     def alive_pieces(self) -> list[Piece]:
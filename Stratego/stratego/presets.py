@@ -0,0 +1,253 @@
+"""
+Presets
+
+Preset layouts are validated once when they are loaded and compiled into the
+index of the piece that goes on every setup square. Applying a preset is then
+a single pass over the squares.
+
+Large collections live in a preset library file: a 16 byte header, the sorted
+preset ids as 32 bit integers, then one byte per setup square for every
+preset. The file is memory-mapped and a preset is only decoded and compiled
+when it is asked for by id. The JSON preset file can be imported into a
+library with:
+
+    python stratego/presets.py import assets/presets.json assets/presets.strpre
+"""
+import functools
+import json
+import mmap
+import struct
+import sys
+from dataclasses import dataclass
+
+import numpy as np
+
+from config import config
+from pieces import army_counts, load_units, scale_counts
+
+LIBRARY_MAGIC = b'STRGPRE\0'
+LIBRARY_VERSION = 1
+
+# magic, version, squares per preset, preset count
+LIBRARY_HEADER = struct.Struct('<8sHHI')
+
+
+@dataclass(frozen=True)
+class Preset:
+    """
+    A validated preset layout
+
+    Attributes
+    ----------
+    index : int
+        preset number as used by the UI
+    layout : tuple[str, ...]
+        piece name for every setup square, in placement order
+    order : tuple[int, ...]
+        for every setup square, index of the piece to place in the army built by pieces.initialize
+    """
+    index: int
+    layout: tuple[str, ...]
+    order: tuple[int, ...]
+
+
+def army_offsets(counts: dict[int, int] = None) -> dict[int, int]:
+    """
+    Finds where each strength starts in the army built by pieces.initialize
+    :param counts: Mapping of piece strength to piece count, defaults to the configured army
+    :return: Mapping of piece strength to the index of its first piece
+    """
+    if counts is None:
+        counts = army_counts()
+    offsets = {}
+    offset = 0
+    for strength, count in counts.items():
+        offsets[strength] = offset
+        offset += count
+    return offsets
+
+
+def compile_preset(index: int, layout: list[str], counts: dict[int, int] = None) -> Preset:
+    """
+    Validates a layout against the army and compiles it
+    :param index: Preset number, used in error messages
+    :param layout: Piece name for every setup square
+    :param counts: Mapping of piece strength to piece count, defaults to the configured army
+    :return: Compiled preset
+    :raises:
+        :exception: Raised if the layout does not use exactly the pieces of one army
+    """
+    if counts is None:
+        counts = army_counts()
+    strengths = {unit['name']: strength for strength, unit in enumerate(load_units())}
+    offsets = army_offsets(counts)
+
+    army_size = sum(counts.values())
+    if len(layout) != army_size:
+        raise Exception(f'Invalid piece preset {index}. Has {len(layout)} squares, the army has {army_size} pieces')
+
+    used = {strength: 0 for strength in counts}
+    order = []
+    for slot, name in enumerate(layout):
+        strength = strengths.get(name)
+        if strength not in counts:
+            raise Exception(f'Invalid piece preset {index}. Unknown piece {name} at {slot}')
+        if used[strength] == counts[strength]:
+            raise Exception(f'Invalid piece preset {index}. Too many {name} pieces, extra one at {slot}')
+        order.append(offsets[strength] + used[strength])
+        used[strength] += 1
+
+    # Lengths match and no piece went over its count, so every count is exact
+    return Preset(index, tuple(layout), tuple(order))
+
+
+@functools.cache
+def load_presets(name: str) -> dict[int, Preset]:
+    """
+    Loads and compiles a preset file, once per process.
+    Layouts that are a valid army of another size are left out, they belong to another board.
+    :param name: Path of the preset file
+    :return: Presets keyed by their index
+    :raises:
+        :exception: Raised if a layout is not a valid army of any size
+    """
+    with open(name, 'r') as file:
+        presets_file = json.load(file)
+
+    army_size = sum(army_counts().values())
+    presets = {}
+    for preset in presets_file:
+        if len(preset['layout']) != army_size:
+            # Raises unless the layout fills the setup zone of another board
+            compile_preset(preset['index'], preset['layout'], scale_counts(config['pieces']['counts'],
+                                                                           len(preset['layout'])))
+            continue
+        presets[preset['index']] = compile_preset(preset['index'], preset['layout'])
+
+    return presets
+
+
+class PresetLibrary:
+    """
+    Memory-mapped preset library, presets are looked up lazily by id
+
+    Attributes
+    ----------
+    ids : np.ndarray
+        sorted ids of every preset in the library
+    slots : int
+        number of setup squares in every preset
+    """
+
+    def __init__(self, name: str):
+        self._file = open(name, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self._slots, count = LIBRARY_HEADER.unpack_from(self._mmap, 0)
+        if magic != LIBRARY_MAGIC or version != LIBRARY_VERSION:
+            raise Exception(f'{name} is not a version {LIBRARY_VERSION} preset library')
+
+        self.ids = np.frombuffer(self._mmap, dtype='<u4', count=count, offset=LIBRARY_HEADER.size)
+        self._layouts = np.frombuffer(self._mmap, dtype=np.uint8, count=count * self._slots,
+                                      offset=LIBRARY_HEADER.size + self.ids.nbytes).reshape(count, self._slots)
+        self._names = [unit['name'] for unit in load_units()]
+        self._compiled: dict[int, Preset] = {}
+
+    @property
+    def slots(self) -> int:
+        return self._slots
+
+    def _position(self, index: int) -> int | None:
+        position = int(np.searchsorted(self.ids, index))
+        if position < len(self.ids) and self.ids[position] == index:
+            return position
+        return None
+
+    def layout(self, index: int) -> list[str]:
+        position = self._position(index)
+        if position is None:
+            raise KeyError(index)
+        return [self._names[strength] for strength in self._layouts[position].tolist()]
+
+    def keys(self) -> list[int]:
+        return self.ids.tolist()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, index: int) -> bool:
+        return self._position(index) is not None
+
+    def __getitem__(self, index: int) -> Preset:
+        preset = self._compiled.get(index)
+        if preset is None:
+            preset = self._compiled[index] = compile_preset(index, self.layout(index))
+        return preset
+
+    def close(self) -> None:
+        self.ids = None
+        self._layouts = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Arrays handed out are still alive, the map is released along with them
+            pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def write_library(presets: dict[int, list[str]], name: str) -> None:
+    """
+    Writes presets into a library file, every layout is validated first
+    :param presets: Layouts keyed by preset id
+    :param name: Path of the library file
+    :return: None
+    """
+    strengths = {unit['name']: strength for strength, unit in enumerate(load_units())}
+    ids = sorted(presets)
+    slots = sum(army_counts().values())
+    layouts = bytearray()
+    for index in ids:
+        compile_preset(index, presets[index])
+        layouts.extend(strengths[piece_name] for piece_name in presets[index])
+
+    with open(name, 'wb') as file:
+        file.write(LIBRARY_HEADER.pack(LIBRARY_MAGIC, LIBRARY_VERSION, slots, len(ids)))
+        file.write(np.array(ids, dtype='<u4').tobytes())
+        file.write(layouts)
+
+
+def import_json(json_name: str, library_name: str) -> None:
+    """
+    Converts a JSON preset file into a library file
+    :param json_name: Path of the JSON preset file
+    :param library_name: Path of the library file
+    :return: None
+    """
+    with open(json_name, 'r') as file:
+        presets_file = json.load(file)
+    write_library({preset['index']: preset['layout'] for preset in presets_file}, library_name)
+
+
+@functools.cache
+def open_presets() -> dict[int, Preset] | PresetLibrary:
+    """
+    Opens the configured presets, the library file if one is set and the JSON file otherwise
+    :return: Mapping of preset id to compiled preset
+    """
+    library_file = config['presets'].get('library_file')
+    if library_file:
+        return PresetLibrary(library_file)
+    return load_presets(config['presets']['data_file'])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != 'import':
+        print('Usage: presets.py import <presets.json> <library file>')
+        sys.exit(1)
+    import_json(sys.argv[2], sys.argv[3])
@@ -0,0 +1,146 @@
+"""
+Protocol
+
+Binary message protocol between the game server and its clients. Every
+message is a frame of a 3 byte header, the payload length and the message
+type, followed by a fixed layout payload. Squares are sent as a single index,
+y * columns + x, as in the book and record files. Messages about a game carry
+its id, so one connection can watch many games.
+
+Boards are sent from one side's point of view, one byte per square: the rank
+of an own piece, REVEALED plus the rank of an enemy piece that has been seen,
+HIDDEN for an enemy piece that has not, LAKE or EMPTY. Spectators see the
+board from the user's seat, with OWN_HIDDEN for user pieces nobody has seen.
+"""
+import asyncio
+import struct
+
+# Client messages
+CREATE = 1
+JOIN = 2
+MOVE = 3
+LEAVE = 4
+WATCH = 5
+UNWATCH = 6
+RESUME = 7
+
+# Server messages
+JOINED = 16
+SNAPSHOT = 17
+MOVED = 18
+GAME_OVER = 19
+ERROR = 20
+
+# Game modes
+VS_AI = 0
+VS_HUMAN = 1
+
+# Error codes
+BAD_MESSAGE = 1
+NO_GAME = 2
+GAME_FULL = 3
+NOT_YOUR_TURN = 4
+ILLEGAL_MOVE = 5
+SERVER_FULL = 6
+
+# Square codes of boards sent to a side
+EMPTY = 255
+LAKE = 254
+HIDDEN = 253
+OWN_HIDDEN = 252
+REVEALED = 128
+
+# Square index of a pass, and rank of a piece nobody saw
+NO_SQUARE = 0xFFFF
+NO_RANK = 255
+
+# Let the server pick a preset
+ANY_PRESET = 0xFFFF
+
+# payload length, message type
+HEADER = struct.Struct('<HB')
+
+# mode, preset
+CREATE_MESSAGE = struct.Struct('<BH')
+# game id, preset
+JOIN_MESSAGE = struct.Struct('<IH')
+# source square, target square
+MOVE_MESSAGE = struct.Struct('<HH')
+# game id
+WATCH_MESSAGE = struct.Struct('<I')
+# game id, side
+RESUME_MESSAGE = struct.Struct('<IB')
+# game id, side, rows, columns
+JOINED_MESSAGE = struct.Struct('<IBBB')
+# game id, ply, side to move, viewpoint, followed by one byte per square
+SNAPSHOT_MESSAGE = struct.Struct('<IIBB')
+# game id, ply after the move, side, source square, target square, outcome, attacker rank, defender rank
+MOVED_MESSAGE = struct.Struct('<IIBHHBBB')
+# game id, winner, reason
+GAME_OVER_MESSAGE = struct.Struct('<IBB')
+# error code, followed by a UTF-8 description
+ERROR_MESSAGE = struct.Struct('<B')
+
+# Fixed part of every message type
+LAYOUTS = {
+    CREATE: CREATE_MESSAGE,
+    JOIN: JOIN_MESSAGE,
+    MOVE: MOVE_MESSAGE,
+    LEAVE: None,
+    WATCH: WATCH_MESSAGE,
+    UNWATCH: WATCH_MESSAGE,
+    RESUME: RESUME_MESSAGE,
+    JOINED: JOINED_MESSAGE,
+    SNAPSHOT: SNAPSHOT_MESSAGE,
+    MOVED: MOVED_MESSAGE,
+    GAME_OVER: GAME_OVER_MESSAGE,
+    ERROR: ERROR_MESSAGE,
+}
+
+
+def encode(kind: int, *fields, tail: bytes = b'') -> bytes:
+    """
+    Builds a frame
+    :param kind: Message type
+    :param fields: Fields of the message's fixed layout
+    :param tail: Variable length data after the fixed layout
+    :return: Frame ready to write
+    """
+    layout = LAYOUTS[kind]
+    payload = (layout.pack(*fields) if layout is not None else b'') + tail
+    return HEADER.pack(len(payload), kind) + payload
+
+
+def decode(kind: int, payload: bytes) -> tuple[tuple, bytes]:
+    """
+    Splits a payload into the fields of its fixed layout and the variable length data after it
+    :param kind: Message type
+    :param payload: Payload of a frame
+    :return: (fields, tail)
+    :raises:
+        :exception: Raised if the message type is unknown or the payload is too short
+    """
+    if kind not in LAYOUTS:
+        raise Exception(f'Unknown message type {kind}')
+    layout = LAYOUTS[kind]
+    if layout is None:
+        return (), payload
+    if len(payload) < layout.size:
+        raise Exception(f'Message type {kind} needs {layout.size} bytes, got {len(payload)}')
+    return layout.unpack_from(payload), payload[layout.size:]
+
+
+async def read_message(reader: asyncio.StreamReader) -> tuple[int, tuple, bytes] | None:
+    """
+    Reads the next frame from a stream
+    :param reader: Stream to read from
+    :return: (message type, fields, tail), None once the stream is closed
+    """
+    try:
+        header = await reader.readexactly(HEADER.size)
+        length, kind = HEADER.unpack(header)
+        payload = await reader.readexactly(length)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    fields, tail = decode(kind, payload)
+    return kind, fields, tail
@@ -0,0 +1,291 @@
+"""
+Records
+
+Compact binary game records. A record file starts with a 16 byte header and is
+followed by a flat stream of fixed-width 8 byte entries:
+
+    SETUP   one per piece on the board when the game starts
+    MOVE    one per ply, with the attack outcome
+    END     closes a game with the winner and a reason code
+
+Games are only ever appended, so a game interrupted before its END entry is
+ignored by the reader and cut off when the file is next opened for writing. Because every entry has the same width the whole file
+can be memory-mapped as one NumPy array and games are located with a single
+vectorized scan for END entries.
+"""
+import mmap
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'STRGREC\0'
+VERSION = 1
+
+# magic, version, rows, columns, reserved
+HEADER = struct.Struct('<8sHHHH')
+# kind, side, source square, target square, a, b
+ENTRY = struct.Struct('<BBHHBB')
+ENTRY_DTYPE = np.dtype([
+    ('kind', 'u1'),
+    ('side', 'u1'),
+    ('source', '<u2'),
+    ('target', '<u2'),
+    ('a', 'u1'),
+    ('b', 'u1'),
+])
+
+# Entry kinds
+# SETUP: source is the square, a is the rank
+SETUP = 0
+# MOVE: source and target squares, a is the attack outcome
+MOVE = 1
+# END: a is the winner, b is the reason the game ended
+END = 2
+
+# Winner of a game that was abandoned before it finished
+UNFINISHED = 255
+
+
+class GameRecordWriter:
+    """
+    Append-only writer streaming games into a record file
+
+    Attributes
+    ----------
+    name : str
+        path of the record file
+    rows : int
+        board rows of every game in the file
+    columns : int
+        board columns of every game in the file
+    """
+
+    def __init__(self, name: str, rows: int, columns: int):
+        self._name = name
+        self._rows = rows
+        self._columns = columns
+        self._in_game = False
+
+        directory = os.path.dirname(name)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if os.path.exists(name) and os.path.getsize(name) > 0:
+            with open(name, 'rb') as file:
+                magic, version, file_rows, file_columns, _ = HEADER.unpack(file.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise Exception(f'{name} is not a version {VERSION} game record file')
+            if (file_rows, file_columns) != (rows, columns):
+                raise Exception(f'{name} holds {file_rows}x{file_columns} games, not {rows}x{columns}')
+            self._truncate_unfinished(name)
+            self._file = open(name, 'ab')
+        else:
+            self._file = open(name, 'ab')
+            self._file.write(HEADER.pack(MAGIC, VERSION, rows, columns, 0))
+
+    @staticmethod
+    def _truncate_unfinished(name: str) -> None:
+        """
+        Cuts a file back to its last END entry, dropping a game interrupted by a crash and any torn entry after it
+        so that appended games start on a clean entry boundary
+        :param name: Path of the record file
+        :return: None
+        """
+        size = os.path.getsize(name)
+        count = (size - HEADER.size) // ENTRY.size
+        with open(name, 'r+b') as file:
+            file.seek(HEADER.size)
+            kinds = np.frombuffer(file.read(count * ENTRY.size), dtype=ENTRY_DTYPE)['kind']
+            ends = np.flatnonzero(kinds == END)
+            keep = HEADER.size + (int(ends[-1]) + 1 if len(ends) else 0) * ENTRY.size
+            if keep != size:
+                file.truncate(keep)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def in_game(self) -> bool:
+        return self._in_game
+
+    def _square(self, x: int, y: int) -> int:
+        return y * self._columns + x
+
+    def begin_game(self, setup: list[tuple[int, int, int, int]]) -> None:
+        """
+        Starts a new game
+        :param setup: (side, x, y, rank) of every piece on the board
+        :return: None
+        """
+        if self._in_game:
+            # The previous game never finished
+            self.end_game(UNFINISHED)
+        self._in_game = True
+        for side, x, y, rank in setup:
+            self._file.write(ENTRY.pack(SETUP, side, self._square(x, y), 0, rank, 0))
+
+    def record_move(self, side: int, source: tuple[int, int], target: tuple[int, int], outcome: int) -> None:
+        """
+        Appends one ply
+        :param side: Side that moved
+        :param source: Coordinates the piece moved from
+        :param target: Coordinates the piece moved or attacked to
+        :param outcome: Attack outcome, NO_ATTACK for a plain move
+        :return: None
+        """
+        if not self._in_game:
+            return
+        self._file.write(ENTRY.pack(MOVE, side, self._square(*source), self._square(*target), outcome, 0))
+
+    def end_game(self, winner: int, reason: int = 0) -> None:
+        """
+        Closes the current game and flushes it to disk
+        :param winner: Winning side, DRAW or UNFINISHED
+        :param reason: Reason code for the end of the game
+        :return: None
+        """
+        if not self._in_game:
+            return
+        self._file.write(ENTRY.pack(END, 0, 0, 0, winner, reason))
+        self._file.flush()
+        self._in_game = False
+
+    def close(self) -> None:
+        if self._in_game:
+            self.end_game(UNFINISHED)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class GameRecord:
+    """
+    View of a single game inside a memory-mapped record file
+
+    Attributes
+    ----------
+    setup : np.ndarray
+        SETUP entries of the game
+    moves : np.ndarray
+        MOVE entries of the game, one per ply
+    winner : int
+        winning side, DRAW or UNFINISHED
+    reason : int
+        reason code for the end of the game
+    """
+
+    def __init__(self, entries: np.ndarray, columns: int):
+        self._entries = entries
+        self._columns = columns
+        self._setup_count = int(np.count_nonzero(entries['kind'] == SETUP))
+
+    @property
+    def setup(self) -> np.ndarray:
+        return self._entries[:self._setup_count]
+
+    @property
+    def moves(self) -> np.ndarray:
+        return self._entries[self._setup_count:-1]
+
+    @property
+    def plies(self) -> int:
+        return len(self._entries) - self._setup_count - 1
+
+    @property
+    def winner(self) -> int:
+        return int(self._entries[-1]['a'])
+
+    @property
+    def reason(self) -> int:
+        return int(self._entries[-1]['b'])
+
+    def to_coords(self, square: int) -> tuple[int, int]:
+        y, x = divmod(int(square), self._columns)
+        return x, y
+
+
+class GameRecordReader:
+    """
+    Memory-mapped reader over a record file
+
+    Attributes
+    ----------
+    rows : int
+        board rows of every game in the file
+    columns : int
+        board columns of every game in the file
+    entries : np.ndarray
+        every complete entry in the file, backed by the memory map
+    """
+
+    def __init__(self, name: str):
+        self._file = open(name, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self._rows, self._columns, _ = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise Exception(f'{name} is not a version {VERSION} game record file')
+
+        count = (len(self._mmap) - HEADER.size) // ENTRY.size
+        self.entries = np.frombuffer(self._mmap, dtype=ENTRY_DTYPE, count=count, offset=HEADER.size)
+
+        # Every game ends with exactly one END entry, anything after the last one is an unfinished game
+        self._ends = np.flatnonzero(self.entries['kind'] == END)
+        self._starts = np.concatenate(([0], self._ends + 1))[:len(self._ends)]
+
+    @property
+    def rows(self) -> int:
+        return self._rows
+
+    @property
+    def columns(self) -> int:
+        return self._columns
+
+    @property
+    def winners(self) -> np.ndarray:
+        return self.entries['a'][self._ends]
+
+    @property
+    def reasons(self) -> np.ndarray:
+        return self.entries['b'][self._ends]
+
+    @property
+    def plies(self) -> np.ndarray:
+        moves = np.cumsum(self.entries['kind'] == MOVE)
+        before = np.where(self._starts > 0, moves[np.maximum(self._starts - 1, 0)], 0)
+        return moves[self._ends] - before
+
+    def __len__(self) -> int:
+        return len(self._ends)
+
+    def __getitem__(self, index: int) -> GameRecord:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return GameRecord(self.entries[self._starts[index]:self._ends[index] + 1], self._columns)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def close(self) -> None:
+        self.entries = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Game views handed out are still alive, the map is released along with them
+            pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
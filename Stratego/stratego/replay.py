@@ -0,0 +1,149 @@
+"""
+Replay
+
+Random access playback of recorded games. Full board states are stored as
+keyframes every few plies when a replay is opened, seeking copies the nearest
+keyframe at or before the requested ply and applies only the moves after it.
+"""
+import numpy as np
+
+import outcomes
+from pieces import load_units
+from records import GameRecord, GameRecordReader
+
+EMPTY = -1
+
+# Default number of plies between keyframes
+KEYFRAME_INTERVAL = 64
+
+
+class Replay:
+    """
+    A class to step through a recorded game
+
+    Attributes
+    ----------
+    ply : int
+        number of moves applied to the current state
+    plies : int
+        total number of moves in the game
+    ranks : np.ndarray
+        piece strength on each square of the current state, EMPTY if no piece
+    owners : np.ndarray
+        side owning the piece on each square of the current state, EMPTY if no piece
+    hidden : np.ndarray
+        whether the piece on each square of the current state is still hidden
+    """
+
+    def __init__(self, record: GameRecord, rows: int, columns: int, keyframe_interval: int = KEYFRAME_INTERVAL):
+        self._winner = record.winner
+        self._rows = rows
+        self._columns = columns
+        self._interval = keyframe_interval
+        self._unit_names = [unit['name'] for unit in load_units()]
+
+        # Pull the move stream out of the memory map once, seeking only touches these lists
+        moves = record.moves
+        self._sources = moves['source'].tolist()
+        self._targets = moves['target'].tolist()
+        self._outcomes = moves['a'].tolist()
+
+        squares = rows * columns
+        self.ranks = np.full(squares, EMPTY, dtype=np.int8)
+        self.owners = np.full(squares, EMPTY, dtype=np.int8)
+        self.hidden = np.zeros(squares, dtype=bool)
+        setup = record.setup
+        self.ranks[setup['source']] = setup['a']
+        self.owners[setup['source']] = setup['side']
+        self.hidden[setup['source']] = True
+        self._ply = 0
+
+        # Walk the game once, keeping a copy of the state every interval plies
+        self._keyframes = []
+        for ply in range(self.plies + 1):
+            if ply % self._interval == 0:
+                self._keyframes.append((self.ranks.copy(), self.owners.copy(), self.hidden.copy()))
+            if ply < self.plies:
+                self._apply(ply)
+        self.seek(0)
+
+    @classmethod
+    def from_file(cls, name: str, index: int = -1, keyframe_interval: int = KEYFRAME_INTERVAL):
+        with GameRecordReader(name) as reader:
+            return cls(reader[index], reader.rows, reader.columns, keyframe_interval)
+
+    # PROPERTIES
+    @property
+    def ply(self) -> int:
+        return self._ply
+
+    @property
+    def plies(self) -> int:
+        return len(self._sources)
+
+    @property
+    def winner(self) -> int:
+        return self._winner
+
+    @property
+    def last_move(self) -> tuple[tuple[int, int], tuple[int, int]] | None:
+        if self._ply == 0:
+            return None
+        return self.to_coords(self._sources[self._ply - 1]), self.to_coords(self._targets[self._ply - 1])
+
+    def to_coords(self, square: int) -> tuple[int, int]:
+        y, x = divmod(square, self._columns)
+        return x, y
+
+    # METHODS
+    def _apply(self, ply: int) -> None:
+        source = self._sources[ply]
+        target = self._targets[ply]
+        outcome = self._outcomes[ply]
+
+        if outcome == outcomes.NO_ATTACK or outcome == outcomes.ATTACKER_WINS:
+            self.ranks[target] = self.ranks[source]
+            self.owners[target] = self.owners[source]
+            self.hidden[target] = self.hidden[source] and outcome == outcomes.NO_ATTACK
+        elif outcome == outcomes.DEFENDER_WINS:
+            self.hidden[target] = False
+        else:
+            self.ranks[target] = EMPTY
+            self.owners[target] = EMPTY
+            self.hidden[target] = False
+
+        self.ranks[source] = EMPTY
+        self.owners[source] = EMPTY
+        self.hidden[source] = False
+        self._ply = ply + 1
+
+    def seek(self, ply: int) -> None:
+        """
+        Jumps to the state after a given number of moves
+        :param ply: Number of moves to apply, clamped to the length of the game
+        :return: None
+        """
+        ply = max(0, min(ply, self.plies))
+        # Moving forward within the same keyframe span only needs the missing deltas
+        if not self._ply <= ply < (self._ply // self._interval + 1) * self._interval:
+            keyframe = ply // self._interval
+            ranks, owners, hidden = self._keyframes[keyframe]
+            self.ranks[:] = ranks
+            self.owners[:] = owners
+            self.hidden[:] = hidden
+            self._ply = keyframe * self._interval
+
+        while self._ply < ply:
+            self._apply(self._ply)
+
+    def step(self, count: int = 1) -> None:
+        self.seek(self._ply + count)
+
+    def pieces(self) -> list[tuple[int, int, int, str, bool]]:
+        """
+        Lists the pieces of the current state
+        :return: (x, y, side, name, hidden) of every piece on the board
+        """
+        return [(*self.to_coords(square), int(self.owners[square]), self._unit_names[self.ranks[square]],
+                 bool(self.hidden[square]))
+                for square in np.flatnonzero(self.owners != EMPTY).tolist()]
@@ -0,0 +1,482 @@
+"""
+Sampling
+
+Determinized search over hidden information. The enemy pieces we have not
+seen yet are given ranks that are consistent with everything we know: the
+enemy army, the pieces already captured or revealed, pieces seen moving (not
+a bomb or flag) and pieces seen moving more than one square (a scout). Every
+candidate move is played on many of these samples with BatchSimulator
+rollouts, spread over worker processes until the time budget runs out, and
+the move with the best average result is picked. Rollouts still running when
+the budget runs out stop at their next ply, so they don't hold on to workers
+the next search needs.
+
+Workers don't get the position pickled with every task. The search lays it out
+once in a shared memory block, workers read it from there without copying and
+write back only the scores of the candidates into their own slot of the block.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from batch import BatchSimulator, EMPTY, DRAW, FLAG
+from config import config
+from outcomes import BOMB
+from pieces import load_units
+
+# What we have seen a hidden piece do
+UNMOVED = 0
+MOVED = 1
+MOVED_FAR = 2
+
+# Leave some of the budget for collecting results and taking the move
+DEADLINE_MARGIN = 0.05
+
+# Shared block layout: an int32 header with these counts, then the sections, each starting on an 8 byte boundary
+HEADER_FIELDS = ('rows', 'columns', 'side', 'samples', 'plies', 'unknown', 'pool', 'candidates', 'lakes', 'slots')
+ALIGNMENT = 8
+
+
+@dataclass
+class RolloutTask:
+    """
+    Everything a worker needs to sample positions and play rollouts, without the game objects
+
+    Attributes
+    ----------
+    ranks : np.ndarray
+        rank on every square, the ranks on unknown squares are filled in by sampling
+    owners : np.ndarray
+        side owning every square, EMPTY if no piece
+    hidden : np.ndarray
+        whether the piece on every square is still hidden
+    unknown : np.ndarray
+        squares of the enemy pieces whose rank we don't know
+    seen : np.ndarray
+        UNMOVED, MOVED or MOVED_FAR for every unknown square
+    pool : np.ndarray
+        ranks still unaccounted for in the enemy army, more than the unknown squares if pieces are off the board
+    sources : np.ndarray
+        square moved from by every candidate move
+    targets : np.ndarray
+        square moved to by every candidate move
+    side : int
+        side picking a move
+    samples : int
+        positions to sample
+    plies : int
+        plies to play after the candidate move
+    policy : str
+        BatchSimulator policy used for the rollouts
+    seed : int
+        seed of the task's random stream
+    rows : int
+        rows of the board
+    columns : int
+        columns of the board
+    lakes : np.ndarray
+        lake squares of the board
+    stop_at : float | None
+        time.time() value after which rollouts stop and are scored as they stand, None for no limit
+    """
+    ranks: np.ndarray
+    owners: np.ndarray
+    hidden: np.ndarray
+    unknown: np.ndarray
+    seen: np.ndarray
+    pool: np.ndarray
+    sources: np.ndarray
+    targets: np.ndarray
+    side: int
+    samples: int
+    plies: int
+    policy: str
+    seed: int
+    rows: int
+    columns: int
+    lakes: np.ndarray
+    stop_at: float | None = None
+
+
+def unit_move_limits() -> list[int | None]:
+    return [unit['move_limit'] for unit in load_units()]
+
+
+def determinize(rng: np.random.Generator, pool: np.ndarray, seen: np.ndarray,
+                move_limits: list[int | None]) -> np.ndarray:
+    """
+    Deals the unaccounted ranks out to the unknown pieces, respecting what each piece was seen doing
+    :param rng: Random stream
+    :param pool: Ranks still unaccounted for, at least one per unknown piece
+    :param seen: UNMOVED, MOVED or MOVED_FAR for every unknown piece
+    :param move_limits: Move limit of every rank, None for no limit
+    :return: Sampled rank of every unknown piece
+    """
+    ranks = np.full(len(seen), EMPTY, dtype=np.int8)
+    remaining = list(rng.permutation(pool))
+
+    def deal(slots: np.ndarray, fits) -> None:
+        # Hand ranks that fit to the slots, slots nothing fits are filled in last
+        for slot in slots:
+            for index, rank in enumerate(remaining):
+                if fits(rank):
+                    ranks[slot] = remaining.pop(index)
+                    break
+
+    # Deal from the whole pool first, so the ranks seen pieces need are never among those left out
+    # Pieces that jumped squares have no move limit
+    deal(np.flatnonzero(seen == MOVED_FAR), lambda rank: move_limits[rank] is None)
+    # Pieces that moved can't be bombs or flags
+    deal(np.flatnonzero(seen == MOVED), lambda rank: move_limits[rank] != 0)
+
+    # Pieces that never moved take any of the rest. With pieces off the board some ranks are not in play at all,
+    # the pool is shuffled so the ranks left out are a random few
+    empty = np.flatnonzero(ranks == EMPTY)
+    ranks[empty] = remaining[:len(empty)]
+    return ranks
+
+
+def material(ranks: np.ndarray, owners: np.ndarray, side: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Sums the strength of each side's movable pieces, bombs and flags count for nothing
+    :return: (own, enemy) material of every game
+    """
+    value = np.where((ranks != FLAG) & (ranks != BOMB) & (ranks != EMPTY), ranks, 0).astype(np.int32)
+    return (np.sum(np.where(owners == side, value, 0), axis=1),
+            np.sum(np.where(owners == 1 - side, value, 0), axis=1))
+
+
+def run_rollouts(task: RolloutTask) -> tuple[np.ndarray, int]:
+    """
+    Samples positions and plays every candidate move on each of them
+    :param task: Rollout task
+    :return: (summed score of every candidate, number of samples played)
+    """
+    rng = np.random.default_rng(task.seed)
+    move_limits = unit_move_limits()
+    candidates = len(task.sources)
+    games = task.samples * candidates
+
+    ranks = np.repeat(task.ranks[None], games, axis=0)
+    for sample in range(task.samples):
+        ranks[sample * candidates:(sample + 1) * candidates, task.unknown] = \
+            determinize(rng, task.pool, task.seen, move_limits)
+
+    simulator = BatchSimulator(games, task.rows, task.columns, policy=task.policy, seed=int(rng.integers(2 ** 31)),
+                               lakes=frozenset((square % task.columns, square // task.columns)
+                                               for square in task.lakes.tolist()))
+    simulator.load(ranks, np.repeat(task.owners[None], games, axis=0), np.repeat(task.hidden[None], games, axis=0),
+                   np.full(games, task.side, dtype=np.int8))
+    simulator.apply_moves(np.arange(games), np.tile(task.sources, task.samples), np.tile(task.targets, task.samples))
+    for _ in range(task.plies):
+        if task.stop_at is not None and time.time() >= task.stop_at:
+            break
+        if not simulator.step():
+            break
+
+    # Wins count 1, losses 0, draws a half and unfinished games by how the material stands
+    own, enemy = material(simulator.ranks, simulator.owners, task.side)
+    standing = np.where(own + enemy > 0, own / np.maximum(own + enemy, 1), 0.5)
+    winners = simulator.winners
+    scores = np.select([winners == task.side, winners == 1 - task.side, winners == DRAW], [1.0, 0.0, 0.5], standing)
+    return scores.reshape(task.samples, candidates).sum(axis=0), task.samples
+
+
+def _sections(header: dict[str, int]) -> list[tuple[str, type, tuple[int, ...]]]:
+    squares = header['rows'] * header['columns']
+    return [('ranks', np.int8, (squares,)),
+            ('owners', np.int8, (squares,)),
+            ('hidden', np.bool_, (squares,)),
+            ('unknown', np.int32, (header['unknown'],)),
+            ('seen', np.int8, (header['unknown'],)),
+            ('pool', np.int8, (header['pool'],)),
+            ('sources', np.int32, (header['candidates'],)),
+            ('targets', np.int32, (header['candidates'],)),
+            ('lakes', np.int32, (header['lakes'],)),
+            ('scores', np.float64, (header['slots'], header['candidates']))]
+
+
+def _layout(header: dict[str, int]) -> tuple[dict[str, tuple[int, type, tuple[int, ...]]], int]:
+    """
+    Places the sections of a shared block after the header
+    :param header: Counts the sections are sized by
+    :return: ({section: (offset, dtype, shape)}, size of the block)
+    """
+    offset = len(HEADER_FIELDS) * np.dtype(np.int32).itemsize
+    layout = {}
+    for name, dtype, shape in _sections(header):
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        layout[name] = (offset, dtype, shape)
+        offset += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return layout, max(offset, 1)
+
+
+class SharedTask:
+    """
+    A rollout task laid out in a shared memory block, with a result slot for every task running at once.
+    The search creates the block, workers attach to it by name.
+
+    Attributes
+    ----------
+    memory : SharedMemory
+        block holding the task
+    header : dict[str, int]
+        counts and settings stored at the start of the block
+    arrays : dict[str, np.ndarray]
+        views of every section of the block, no copies
+    """
+
+    def __init__(self, memory: SharedMemory, owner: bool):
+        self.memory = memory
+        self._owner = owner
+        counts = np.ndarray((len(HEADER_FIELDS),), np.int32, memory.buf)
+        self.header = dict(zip(HEADER_FIELDS, counts.tolist()))
+        layout, _ = _layout(self.header)
+        self.arrays = {name: np.ndarray(shape, dtype, memory.buf, offset)
+                       for name, (offset, dtype, shape) in layout.items()}
+        if not owner:
+            # Workers only write their scores
+            for name, array in self.arrays.items():
+                if name != 'scores':
+                    array.flags.writeable = False
+
+    @classmethod
+    def create(cls, task: RolloutTask, slots: int) -> 'SharedTask':
+        """
+        Copies a task into a new shared block
+        :param task: Task to share, seed and stop_at are given to every worker separately
+        :param slots: Tasks that may run at once, each writes its scores in its own slot
+        :return: Shared task owning the block
+        """
+        header = {'rows': task.rows, 'columns': task.columns, 'side': task.side, 'samples': task.samples,
+                  'plies': task.plies, 'unknown': len(task.unknown), 'pool': len(task.pool),
+                  'candidates': len(task.sources), 'lakes': len(task.lakes), 'slots': slots}
+        _, size = _layout(header)
+        memory = SharedMemory(create=True, size=size)
+        np.ndarray((len(HEADER_FIELDS),), np.int32, memory.buf)[:] = [header[field] for field in HEADER_FIELDS]
+        shared = cls(memory, True)
+        for name, array in shared.arrays.items():
+            if name != 'scores':
+                array[:] = getattr(task, name)
+        return shared
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @property
+    def scores(self) -> np.ndarray:
+        return self.arrays['scores']
+
+    def task(self, seed: int, stop_at: float | None, policy: str) -> RolloutTask:
+        """
+        :return: Task reading the position straight from the block
+        """
+        arrays = self.arrays
+        header = self.header
+        return RolloutTask(arrays['ranks'], arrays['owners'], arrays['hidden'], arrays['unknown'], arrays['seen'],
+                           arrays['pool'], arrays['sources'], arrays['targets'], header['side'], header['samples'],
+                           header['plies'], policy, seed, header['rows'], header['columns'], arrays['lakes'], stop_at)
+
+    def release(self) -> None:
+        # Views must go before the block can be closed
+        self.arrays = {}
+        self.memory.close()
+        if self._owner:
+            self.memory.unlink()
+
+
+# Block the worker process is attached to, kept between tasks of the same search
+_attached: SharedTask | None = None
+
+
+def run_shared(name: str, slot: int, seed: int, stop_at: float | None, policy: str) -> int:
+    """
+    Plays rollouts in a worker on a task shared by the search, the scores are written to the task's slot
+    :param name: Name of the shared block
+    :param slot: Result slot of this task
+    :param seed: Seed of the task's random stream
+    :param stop_at: time.time() value after which rollouts stop, None for no limit
+    :param policy: BatchSimulator policy used for the rollouts
+    :return: Number of samples played
+    """
+    global _attached
+    if _attached is None or _attached.name != name:
+        if _attached is not None:
+            _attached.release()
+            _attached = None
+        try:
+            _attached = SharedTask(SharedMemory(name=name), False)
+        except FileNotFoundError:
+            # The search ended before this task started
+            return 0
+    scores, played = run_rollouts(_attached.task(seed, stop_at, policy))
+    _attached.scores[slot] = scores
+    return played
+
+
+class RolloutSearch:
+    """
+    Determinized rollout search over a process pool
+
+    Attributes
+    ----------
+    workers : int
+        worker processes, 0 to run rollouts in the calling process
+    samples : int
+        positions sampled per task
+    plies : int
+        plies played after every candidate move
+    policy : str
+        BatchSimulator policy used for the rollouts
+    max_tasks : int
+        most tasks run for one move, bounds the search when there is no time budget
+    last_samples : int
+        positions sampled for the last move searched
+    """
+
+    def __init__(self, workers: int | None = None, samples: int = None, plies: int = None, policy: str = None,
+                 max_tasks: int = None):
+        settings = config['sampling']
+        if workers is None:
+            workers = settings['workers']
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.workers = workers
+        self.samples = settings['samples_per_task'] if samples is None else samples
+        self.plies = settings['rollout_plies'] if plies is None else plies
+        self.policy = settings['policy'] if policy is None else policy
+        self.max_tasks = settings['max_tasks'] if max_tasks is None else max_tasks
+        self._executor = None
+        self.last_samples = 0
+
+    def encode(self, game, side: int, candidates: list) -> RolloutTask:
+        """
+        Turns the game as seen by a side into a rollout task
+        :param game: Game to search
+        :param side: Side picking a move
+        :param candidates: (piece, (x, y)) moves to compare
+        :return: Task with the sampling fields filled in, seed left at 0
+        """
+        columns = game.board.columns
+        squares = game.board.rows * columns
+        ranks = np.full(squares, EMPTY, dtype=np.int8)
+        owners = np.full(squares, EMPTY, dtype=np.int8)
+        hidden = np.zeros(squares, dtype=bool)
+        observation = game.observe(side)
+
+        # Ranks we know: the whole enemy army minus what has been captured or revealed
+        pool = dict(game.army)
+        for strength in observation.enemy_captured:
+            pool[strength] -= 1
+
+        unknown = []
+        seen = []
+        for army, owner in ((observation.own, side), (observation.enemy, 1 - side)):
+            for piece in army:
+                square = piece.y_pos * columns + piece.x_pos
+                owners[square] = owner
+                hidden[square] = piece.is_hidden
+                if piece.strength is None:
+                    unknown.append(square)
+                    seen.append(MOVED_FAR if piece.has_moved_far else MOVED if piece.has_moved else UNMOVED)
+                else:
+                    ranks[square] = piece.strength
+                    if army is observation.enemy:
+                        pool[piece.strength] -= 1
+
+        return RolloutTask(
+            ranks, owners, hidden,
+            np.array(unknown, dtype=np.int32),
+            np.array(seen, dtype=np.int8),
+            np.array([rank for rank, count in pool.items() for _ in range(count)], dtype=np.int8),
+            np.array([piece.y_pos * columns + piece.x_pos for piece, _ in candidates], dtype=np.int32),
+            np.array([y * columns + x for _, (x, y) in candidates], dtype=np.int32),
+            side, self.samples, self.plies, self.policy, 0, game.board.rows, columns,
+            np.array([y * columns + x for x, y in sorted(game.board.lakes)], dtype=np.int32))
+
+    @staticmethod
+    def _task(base: RolloutTask, rng: np.random.Generator, stop_at: float | None) -> RolloutTask:
+        return RolloutTask(**{**base.__dict__, 'seed': int(rng.integers(2 ** 63)), 'stop_at': stop_at})
+
+    def search(self, game, side: int, candidates: list, deadline: float | None) -> np.ndarray | None:
+        """
+        Scores candidate moves until the deadline or the task limit is reached
+        :param game: Game to search
+        :param side: Side picking a move
+        :param candidates: (piece, (x, y)) moves to compare
+        :param deadline: time.perf_counter() value to answer by, None to run max_tasks tasks
+        :return: Average score of every candidate, None if no rollout finished in time
+        """
+        base = self.encode(game, side, candidates)
+        # Task seeds come from the game's own stream, so seeded games search the same samples
+        rng = np.random.default_rng(game.rng.getrandbits(64))
+        totals = np.zeros(len(candidates))
+        samples = 0
+        tasks = 0
+
+        def time_left() -> bool:
+            return deadline is None or time.perf_counter() < deadline - DEADLINE_MARGIN
+
+        # Worker processes don't share perf_counter, they are told when to stop in wall clock time
+        stop_at = None if deadline is None else time.time() + deadline - DEADLINE_MARGIN - time.perf_counter()
+
+        if self.workers == 0:
+            while tasks < self.max_tasks and time_left():
+                scores, played = run_rollouts(self._task(base, rng, stop_at))
+                totals += scores
+                samples += played
+                tasks += 1
+        else:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            # One slot per worker, a slot is free again once its task's scores are added up
+            shared = SharedTask.create(base, self.workers)
+            free = list(range(self.workers))
+            pending = {}
+
+            def submit() -> None:
+                slot = free.pop()
+                future = self._executor.submit(run_shared, shared.name, slot, int(rng.integers(2 ** 63)), stop_at,
+                                               self.policy)
+                pending[future] = slot
+
+            try:
+                while tasks < self.max_tasks and free:
+                    submit()
+                    tasks += 1
+                while pending:
+                    timeout = None if deadline is None else \
+                        max(0.0, deadline - DEADLINE_MARGIN - time.perf_counter())
+                    done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                    if not done:
+                        # Out of time, queued rollouts are dropped and running ones stop at their next ply
+                        for future in pending:
+                            future.cancel()
+                        break
+                    for future in done:
+                        slot = pending.pop(future)
+                        samples += future.result()
+                        totals += shared.scores[slot]
+                        free.append(slot)
+                        # Keep every worker busy while there is time left
+                        if tasks < self.max_tasks and time_left():
+                            submit()
+                            tasks += 1
+            finally:
+                # Workers still finishing a dropped rollout keep their own mapping of the block
+                shared.release()
+
+        self.last_samples = samples
+        if samples == 0:
+            return None
+        return totals / samples
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,500 @@
+"""
+Server
+
+Asyncio game server hosting many independent games in one process. Clients
+connect over TCP and speak the frame protocol in protocol.py: a client either
+creates a game against the AI, creates a game and waits for a second human, or
+joins a waiting game by id. Every game is its own Stratego instance, AI turns
+run on a thread pool so a slow strategy never holds up the event loop and the
+other games on it. Players and spectators follow a game through its delta feed
+in sync.py, a spectator connection can watch any number of games. Every game is
+checkpointed to a file whenever the turn changes hands. A server starting up
+picks up the games left in its checkpoint directory, so games survive the
+server going down: players reconnect with RESUME and carry on from the last
+turn.
+
+    python stratego/server.py --port 8765
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import re
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import protocol
+from config import config
+from snapshot import load_snapshot, read_snapshot, save_snapshot, write_snapshot
+from stratego_game import CONFIG_SEED, Stratego, EndReason, USER, OPPONENT
+from strategies import Strategy, make_strategy
+from sync import GameFeed, PUBLIC
+
+# Checkpoint files hold the game mode, followed by the snapshot
+CHECKPOINT = struct.Struct('<B')
+CHECKPOINT_FILE = re.compile(r'game-(\d+)\.strsnap')
+
+
+class Session:
+    """
+    One game hosted by the server
+
+    Attributes
+    ----------
+    game_id : int
+        id clients use to join the game
+    game : Stratego
+        the game itself
+    mode : int
+        VS_AI or VS_HUMAN
+    clients : dict[int, asyncio.StreamWriter | None]
+        connection playing each side, None for the AI or a seat still open
+    feed : GameFeed
+        delta stream of the game, followed by both players and any spectators
+    senders : dict[int, Callable[[bytes], None]]
+        feed subscription of each side's connection
+    strategy : Strategy | None
+        strategy playing the opponent side in VS_AI games
+    turn : int
+        side to move
+    started : bool
+        whether both setups are on the board
+    finished : bool
+        whether the game is over
+    lock : asyncio.Lock
+        held while a move is being played
+    ai_turn : asyncio.Future | None
+        AI turn running on the thread pool, None while no strategy is thinking
+    checkpoint : bytes | None
+        snapshot of the game at the start of the current turn, None before the game starts or if checkpoints are off
+    """
+
+    def __init__(self, game_id: int, game: Stratego, mode: int, strategy: Strategy | None):
+        self.game_id = game_id
+        self.game = game
+        self.mode = mode
+        self.clients: dict[int, asyncio.StreamWriter | None] = {USER: None, OPPONENT: None}
+        self.feed = GameFeed(game_id, game)
+        self.senders: dict[int, Callable[[bytes], None]] = {}
+        self.strategy = strategy
+        self.turn = USER
+        self.started = False
+        self.finished = False
+        self.lock = asyncio.Lock()
+        self.ai_turn: asyncio.Future | None = None
+        self.checkpoint: bytes | None = None
+
+    def apply_preset(self, side: int, preset: int) -> None:
+        """
+        Puts a side's setup on the board, a random preset if none is asked for or the preset does not exist.
+        Pieces are dealt out randomly if no preset fits the army of the board.
+        """
+        game = self.game
+        if len(game.presets) == 0:
+            if side == USER:
+                game.board.add_user_pieces(game.user, game.rng)
+            else:
+                game.board.add_opponent_pieces(game.opponent, game.rng)
+            return
+        if preset == protocol.ANY_PRESET or preset not in self.game.presets:
+            preset = self.game.rng.choice(list(self.game.presets.keys()))
+        if side == USER:
+            self.game.apply_user_preset(preset)
+        else:
+            self.game.apply_opponent_preset(preset)
+
+    def save_checkpoint(self) -> None:
+        self.checkpoint = save_snapshot(self.game, self.turn)
+
+    def restore(self, checkpoint: bytes) -> None:
+        """
+        Puts the game back to a checkpoint, clients subscribing from then on are sent the restored board
+        :param checkpoint: Snapshot taken by save_checkpoint, possibly by another server
+        :return: None
+        """
+        self.turn = load_snapshot(self.game, checkpoint)
+        self.checkpoint = checkpoint
+        self.feed.turn = self.turn
+        self.feed.snapshot()
+
+
+class GameServer:
+    """
+    Hosts games for clients connecting over TCP
+
+    Attributes
+    ----------
+    host : str
+        address to listen on
+    port : int
+        port to listen on, 0 for any free port
+    max_sessions : int
+        most games hosted at once
+    checkpoints : bool
+        whether every game is snapshotted whenever the turn changes hands
+    checkpoint_directory : str
+        directory holding the checkpoint file of every game in progress
+    sessions : dict[int, Session]
+        games being hosted, by game id
+    """
+
+    def __init__(self, host: str = None, port: int = None, ai_workers: int = None, max_sessions: int = None,
+                 seed: int | None = CONFIG_SEED, checkpoint_directory: str = None):
+        settings = config['server']
+        self.host = settings['host'] if host is None else host
+        self.port = settings['port'] if port is None else port
+        self.max_sessions = settings['max_sessions'] if max_sessions is None else max_sessions
+        self.checkpoints = settings['checkpoints']
+        self.checkpoint_directory = settings['checkpoint_directory'] if checkpoint_directory is None \
+            else checkpoint_directory
+        self.seed = seed
+        self.sessions: dict[int, Session] = {}
+        self._executor = ThreadPoolExecutor(max_workers=settings['ai_workers'] if ai_workers is None else ai_workers)
+        self._ids = itertools.count(1)
+        self._server: asyncio.Server | None = None
+        self._connections: set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        if self.checkpoints:
+            self.resume_checkpoints()
+        self._server = await asyncio.start_server(self.handle, self.host, self.port)
+        # Pick up the port actually bound when asked for any free one
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        # Connections still open are served to the end, so every game they play is given up properly
+        for task in self._connections:
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        for session in list(self.sessions.values()):
+            self._end(session)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # CHECKPOINTS
+    def checkpoint_file(self, game_id: int) -> str:
+        return os.path.join(self.checkpoint_directory, f'game-{game_id}.strsnap')
+
+    def _checkpoint(self, session: Session) -> None:
+        # Small enough to write from the event loop, a crash while writing keeps the previous checkpoint
+        session.save_checkpoint()
+        write_snapshot(self.checkpoint_file(session.game_id), CHECKPOINT.pack(session.mode) + session.checkpoint)
+
+    def resume_checkpoints(self) -> list[int]:
+        """
+        Hosts again every game left in the checkpoint directory, waiting for its players to resume it
+        :return: Ids of the games resumed
+        """
+        if not os.path.isdir(self.checkpoint_directory):
+            return []
+        resumed = []
+        for name in sorted(os.listdir(self.checkpoint_directory)):
+            match = CHECKPOINT_FILE.fullmatch(name)
+            if match is None or int(match.group(1)) in self.sessions:
+                continue
+            game_id = int(match.group(1))
+            data = read_snapshot(os.path.join(self.checkpoint_directory, name))
+            try:
+                mode, = CHECKPOINT.unpack_from(data)
+                session = self._new_session(game_id, mode)
+                session.restore(data[CHECKPOINT.size:])
+            except Exception as error:
+                # Left in place, a server configured for its board may still pick it up
+                print(f'Could not resume {name}: {error}')
+                continue
+            session.started = True
+            self.sessions[game_id] = session
+            resumed.append(game_id)
+        if resumed:
+            # New games never take the id of a resumed one
+            self._ids = itertools.count(max(max(resumed) + 1, next(self._ids)))
+        return resumed
+
+    # CONNECTIONS
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Serves one client connection until it leaves or disconnects
+        """
+        task = asyncio.current_task()
+        self._connections.add(task)
+        session = None
+        side = USER
+        # Feed subscriptions of the games this connection watches, by game id
+        watching: dict[int, tuple[GameFeed, Callable[[bytes], None]]] = {}
+        try:
+            while (message := await protocol.read_message(reader)) is not None:
+                kind, fields, _ = message
+                if kind == protocol.CREATE:
+                    if session is None:
+                        session, side = await self._create(writer, *fields)
+                        continue
+                elif kind == protocol.JOIN:
+                    if session is None:
+                        session, side = await self._join(writer, *fields)
+                        continue
+                elif kind == protocol.RESUME:
+                    if session is None:
+                        session, side = await self._resume(writer, *fields)
+                        continue
+                elif kind == protocol.MOVE:
+                    if session is not None:
+                        await self._human_move(session, side, *fields)
+                        continue
+                    self._send(writer, protocol.encode(protocol.ERROR, protocol.NO_GAME, tail=b'Not in a game'))
+                    continue
+                elif kind == protocol.WATCH:
+                    self._watch(writer, watching, *fields)
+                    continue
+                elif kind == protocol.UNWATCH:
+                    if fields[0] in watching:
+                        feed, send = watching.pop(fields[0])
+                        feed.unsubscribe(PUBLIC, send)
+                    continue
+                elif kind == protocol.LEAVE:
+                    break
+                self._send(writer, protocol.encode(protocol.ERROR, protocol.BAD_MESSAGE,
+                                                   tail=f'Unexpected message {kind}'.encode()))
+        except Exception as error:
+            # A malformed frame ends the connection, never the server
+            self._send(writer, protocol.encode(protocol.ERROR, protocol.BAD_MESSAGE, tail=str(error).encode()))
+        except asyncio.CancelledError:
+            # The server is closing. Ending normally keeps asyncio from reporting the cancelled connection as an error
+            pass
+        finally:
+            for feed, send in watching.values():
+                feed.unsubscribe(PUBLIC, send)
+            if session is not None:
+                self._leave(session, side)
+            writer.close()
+            self._connections.discard(task)
+
+    @staticmethod
+    def _send(writer: asyncio.StreamWriter | None, frame: bytes) -> None:
+        # Frames are small, the transport buffers them and flushes as the socket allows
+        if writer is not None and not writer.is_closing():
+            writer.write(frame)
+
+    def _sender(self, writer: asyncio.StreamWriter) -> Callable[[bytes], None]:
+        """
+        Makes a feed subscriber writing to a connection. Feeds publish from whichever thread took the move,
+        so frames are handed to the event loop, which keeps them in the order they were published.
+        """
+        loop = asyncio.get_running_loop()
+
+        def send(frame: bytes) -> None:
+            loop.call_soon_threadsafe(self._send, writer, frame)
+        return send
+
+    def _watch(self, writer: asyncio.StreamWriter, watching: dict, game_id: int) -> None:
+        session = self.sessions.get(game_id)
+        if session is None or not session.started:
+            self._send(writer, protocol.encode(protocol.ERROR, protocol.NO_GAME, tail=b'No such game'))
+            return
+        if game_id not in watching:
+            send = self._sender(writer)
+            watching[game_id] = session.feed, send
+            session.feed.subscribe(PUBLIC, send)
+
+    # SESSIONS
+    async def _create(self, writer: asyncio.StreamWriter, mode: int, preset: int) -> tuple[Session | None, int]:
+        if len(self.sessions) >= self.max_sessions:
+            self._send(writer, protocol.encode(protocol.ERROR, protocol.SERVER_FULL, tail=b'Too many games'))
+            return None, USER
+        if mode not in (protocol.VS_AI, protocol.VS_HUMAN):
+            self._send(writer, protocol.encode(protocol.ERROR, protocol.BAD_MESSAGE, tail=b'Unknown game mode'))
+            return None, USER
+
+        game_id = next(self._ids)
+        session = self.sessions[game_id] = self._new_session(game_id, mode)
+        game = session.game
+        session.clients[USER] = writer
+        session.apply_preset(USER, preset)
+        self._send(writer, protocol.encode(protocol.JOINED, game_id, USER, game.board.rows, game.board.columns))
+
+        if mode == protocol.VS_AI:
+            session.apply_preset(OPPONENT, protocol.ANY_PRESET)
+            self._start(session)
+        return session, USER
+
+    def _new_session(self, game_id: int, mode: int) -> Session:
+        if mode not in (protocol.VS_AI, protocol.VS_HUMAN):
+            raise Exception(f'Unknown game mode {mode}')
+        game = Stratego(seed=self.seed, game_index=game_id)
+        strategy = None
+        if mode == protocol.VS_AI:
+            strategy = game.strategies[OPPONENT]
+            if strategy is None:
+                strategy = make_strategy('heuristic')
+        return Session(game_id, game, mode, strategy)
+
+    async def _join(self, writer: asyncio.StreamWriter, game_id: int, preset: int) -> tuple[Session | None, int]:
+        session = self.sessions.get(game_id)
+        if session is None or session.mode != protocol.VS_HUMAN:
+            self._send(writer, protocol.encode(protocol.ERROR, protocol.NO_GAME, tail=b'No such game'))
+            return None, USER
+        if session.clients[OPPONENT] is not None or session.started:
+            self._send(writer, protocol.encode(protocol.ERROR, protocol.GAME_FULL, tail=b'Game is full'))
+            return None, USER
+
+        session.clients[OPPONENT] = writer
+        session.apply_preset(OPPONENT, preset)
+        game = session.game
+        self._send(writer, protocol.encode(protocol.JOINED, game_id, OPPONENT, game.board.rows, game.board.columns))
+        self._start(session)
+        return session, OPPONENT
+
+    async def _resume(self, writer: asyncio.StreamWriter, game_id: int, side: int) -> tuple[Session | None, int]:
+        session = self.sessions.get(game_id)
+        if session is None or not session.started or session.finished or side not in (USER, OPPONENT):
+            self._send(writer, protocol.encode(protocol.ERROR, protocol.NO_GAME, tail=b'No such game'))
+            return None, USER
+        if session.clients[side] is not None or (session.mode == protocol.VS_AI and side == OPPONENT):
+            self._send(writer, protocol.encode(protocol.ERROR, protocol.GAME_FULL, tail=b'Seat is taken'))
+            return None, USER
+
+        game = session.game
+        session.clients[side] = writer
+        self._send(writer, protocol.encode(protocol.JOINED, game_id, side, game.board.rows, game.board.columns))
+        self._subscribe(session, side)
+        async with session.lock:
+            # The AI may have been about to move when the game was checkpointed
+            await self._advance(session, hand_over=False)
+        return session, side
+
+    def _start(self, session: Session) -> None:
+        session.game.start_game()
+        session.feed.snapshot()
+        session.started = True
+        if self.checkpoints:
+            self._checkpoint(session)
+        for side, writer in session.clients.items():
+            if writer is not None:
+                self._subscribe(session, side)
+
+    def _subscribe(self, session: Session, side: int) -> None:
+        session.senders[side] = self._sender(session.clients[side])
+        session.feed.subscribe(side, session.senders[side])
+
+    def _leave(self, session: Session, side: int) -> None:
+        session.clients[side] = None
+        if side in session.senders:
+            session.feed.unsubscribe(side, session.senders.pop(side))
+        if not session.finished and session.started:
+            # Leaving a game in progress gives it up
+            winner = OPPONENT if side == USER else USER
+            if session.ai_turn is not None and not session.ai_turn.done():
+                # The AI is still moving on a worker thread, the game ends once its move is in, never before it
+                session.finished = True
+                session.ai_turn.add_done_callback(lambda _: self._finish(session, winner, EndReason.RESIGNED))
+            else:
+                self._finish(session, winner, EndReason.RESIGNED)
+        self._end(session)
+
+    def _end(self, session: Session) -> None:
+        session.finished = True
+        self.sessions.pop(session.game_id, None)
+        if session.strategy is None:
+            return
+        if session.ai_turn is not None and not session.ai_turn.done():
+            # The strategy is still inside play_turn on a worker thread, close it once the turn is over
+            session.ai_turn.add_done_callback(lambda _: session.strategy.close())
+        else:
+            session.strategy.close()
+
+    def _finish(self, session: Session, winner: int, reason: EndReason) -> None:
+        session.finished = True
+        # The feed streams the result to everyone following the game
+        session.game.end_game(winner, reason)
+        # A game with a result is never resumed. Games still going when the server closes keep their checkpoint
+        if self.checkpoints and os.path.exists(self.checkpoint_file(session.game_id)):
+            os.remove(self.checkpoint_file(session.game_id))
+
+    # TURNS
+    async def _human_move(self, session: Session, side: int, source: int, target: int) -> None:
+        writer = session.clients[side]
+        async with session.lock:
+            if not session.started or session.finished or session.turn != side:
+                self._send(writer, protocol.encode(protocol.ERROR, protocol.NOT_YOUR_TURN, tail=b'Not your turn'))
+                return
+            game = session.game
+            columns = game.board.columns
+            source_x, source_y = source % columns, source // columns
+            target_x, target_y = target % columns, target // columns
+            piece = game.board.is_occupied(source_x, source_y)
+            if piece is None or not game.players(side)[0].is_owner(piece) or (target_x, target_y) not in piece.moves:
+                self._send(writer, protocol.encode(protocol.ERROR, protocol.ILLEGAL_MOVE, tail=b'Illegal move'))
+                return
+
+            # The game streams the move to the feed
+            game.take_move(piece, target_x, target_y)
+            game.update_moves()
+            await self._advance(session)
+
+    async def _advance(self, session: Session, hand_over: bool = True) -> None:
+        """
+        Hands the turn over and plays on for the AI and for sides that have to pass, until a human has to move
+        :param session: Game to play on
+        :param hand_over: Whether the side to move just moved, False to carry on with the side to move
+        """
+        game = session.game
+        loop = asyncio.get_running_loop()
+        while True:
+            if hand_over:
+                session.turn = OPPONENT if session.turn == USER else USER
+            hand_over = True
+            if (result := game.check_game_over()) is not None:
+                self._finish(session, *result)
+                return
+            if self.checkpoints:
+                # Nothing touches the game between turns, it can be saved from the event loop
+                self._checkpoint(session)
+
+            own = game.players(session.turn)[0]
+            if session.clients[session.turn] is not None or session.strategy is None:
+                if own.movable_pieces:
+                    return
+                # A human without moves passes
+                session.feed.record_pass(session.turn)
+                continue
+
+            # Everything the strategy touches belongs to this game, so the turn can run off the event loop
+            session.ai_turn = loop.run_in_executor(self._executor, game.play_turn, session.turn, session.strategy)
+            try:
+                report = await session.ai_turn
+            finally:
+                session.ai_turn = None
+            if session.finished:
+                return
+            if report.source is None:
+                session.feed.record_pass(session.turn)
+
+
+if __name__ == "__main__":
+    server_settings = config['server']
+    parser = argparse.ArgumentParser(description='Host Stratego games over TCP')
+    parser.add_argument('--host', default=server_settings['host'])
+    parser.add_argument('--port', type=int, default=server_settings['port'])
+    parser.add_argument('--ai-workers', type=int, default=server_settings['ai_workers'])
+    parser.add_argument('--max-sessions', type=int, default=server_settings['max_sessions'])
+    args = parser.parse_args()
+
+    game_server = GameServer(args.host, args.port, args.ai_workers, args.max_sessions)
+
+    async def main():
+        await game_server.start()
+        print(f'Serving on {game_server.host}:{game_server.port}')
+        await game_server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
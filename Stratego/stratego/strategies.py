@@ -0,0 +1,235 @@
+"""
+Strategies
+
+Move-picking strategies that can play either side of a game. The game loop
+hands a strategy the game, the side to move and a time budget, the strategy
+picks a move and Strategy.play takes it and reports how long the decision
+took. Strategies keep running totals of their timings so they can be compared
+and profiled in both headless runs and the window.
+"""
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+from allocations import CHOOSE, MOVES, TAKE, TURN
+from book import OpeningBook, position_key
+from sampling import RolloutSearch
+
+
+@dataclass(frozen=True)
+class MoveReport:
+    """
+    Result and timing of one move played by a strategy
+
+    Attributes
+    ----------
+    side : int
+        side that moved
+    source : tuple[int, int] | None
+        square the piece moved from, None if the side had no move
+    target : tuple[int, int] | None
+        square the piece moved or attacked to, None if the side had no move
+    outcome : int | None
+        attack outcome of the move, None if the side had no move
+    elapsed : float
+        seconds spent picking the move
+    budget : float | None
+        seconds the strategy was given, None for no limit
+    """
+    side: int
+    source: tuple[int, int] | None
+    target: tuple[int, int] | None
+    outcome: int | None
+    elapsed: float
+    budget: float | None
+
+    @property
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.elapsed > self.budget
+
+
+class Strategy(ABC):
+    """
+    Base class for everything that can pick moves for a side, subclasses implement choose_move
+
+    Attributes
+    ----------
+    name : str
+        name of the strategy, as used in the config file
+    moves : int
+        moves played so far
+    total_time : float
+        seconds spent picking those moves
+    max_time : float
+        longest time spent on a single move
+    overruns : int
+        moves that took longer than their budget
+    """
+    name = 'strategy'
+
+    def __init__(self):
+        self.moves = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.overruns = 0
+
+    @abstractmethod
+    def choose_move(self, game, side: int, deadline: float | None):
+        """
+        Picks a move, moves of every piece are up-to-date when called
+        :param game: Game to move in
+        :param side: Side to move
+        :param deadline: time.perf_counter() value to answer by, None for no limit
+        :return: (piece, (x, y)) to move, None if the side can't move
+        """
+
+    def play(self, game, side: int, budget: float | None = None) -> MoveReport:
+        """
+        Picks a move for a side and takes it
+        :param game: Game to move in
+        :param side: Side to move
+        :param budget: Seconds the strategy may think, None for no limit
+        :return: Report of the move taken
+        """
+        measure = game.allocations.measure
+        with measure(TURN):
+            start = time.perf_counter()
+            with measure(MOVES):
+                game.update_moves()
+            with measure(CHOOSE):
+                choice = self.choose_move(game, side, None if budget is None else start + budget)
+            elapsed = time.perf_counter() - start
+
+            self.moves += 1
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+            report = MoveReport(side, None, None, None, elapsed, budget)
+            if report.over_budget:
+                self.overruns += 1
+
+            if choice is not None:
+                piece, (x, y) = choice
+                source = piece.coords
+                with measure(TAKE):
+                    outcome = game.take_move(piece, x, y)
+                    game.update_moves()
+                report = MoveReport(side, source, (x, y), outcome, elapsed, budget)
+        return report
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.moves if self.moves else 0.0
+
+    def __str__(self):
+        return (f'{self.name}: {self.moves} moves, mean {self.mean_time * 1000:.1f} ms, '
+                f'max {self.max_time * 1000:.1f} ms, {self.overruns} over budget')
+
+    def close(self) -> None:
+        """
+        Releases anything the strategy holds on to, such as worker processes
+        """
+        pass
+
+
+class HeuristicStrategy(Strategy):
+    """
+    The original opponent AI: special captures, scout probes, then pushing pieces forward
+    """
+    name = 'heuristic'
+
+    def choose_move(self, game, side: int, deadline: float | None):
+        return game.heuristic_move(side)
+
+
+class RandomStrategy(Strategy):
+    """
+    Uniformly random legal moves, the baseline every other strategy should beat
+    """
+    name = 'random'
+
+    def choose_move(self, game, side: int, deadline: float | None):
+        return game.random_move(side)
+
+
+class SamplingStrategy(Strategy):
+    """
+    Plays every candidate move on sampled guesses of the hidden enemy pieces and picks the best on average
+    Falls back to the heuristic when no rollout finishes within the budget.
+    """
+    name = 'sampling'
+
+    def __init__(self, search: RolloutSearch = None):
+        super().__init__()
+        self.search = RolloutSearch() if search is None else search
+
+    def choose_move(self, game, side: int, deadline: float | None):
+        candidates = [(piece, move) for piece in game.players(side)[0].movable_pieces for move in piece.moves]
+        if len(candidates) <= 1:
+            return candidates[0] if candidates else None
+
+        scores = self.search.search(game, side, candidates, deadline)
+        if scores is None:
+            return game.heuristic_move(side)
+        return candidates[int(scores.argmax())]
+
+    def close(self) -> None:
+        self.search.close()
+
+
+class BookStrategy(Strategy):
+    """
+    Plays the book move in positions the opening book knows and asks another strategy everywhere else
+
+    Attributes
+    ----------
+    fallback : Strategy
+        strategy used when the book has no move
+    book : OpeningBook
+        opening book to consult
+    plies : int
+        the book is only consulted for this many moves into a game, and only on boards with the book's columns
+    """
+
+    def __init__(self, fallback: Strategy, book: OpeningBook, plies: int):
+        super().__init__()
+        self.name = f'{fallback.name}+book'
+        self.fallback = fallback
+        self.book = book
+        self.plies = plies
+
+    def choose_move(self, game, side: int, deadline: float | None):
+        if game.ply < self.plies and game.board.columns == self.book.columns:
+            entry = self.book.lookup(position_key(game, side))
+            if entry is not None:
+                source, target = entry
+                piece = game.board.is_occupied(*source)
+                # A hash collision could point anywhere, only play the move if it is legal here
+                if piece is not None and game.players(side)[0].is_owner(piece) and target in piece.moves:
+                    return piece, target
+        return self.fallback.choose_move(game, side, deadline)
+
+    def close(self) -> None:
+        self.fallback.close()
+
+
+# Strategies by the name used in the config file
+STRATEGIES = {strategy.name: strategy for strategy in (HeuristicStrategy, RandomStrategy, SamplingStrategy)}
+
+
+def make_strategy(name: str | None, rollout_workers: int | None = None) -> Strategy | None:
+    """
+    Creates a strategy from its name
+    :param name: Name of the strategy, None for a side played by hand
+    :param rollout_workers: Worker processes of the sampling search, 0 to run rollouts in the calling process,
+        None for the configured number
+    :return: New strategy, None for a side played by hand
+    :raises:
+        :exception: Raised if no strategy has the name
+    """
+    if name is None:
+        return None
+    if name not in STRATEGIES:
+        raise Exception(f'Unknown strategy {name}, expected one of {", ".join(STRATEGIES)}')
+    if name == SamplingStrategy.name:
+        return SamplingStrategy(RolloutSearch(workers=rollout_workers))
+    return STRATEGIES[name]()
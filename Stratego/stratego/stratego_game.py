@@ -4,13 +4,80 @@ Stratego
 This class implements the "main" application/Python Arcade class that
 manages drawing, windowing, input, etc.
 """
+import functools
 import random
-import json
+from dataclasses import dataclass, field
+from enum import IntEnum
 
+import outcomes
+from allocations import AllocationProfiler, GAME, RESET
+from batch import DRAW
 from config import config
 from board import Board
 from player import Player
-from pieces import Piece
+from pieces import Piece, army_counts, load_units
+from presets import open_presets
+from events import AllocationsMeasured, EventBus, GameOver, PieceAttacked, PieceCaptured, PieceMoved, \
+    PieceRevealed
+from observation import Observation, OPPONENT, USER, observe
+from records import GameRecordWriter
+from strategies import BookStrategy, MoveReport, Strategy, make_strategy
+from book import open_book
+
+# Order in which the opponent is willing to push pieces forward
+PRIORITY_OF_SACRIFICE = (6, 5, 4, 10, 9, 8, 7, 3, 1, 2)
+
+# Stands for the seed set in the config file, None already means an unseeded game
+CONFIG_SEED = object()
+
+# Seed of the Zobrist keys, fixed so position keys are the same in every process
+ZOBRIST_SEED = 0x5742
+
+
+class EndReason(IntEnum):
+    """
+    Why a game ended, also stored as the reason code of game records
+    """
+    NONE = 0
+    FLAG_CAPTURED = 1
+    NO_FLAGS = 2
+    REPETITION = 3
+    NO_PROGRESS = 4
+    NO_MOVES = 5
+    RESIGNED = 6
+    # Cut off by a harness after a set number of moves, never by the rules of the game
+    PLY_LIMIT = 7
+
+    def __str__(self):
+        return self.name
+
+
+@dataclass
+class MoveBuckets:
+    """
+    Opponent moves sorted by kind, filled by Stratego._classify_moves
+
+    Attributes
+    ----------
+    special : list[tuple[Piece, tuple[int, int]]]
+        attacks where a weaker piece beats a stronger one the side has seen (spy on marshal, miner on bomb)
+    safe_captures : list[tuple[Piece, tuple[int, int]]]
+        attacks on revealed pieces that we beat or trade with
+    probes : list[tuple[Piece, tuple[int, int]]]
+        attacks on hidden pieces
+    other : list[tuple[Piece, tuple[int, int]]]
+        moves onto empty squares
+    forward : dict[int, list[tuple[Piece, tuple[int, int]]]]
+        moves of any kind above that advance down the board, keyed by piece strength
+    candidates : list[tuple[Piece, tuple[int, int]]]
+        every move except the special ones, in move generation order
+    """
+    special: list = field(default_factory=list)
+    safe_captures: list = field(default_factory=list)
+    probes: list = field(default_factory=list)
+    other: list = field(default_factory=list)
+    forward: dict = field(default_factory=dict)
+    candidates: list = field(default_factory=list)
 
 
 class Stratego:
@@ -19,92 +86,375 @@ class Stratego:
     This implements the event handling/callbacks
     """
 
-    def __init__(self):
-        self.user = Player("CS3050 Testing Team")
-        self.opponent = Player("Sarge")
-        self.board = Board(config['board']['rows'], config['board']['columns'], self.user, self.opponent)
-        self.presets = load_presets(config['presets']['data_file'])
+    def __init__(self, seed: int | None = CONFIG_SEED, game_index: int = 0, rows: int = None, columns: int = None,
+                 setup_rows: int = None):
+        """
+        :param seed: Master seed for the game's random stream, None for an unseeded game, defaults to the configured seed
+        :param game_index: Index of this game under the master seed
+        :param rows: Board rows, defaults to the configured board
+        :param columns: Board columns, defaults to the configured board
+        :param setup_rows: Rows of each side's setup zone, defaults to the configured board
+        """
+        if seed is CONFIG_SEED:
+            seed = config['seed']
+        self.master_seed = seed
+        self.game_index = game_index
+        self.rng = game_rng(seed, game_index)
+
+        rows = config['board']['rows'] if rows is None else rows
+        columns = config['board']['columns'] if columns is None else columns
+        setup_rows = config['board']['setup_rows'] if setup_rows is None else setup_rows
+        if 2 * setup_rows > rows:
+            raise Exception(f'Setup zones of {setup_rows} rows do not fit a board of {rows} rows')
+        self.setup_rows = setup_rows
+        # The configured army scaled to fill a setup zone
+        self.army = army_counts(columns, setup_rows)
+
+        self.user = Player("CS3050 Testing Team", self.army)
+        self.opponent = Player("Sarge", self.army)
+        self.board = Board(rows, columns, self.user, self.opponent, setup_rows=setup_rows)
+        self.presets = open_presets()
+        self.recorder: GameRecordWriter | None = None
+        # Everything that happens on the board, for the UI, recording, remote clients and metrics to follow
+        self.events = EventBus()
+        # Memory allocated by games, turns and their phases, only measured once started
+        self.allocations = AllocationProfiler()
+        self.profile_games = config['profiling']['allocations']
+
+        # Strategies playing each side, None for a side played by hand
+        self.strategies: dict[int, Strategy | None] = {
+            USER: make_strategy(config['strategies']['user']),
+            OPPONENT: make_strategy(config['strategies']['opponent']),
+        }
+        self.move_budget = config['strategies']['move_budget']
+        if config['book']['enabled'] and self.strategies[OPPONENT] is not None:
+            # Common openings cost a lookup instead of a search
+            self.strategies[OPPONENT] = BookStrategy(self.strategies[OPPONENT], open_book(), config['book']['plies'])
+
+        # Draw rules
+        self.max_repetitions = config['rules']['max_repetitions']
+        self.no_capture_limit = config['rules']['no_capture_limit']
+        self.ply = 0
+        self.plies_since_capture = 0
+        self.position_counts: dict[int, int] = {}
+        self._position_hash = 0
+        # What each viewpoint may know about the current position, by (viewpoint, reveal)
+        self._observations: dict[tuple[int, bool], Observation] = {}
 
     def reset_pieces(self) -> None:
-        self.user.reset_pieces()
-        self.opponent.reset_pieces()
-        self.board.reset_pieces()
+        # Every new game gets the next random stream under the master seed
+        self.game_index += 1
+        self.rng = game_rng(self.master_seed, self.game_index)
+
+        with self.allocations.measure(RESET):
+            self.user.reset_pieces()
+            self.opponent.reset_pieces()
+            self.board.reset_pieces()
+        self.ply = 0
+        self.plies_since_capture = 0
+        self.position_counts = {}
+        self._position_hash = 0
+        self.clear_observations()
+
+    def start_game(self) -> None:
+        """
+        Starts tracking a game once both setups are on the board
+        :return: None
+        """
+        self.ply = 0
+        self.plies_since_capture = 0
+        self.rehash()
+        self.position_counts = {self.position_key(): 1}
+        self.clear_observations()
+        if self.profile_games:
+            # Every game is traced on its own, end_game reports it
+            self.allocations.stop()
+            self.allocations.reset()
+            self.allocations.start()
+        self.allocations.end(GAME)
+        self.allocations.begin(GAME)
+        self.update_moves()
+
+    def observe(self, viewpoint: int, reveal: bool = False) -> Observation:
+        """
+        What a viewpoint may know about the current position, built once per position and shared by every caller
+        :param viewpoint: USER, OPPONENT or PUBLIC
+        :param reveal: Show every rank, for debugging
+        :return: Immutable observation
+        """
+        key = viewpoint, reveal
+        observation = self._observations.get(key)
+        if observation is None:
+            observation = self._observations[key] = observe(self, viewpoint, reveal)
+        return observation
+
+    def clear_observations(self) -> None:
+        """
+        Drops the cached observations, needed whenever pieces are changed without take_move
+        :return: None
+        """
+        self._observations.clear()
+
+    def _square_key(self, piece: Piece, side: int) -> int:
+        if piece.x_pos is None:
+            return 0
+        keys = zobrist_keys(self.board.rows * self.board.columns)
+        square = piece.y_pos * self.board.columns + piece.x_pos
+        return keys[(side * len(load_units()) + piece.strength) * self.board.rows * self.board.columns + square]
+
+    def rehash(self) -> None:
+        """
+        Recomputes the position hash from scratch, needed whenever pieces are placed without take_move
+        :return: None
+        """
+        self._position_hash = 0
+        for side, player in ((USER, self.user), (OPPONENT, self.opponent)):
+            for piece in player.alive_pieces:
+                self._position_hash ^= self._square_key(piece, side)
+
+    @property
+    def position_hash(self) -> int:
+        """
+        Zobrist hash of the pieces alone, position_key adds the side to move
+        """
+        return self._position_hash
+
+    @position_hash.setter
+    def position_hash(self, value: int):
+        self._position_hash = value
+
+    def position_key(self) -> int:
+        """
+        Zobrist hash of the rank and side on every square, together with whose turn it is.
+        Kept up to date by take_move, so it costs nothing to look up.
+        """
+        if self.ply % 2:
+            return self._position_hash ^ zobrist_keys(self.board.rows * self.board.columns)[-1]
+        return self._position_hash
+
+    def check_game_over(self) -> tuple[int, EndReason] | None:
+        """
+        Checks every way the game can end. Assumes moves are up-to-date.
+        :return: (winner, reason) if the game is over, None otherwise
+        """
+        user_flag = self.user.has_flag
+        opponent_flag = self.opponent.has_flag
+        if user_flag and not opponent_flag:
+            return USER, EndReason.FLAG_CAPTURED
+        elif opponent_flag and not user_flag:
+            return OPPONENT, EndReason.FLAG_CAPTURED
+        elif not user_flag and not opponent_flag:
+            return DRAW, EndReason.NO_FLAGS
+        elif not self.user.movable_pieces and not self.opponent.movable_pieces:
+            return DRAW, EndReason.NO_MOVES
+        elif self.position_counts.get(self.position_key(), 0) >= self.max_repetitions:
+            return DRAW, EndReason.REPETITION
+        elif self.plies_since_capture >= self.no_capture_limit:
+            return DRAW, EndReason.NO_PROGRESS
+        return None
+
+    def side_of(self, piece: Piece) -> int:
+        return USER if self.user.is_owner(piece) else OPPONENT
+
+    def players(self, side: int) -> tuple[Player, Player]:
+        """
+        :param side: USER or OPPONENT
+        :return: (own player, enemy player) of the side
+        """
+        if side == USER:
+            return self.user, self.opponent
+        return self.opponent, self.user
+
+    def take_move(self, piece: Piece, x: int, y: int) -> int:
+        """
+        Moves a piece to a square, attacking whatever enemy piece stands there
+        Assumes the move is valid. Every move of a game goes through here and is published on the game's events.
+        :param piece: Piece to move
+        :param x: x-coordinate to move to
+        :param y: y-coordinate to move to
+        :return: Attack outcome, NO_ATTACK for a plain move
+        """
+        source = piece.coords
+        target = self.board.is_occupied(x, y)
+        side = self.side_of(piece)
+        # Take both pieces out of the hash and put back whatever is left of them after the move
+        changed = self._square_key(piece, side)
+        if target is not None:
+            changed ^= self._square_key(target, 1 - side)
+        attacker_hidden = piece.is_hidden
+        defender_hidden = target is not None and target.is_hidden
+        # Both players see the piece move, which rules out some ranks for it
+        piece.has_moved = True
+        if abs(x - source[0]) + abs(y - source[1]) > 1:
+            piece.has_moved_far = True
+        if target is None:
+            outcome = outcomes.NO_ATTACK
+            piece.move(x, y)
+        else:
+            outcome = outcomes.resolve(piece, target)
+            piece.attack(target)
+        changed ^= self._square_key(piece, side)
+        if target is not None:
+            changed ^= self._square_key(target, 1 - side)
+        self._position_hash ^= changed
+
+        self.ply += 1
+        if outcome == outcomes.NO_ATTACK:
+            self.plies_since_capture += 1
+        else:
+            # Earlier positions had more pieces, they can never come back
+            self.plies_since_capture = 0
+            self.position_counts.clear()
+        key = self.position_key()
+        self.position_counts[key] = self.position_counts.get(key, 0) + 1
+        self.clear_observations()
+
+        # Published once the game is consistent again, so subscribers can look at it
+        events = self.events
+        if target is None:
+            events.publish(PieceMoved(self, side, piece, source, (x, y)))
+        else:
+            events.publish(PieceAttacked(self, side, piece, target, source, (x, y), outcome))
+            for loser, owner, square in ((piece, side, source), (target, 1 - side, (x, y))):
+                if loser.is_captured:
+                    events.publish(PieceCaptured(self, owner, loser, square))
+            for winner, owner, was_hidden in ((piece, side, attacker_hidden), (target, 1 - side, defender_hidden)):
+                if was_hidden and not winner.is_hidden:
+                    events.publish(PieceRevealed(self, owner, winner))
+        return outcome
+
+    def end_game(self, winner: int, reason: int) -> None:
+        """
+        Announces the result of the game to every subscriber of its events
+        :param winner: USER, OPPONENT or DRAW
+        :param reason: EndReason of the result
+        :return: None
+        """
+        self.events.publish(GameOver(self, winner, int(reason)))
+        if self.allocations.end(GAME) is not None:
+            self.events.publish(AllocationsMeasured(self, self.allocations.snapshot()))
+            if self.profile_games:
+                print(f'Allocations of game {self.game_index}, KiB\n{self.allocations.report()}')
+        if self.profile_games:
+            self.allocations.stop()
+
+    def start_recording(self, recorder: GameRecordWriter) -> None:
+        """
+        Starts recording the current game, both setups must already be on the board.
+        The recording follows the game's events and ends with the game.
+        :param recorder: Writer to stream the game into
+        :return: None
+        """
+        self.recorder = recorder
+        setup = [(self.side_of(piece), piece.x_pos, piece.y_pos, piece.strength)
+                 for piece in self.board.alive_pieces if piece.x_pos is not None]
+        recorder.begin_game(setup)
+        self.events.subscribe(PieceMoved, self._record_move)
+        self.events.subscribe(PieceAttacked, self._record_move)
+        self.events.subscribe(GameOver, self._record_end)
+
+    def _record_move(self, event: PieceMoved | PieceAttacked) -> None:
+        outcome = event.outcome if isinstance(event, PieceAttacked) else outcomes.NO_ATTACK
+        self.recorder.record_move(event.side, event.source, event.target, outcome)
+
+    def _record_end(self, event: GameOver) -> None:
+        self.finish_recording(event.winner, event.reason)
+
+    def finish_recording(self, winner: int, reason: int = 0) -> None:
+        if self.recorder is not None:
+            self.recorder.end_game(winner, reason)
+            self.recorder = None
+        for event_type in (PieceMoved, PieceAttacked):
+            self.events.unsubscribe(event_type, self._record_move)
+        self.events.unsubscribe(GameOver, self._record_end)
+
+    def close_strategies(self) -> None:
+        """
+        Releases the worker processes of both sides' strategies once a game is over.
+        Strategies start new workers if they are asked for another move.
+        :return: None
+        """
+        for strategy in self.strategies.values():
+            if strategy is not None:
+                strategy.close()
 
     def update_moves(self):
         # Get moves for each live piece
-        for piece in self.board.alive_pieces:
-            self.board.get_moves(piece)
-
-    def _apply_preset(self, preset_index: int, pieces: list[any], rows: range):
-        preset = self.presets[preset_index]
-        for i, piece_name in enumerate(preset):
-            good = False
-            for j, piece in enumerate(pieces[i:]):
-                if piece.name == piece_name:
-                    index = j + i
-                    # Swap the two pieces
-                    pieces[i], pieces[index] = pieces[index], pieces[i]
-
-                    good = True
-                    break
-            if not good:
-                raise Exception(f'Invalid piece preset {preset_index}. Could not find position for {piece_name}, {i}')
+        self.board.update_moves()
 
-        index = 0
+    def _apply_preset(self, preset_index: int, pieces: list[Piece], rows: range):
+        order = self.presets[preset_index].order
+        if len(order) != len(pieces):
+            raise Exception(f'Preset {preset_index} places {len(order)} pieces, the army has {len(pieces)}')
+        slot = 0
         for y in rows:
             for x in range(self.board.columns):
-                piece = pieces[index]
+                piece = pieces[order[slot]]
                 piece.x_pos = x
                 piece.y_pos = y
                 self.board.pieces.append(piece)
-                index += 1
+                slot += 1
+        self.clear_observations()
+
+    def setup_zone(self, side: int) -> range:
+        """
+        Rows of a side's setup zone, in the order presets fill them
+        :param side: USER or OPPONENT
+        :return: Range of row indices
+        """
+        if side == USER:
+            return range(0, self.setup_rows)
+        return range(self.board.rows - 1, self.board.rows - 1 - self.setup_rows, -1)
 
     def apply_user_preset(self, preset_index: int):
-        self._apply_preset(preset_index, self.user.alive_pieces, range(0, 4))
+        self._apply_preset(preset_index, self.user.alive_pieces, self.setup_zone(USER))
 
     def apply_opponent_preset(self, preset_index: int):
-        self._apply_preset(preset_index, self.opponent.alive_pieces, range(9, 5, -1))
+        self._apply_preset(preset_index, self.opponent.alive_pieces, self.setup_zone(OPPONENT))
 
-    def shortest_path(self, hvt, movable_pieces) -> tuple[Piece, tuple[int, int]] | None:
+    def shortest_path(self, hvt, movable_pieces, side: int = OPPONENT) -> tuple[Piece, tuple[int, int]] | None:
         """
         BFS-style algorithm that finds a move that brings a Piece closest to an HVT.
         :param hvt: Targeted Piece
         :param movable_pieces: List of movable Pieces
+        :param side: Side the movable pieces belong to
         :return:
         """
+        own = self.players(side)[0]
+        # Enemy pieces whose rank the side has seen
+        visible_enemies = self.observe(side).visible_enemies
+
         # Initialize temporary variable of path to return to user
         path_to_move = None
 
         # Only engage if able and if HVT is stronger than a Scout
         if movable_pieces and hvt.strength > 2:
+            # A piece that can already reach the HVT beats any longer path
+            for c_piece in movable_pieces:
+                if self.board.threatens(c_piece, hvt.x_pos, hvt.y_pos):
+                    return c_piece, hvt.coords
 
             current_breath = []
             next_breath = []
             invalid_sq = []
-            invalid_sq_path = []
             capture_moves = []
             invalid_sq_piece = []
             dist = 1
             move_found = False
 
-            # Add out-of-bounds squares to invalid_sq
-            invalid_indices = (-1, 10)
-            for y in range(self.board.rows):
-                invalid_sq.append((invalid_indices[0], y))
-                invalid_sq.append((invalid_indices[1], y))
-            for x in range(self.board.columns):
-                invalid_sq.append((x, invalid_indices[0]))
-                invalid_sq.append((x, invalid_indices[1]))
-
-            # Add all opponent piece coordinates to invalid_sq - can't attack ourselves!
-            for piece in self.opponent.alive_pieces:
+            # Add all of our own piece coordinates to invalid_sq - can't attack ourselves!
+            # Off-board squares and lakes never come up, the neighbor table leaves them out
+            for piece in own.alive_pieces:
                 invalid_sq.append(piece.coords)
+            invalid_sq = set(invalid_sq)
+            neighbors = self.board.geometry.neighbors
 
             for c_piece in movable_pieces:
                 # Make sure we don't set a path through pieces we can't capture
-                for user_piece in self.user.visible_pieces:
-                    if user_piece.strength > c_piece.strength:
-                        invalid_sq_piece.append(user_piece.coords)
+                for enemy_piece in visible_enemies:
+                    if outcomes.resolve(c_piece, enemy_piece) == outcomes.DEFENDER_WINS:
+                        invalid_sq_piece.append(enemy_piece.coords)
+                blocked = invalid_sq.union(invalid_sq_piece)
 
                 for move in c_piece.moves:
                     if move == hvt.coords:
@@ -113,7 +463,8 @@ class Stratego:
                     # Can't capture HVT directly, explore moves that lead towards it
                     else:
                         current_breath.append(move)
-                        invalid_sq_path.append(move)
+                        # Squares already on the path
+                        visited = {move}
                         # Enter loop to evaluate all possible movement from
                         while len(current_breath) > 0 and not move_found:
                             # Increment distance (moves from current piece)
@@ -121,28 +472,12 @@ class Stratego:
 
                             # Evaluate current layer of attacks (certain distance away)
                             for b_move in current_breath:
-                                x_to_check = b_move[0]
-                                y_to_check = b_move[1]
-                                # Check above coords
-                                if (x_to_check, y_to_check + 1) not in (
-                                        invalid_sq + invalid_sq_piece + invalid_sq_path):  # If move is not invalid, then append to next_breath.
-                                    next_breath.append((x_to_check, y_to_check + 1))
-                                    invalid_sq_path.append((x_to_check, y_to_check + 1))
-                                # Check below coords
-                                if (x_to_check, y_to_check - 1) not in (
-                                        invalid_sq + invalid_sq_piece + invalid_sq_path):  # If move is not invalid, then append to next_breath.
-                                    next_breath.append((x_to_check, y_to_check - 1))
-                                    invalid_sq_path.append((x_to_check, y_to_check - 1))
-                                # Check left coords
-                                if (x_to_check - 1, y_to_check) not in (
-                                        invalid_sq + invalid_sq_piece + invalid_sq_path):  # If move is not invalid, then append to next_breath.
-                                    next_breath.append((x_to_check - 1, y_to_check))
-                                    invalid_sq_path.append((x_to_check - 1, y_to_check))
-                                # Check right coords
-                                if (x_to_check + 1, y_to_check) not in (
-                                        invalid_sq + invalid_sq_piece + invalid_sq_path):  # If move is not invalid, then append to next_breath.
-                                    next_breath.append((x_to_check + 1, y_to_check))
-                                    invalid_sq_path.append((x_to_check + 1, y_to_check))
+                                # Check above, below, left and right coords
+                                for square in neighbors[b_move]:
+                                    if square not in blocked and square not in visited:
+                                        # If move is not invalid, then append to next_breath.
+                                        next_breath.append(square)
+                                        visited.add(square)
 
                             # Clear all current breath nodes
                             current_breath.clear()
@@ -164,9 +499,6 @@ class Stratego:
                     current_breath.clear()
                     move_found = False
 
-                    # Wipe all invalid spaces for the path
-                    invalid_sq_path.clear()
-
                 # Wipe all invalid spaces for the individual piece
                 invalid_sq_piece.clear()
 
@@ -181,28 +513,86 @@ class Stratego:
                 path_to_move = (current_move[0], current_move[1])
         return path_to_move
 
+    def _classify_moves(self, movable_pieces: list[Piece], side: int = OPPONENT) -> MoveBuckets:
+        """
+        Walks every move of a side's movable pieces once and sorts them into buckets
+        :param movable_pieces: Pieces the side can move
+        :param side: Side the movable pieces belong to
+        :return: Buckets of (piece, move) pairs, each in move generation order
+        """
+        buckets = MoveBuckets()
+        # Moves only ever lead onto empty squares or enemy pieces, ranks the side hasn't seen are None
+        occupied = self.observe(side).squares
+        # The opponent starts at the top of the board, the user at the bottom
+        direction = 1 if side == USER else -1
+
+        for piece in movable_pieces:
+            for move in piece.moves:
+                piece_move = (piece, move)
+                target = occupied.get(move)
+                if target is None:
+                    buckets.other.append(piece_move)
+                elif target.strength is None:
+                    buckets.probes.append(piece_move)
+                else:
+                    outcome = outcomes.resolve(piece, target)
+                    # Weaker piece beating a stronger one: spy on marshal or miner on bomb
+                    if outcome == outcomes.ATTACKER_WINS and target.strength > piece.strength:
+                        buckets.special.append(piece_move)
+                        continue
+                    # Known piece we would lose to
+                    if outcome == outcomes.DEFENDER_WINS:
+                        continue
+                    buckets.safe_captures.append(piece_move)
+
+                buckets.candidates.append(piece_move)
+                if (move[1] - piece.y_pos) * direction > 0:
+                    buckets.forward.setdefault(piece.strength, []).append(piece_move)
+
+        return buckets
+
     def opponent_turn(self) -> tuple[tuple[int, int] | None, tuple[int, int] | None]:
         """
         If it's dumb it should at least be threateningly dumb.
             - Sam Clear
-        :return: None
+        :return: (square moved from, square moved to), (None, None) if the opponent can't move
         """
-        # Generate moves for new board state
-        self.update_moves()
+        report = self.play_turn(OPPONENT)
+        return report.source, report.target
+
+    def play_turn(self, side: int, strategy: Strategy | None = None) -> MoveReport:
+        """
+        Lets a strategy play one move for a side
+        :param side: Side to move
+        :param strategy: Strategy to play with, defaults to the side's configured strategy
+        :return: Report of the move taken
+        :raises:
+            :exception: Raised if the side has no strategy and is played by hand
+        """
+        if strategy is None:
+            strategy = self.strategies[side]
+        if strategy is None:
+            raise Exception(f'Side {side} is played by hand')
+        return strategy.play(self, side, self.move_budget)
 
-        # Create temporary variable for current piece to move's current position
-        previous_pos = None
+    def heuristic_move(self, side: int) -> tuple[Piece, tuple[int, int]] | None:
+        """
+        Picks a move for a side using the opponent heuristics. Assumes moves are up-to-date.
+        :param side: Side to move
+        :return: (piece, (x, y)) to move, None if the side can't move
+        """
+        own = self.players(side)[0]
 
         # Creating variable to place next move
         move_to_take = None
 
-        # Find all the pieces that can be moved by the opponent
-        movable_pieces = self.opponent.movable_pieces
+        # Find all the pieces that can be moved by the side
+        movable_pieces = own.movable_pieces
 
         # If we can't move: why bother?
         if not movable_pieces:
             # Do nothing
-            return None, None
+            return None
 
         # Find the strongest movable piece's strength
         greatest_movable_strength = 1
@@ -210,12 +600,12 @@ class Stratego:
             if piece.strength > greatest_movable_strength:
                 greatest_movable_strength = piece.strength
 
-        # Find the strongest piece on the user's side that the opponent can capture (and can see)
+        # Find the strongest enemy piece that we can capture (and can see)
         # Placeholder variable for strongest piece to-capture
         high_val_target = None
 
-        # Find possible pieces to capture
-        viable_targets = self.user.visible_pieces
+        # Find possible pieces to capture, only the ones the side has seen
+        viable_targets = self.observe(side).visible_enemies
 
         # Find the highest-strength piece that we can capture
         for piece in viable_targets:
@@ -238,78 +628,77 @@ class Stratego:
                     capturing_pieces.append(piece)
 
             # Return either no move, or a move which the opponent will take
-            move_to_take = self.shortest_path(high_val_target, capturing_pieces)
-            if move_to_take is not None:
-                previous_pos = move_to_take[0].coords
+            move_to_take = self.shortest_path(high_val_target, capturing_pieces, side)
 
-        # Get moves that result in taking the player's piece. Prioritize backstabbing marshals and defusing bombs
-        possible_opponent_moves = []
-        for piece in movable_pieces:
-            for move in piece.moves:
-                possible_piece_to_attack = self.board.is_occupied(move[0], move[1])
-                if possible_piece_to_attack is not None:
-                    if (possible_piece_to_attack not in self.opponent.alive_pieces) and ((piece.strength == 3 and possible_piece_to_attack.strength == 11) or (piece.strength == 1 and possible_piece_to_attack.strength == 10)):
-                        move_to_take = (piece, move)
-                        previous_pos = piece.coords
-                    elif not possible_piece_to_attack.is_hidden:
-                        if possible_piece_to_attack.strength <= piece.strength:
-                            possible_opponent_moves.append((piece, move))
-                    else:
-                        possible_opponent_moves.append((piece, move))
-                else:
-                    possible_opponent_moves.append((piece, move))
+        # Sort every candidate move into buckets in a single pass
+        buckets = self._classify_moves(movable_pieces, side)
+
+        # Prioritize backstabbing marshals and defusing bombs
+        if buckets.special:
+            move_to_take = buckets.special[-1]
 
         # Currently, pick first scout's move that attacks a new opponent. If there are no scouts, then
         # send moves from marshal to decreasing ranks.
         # Choice #1: Find a scout that can attack another piece
+        # Scouting is wasted if the unit is not hidden
         if move_to_take is None:
-            for piece_move in possible_opponent_moves:
+            for piece_move in reversed(buckets.probes):
                 if piece_move[0].move_limit is None:
-                    attacked_piece = self.board.is_occupied(piece_move[1][0], piece_move[1][1])
-                    if attacked_piece is not None:
-                        # Scouting is wasted if the unit is not hidden
-                        if attacked_piece.is_hidden:
-                            move_to_take = piece_move
-                            previous_pos = move_to_take[0].coords
+                    move_to_take = piece_move
+                    break
 
         # Choice #2: Cautious attacking
+        # Moves down board, and is as strong as the move strength limit
         if move_to_take is None:
-            priority_of_sacrifice = [6, 5, 4, 10, 9, 8, 7, 3, 1, 2]
-            iterator_move = 0
-            while move_to_take is None and iterator_move < 10:
-                for piece_move in possible_opponent_moves:
-                    # Moves down board, and is as strong as the move strength limit
-                    if piece_move[0].strength == priority_of_sacrifice[iterator_move] and piece_move[0].y_pos > piece_move[1][1]:
-                        move_to_take = piece_move
-                        previous_pos = move_to_take[0].coords
-                iterator_move += 1
+            for strength in PRIORITY_OF_SACRIFICE:
+                if strength in buckets.forward:
+                    move_to_take = buckets.forward[strength][-1]
+                    break
 
         # Choice #3: Make a move
+        if move_to_take is None and buckets.candidates:
+            move_to_take = buckets.candidates[self.rng.randint(0, len(buckets.candidates) - 1)]
+
+        # Choice #4: Every move runs into a known stronger piece, but a side that can move has to
         if move_to_take is None:
-            move_to_take = possible_opponent_moves[random.randint(0, len(possible_opponent_moves) - 1)]
-            previous_pos = move_to_take[0].coords
+            move_to_take = self.random_move(side)
 
-        # Determine whether the move requires the user to make an attack or move, then take the move
-        user_piece_to_attack = self.board.is_occupied(move_to_take[1][0], move_to_take[1][1])
-        if user_piece_to_attack is None:
-            move_to_take[0].move(move_to_take[1][0], move_to_take[1][1])
-        else:
-            move_to_take[0].attack(user_piece_to_attack)
+        return move_to_take
 
-        # Update the board state and return
-        self.update_moves()
-        return previous_pos, move_to_take[1]
+    def random_move(self, side: int) -> tuple[Piece, tuple[int, int]] | None:
+        """
+        Picks a uniformly random legal move for a side. Assumes moves are up-to-date.
+        :param side: Side to move
+        :return: (piece, (x, y)) to move, None if the side can't move
+        """
+        candidates = [(piece, move) for piece in self.players(side)[0].movable_pieces for move in piece.moves]
+        if not candidates:
+            return None
+        return candidates[self.rng.randint(0, len(candidates) - 1)]
 
 
-def load_presets(name: str) -> dict[int, list[str]]:
-    with open(name, 'r') as file:
-        presets_file = json.load(file)
+@functools.cache
+def zobrist_keys(squares: int) -> tuple[int, ...]:
+    """
+    Random 64 bit keys for every (side, rank, square), plus a last key for the side to move
+    :param squares: Squares on the board
+    :return: Flat tuple of keys, indexed by (side * ranks + rank) * squares + square
+    """
+    rng = random.Random(ZOBRIST_SEED)
+    return tuple(rng.getrandbits(64) for _ in range(2 * len(load_units()) * squares + 1))
 
-    presets = {}
-    for preset in presets_file:
-        presets[preset['index']] = preset['layout']
 
-    return presets
+def game_rng(master_seed: int | None, game_index: int) -> random.Random:
+    """
+    Creates the random stream for one game. The same master seed and index always give the same stream,
+    so any single game out of a large run can be replayed on its own.
+    :param master_seed: Seed shared by a whole run, None for an unseeded stream
+    :param game_index: Index of the game within the run
+    :return: Random number generator owned by the game
+    """
+    if master_seed is None:
+        return random.Random()
+    return random.Random(f'{master_seed}:{game_index}')
 
 
 game = Stratego()
@@ -0,0 +1,175 @@
+"""
+Sync
+
+Keeps remote players and spectators in step with a game by streaming deltas
+instead of boards. The feed follows the game's events, and every move taken
+by the game becomes one fixed-size MOVED
+frame per viewpoint: the side that moved, the squares, the attack outcome and
+the ranks that viewpoint is allowed to see. Captures and reveals follow from
+the outcome, so a frame costs the same on any board size.
+
+Every few plies the feed keeps a full snapshot of the board for each
+viewpoint. A client subscribing late gets the last snapshot and the frames
+since, then follows the live stream. Spectators watch from the PUBLIC
+viewpoint, which only shows ranks both players have seen, and can subscribe to
+as many games as they like.
+"""
+import threading
+from typing import Callable
+
+import outcomes
+import protocol
+from config import config
+from events import GameOver, PieceAttacked, PieceMoved
+from observation import OPPONENT, PUBLIC, USER
+
+VIEWPOINTS = (USER, OPPONENT, PUBLIC)
+
+
+def encode_board(game, viewpoint: int) -> bytes:
+    """
+    Encodes the board as a viewpoint sees it, one byte per square.
+    Spectators see the board from the user's seat, user pieces nobody has seen are OWN_HIDDEN.
+    :param game: Game to encode
+    :param viewpoint: USER, OPPONENT or PUBLIC
+    :return: Square codes in square index order
+    """
+    columns = game.board.columns
+    squares = bytearray([protocol.EMPTY]) * (game.board.rows * columns)
+    for x, y in game.board.lakes:
+        squares[y * columns + x] = protocol.LAKE
+    observation = game.observe(viewpoint)
+    for piece in observation.own:
+        code = protocol.OWN_HIDDEN if piece.strength is None else piece.strength
+        squares[piece.y_pos * columns + piece.x_pos] = code
+    for piece in observation.enemy:
+        code = protocol.HIDDEN if piece.strength is None else protocol.REVEALED + piece.strength
+        squares[piece.y_pos * columns + piece.x_pos] = code
+    return bytes(squares)
+
+
+class GameFeed:
+    """
+    Delta stream of one game, with a snapshot for late subscribers
+
+    Attributes
+    ----------
+    game_id : int
+        id of the game, sent in every frame so one connection can follow many games
+    game : Stratego
+        game being streamed
+    snapshot_interval : int
+        frames between snapshots, also the most frames a late subscriber is sent to catch up
+    turn : int
+        side to move next
+    """
+
+    def __init__(self, game_id: int, game, snapshot_interval: int = None):
+        self.game_id = game_id
+        self.game = game
+        self.snapshot_interval = config['sync']['snapshot_interval'] if snapshot_interval is None \
+            else snapshot_interval
+        self.turn = USER
+        self._subscribers: dict[int, dict[Callable[[bytes], None], None]] = {viewpoint: {}
+                                                                              for viewpoint in VIEWPOINTS}
+        self._snapshots: dict[int, bytes] = {}
+        self._backlog: dict[int, list[bytes]] = {viewpoint: [] for viewpoint in VIEWPOINTS}
+        # Moves can be taken on a worker thread while clients subscribe on the event loop
+        self._lock = threading.Lock()
+        # The game only holds on to the feed weakly, it stops streaming once nobody keeps it
+        game.events.subscribe(PieceMoved, self._moved)
+        game.events.subscribe(PieceAttacked, self._attacked)
+        game.events.subscribe(GameOver, self._game_over)
+
+    def _moved(self, event: PieceMoved) -> None:
+        # A plain move doesn't change what the enemy knows about the piece
+        self.record_move(event.side, event.source, event.target, outcomes.NO_ATTACK, event.piece.strength, None,
+                         not event.piece.is_hidden)
+
+    def _attacked(self, event: PieceAttacked) -> None:
+        self.record_move(event.side, event.source, event.target, event.outcome, event.attacker.strength,
+                         event.defender.strength, True)
+
+    def _game_over(self, event: GameOver) -> None:
+        self.record_end(event.winner, event.reason)
+
+    def snapshot(self) -> None:
+        """
+        Takes a full snapshot of the board for every viewpoint and drops the frames before it
+        :return: None
+        """
+        with self._lock:
+            self._snapshot()
+
+    def _snapshot(self) -> None:
+        for viewpoint in VIEWPOINTS:
+            self._snapshots[viewpoint] = protocol.encode(protocol.SNAPSHOT, self.game_id, self.game.ply, self.turn,
+                                                         viewpoint, tail=encode_board(self.game, viewpoint))
+            self._backlog[viewpoint].clear()
+
+    def subscribe(self, viewpoint: int, send: Callable[[bytes], None]) -> None:
+        """
+        Sends a subscriber the last snapshot and the frames since, then every new frame
+        :param viewpoint: USER, OPPONENT or PUBLIC
+        :param send: Called with every frame, from whichever thread took the move
+        :return: None
+        """
+        with self._lock:
+            if viewpoint in self._snapshots:
+                send(self._snapshots[viewpoint])
+            for frame in self._backlog[viewpoint]:
+                send(frame)
+            self._subscribers[viewpoint][send] = None
+
+    def unsubscribe(self, viewpoint: int, send: Callable[[bytes], None]) -> None:
+        with self._lock:
+            self._subscribers[viewpoint].pop(send, None)
+
+    def _publish(self, frames: dict[int, bytes]) -> None:
+        with self._lock:
+            for viewpoint, frame in frames.items():
+                self._backlog[viewpoint].append(frame)
+                for send in self._subscribers[viewpoint]:
+                    send(frame)
+            if len(self._backlog[PUBLIC]) >= self.snapshot_interval:
+                self._snapshot()
+
+    def record_move(self, side: int, source: tuple[int, int], target: tuple[int, int], outcome: int,
+                    attacker: int, defender: int | None, attacker_seen: bool) -> None:
+        """
+        Streams a move taken by the game to every viewpoint
+        :param side: Side that moved
+        :param source: Square moved from
+        :param target: Square moved to
+        :param outcome: Attack outcome, NO_ATTACK for a plain move
+        :param attacker: Rank of the piece that moved
+        :param defender: Rank of the attacked piece, None for a plain move
+        :param attacker_seen: Whether the enemy had already seen the rank of the piece that moved
+        :return: None
+        """
+        columns = self.game.board.columns
+        source_square = source[1] * columns + source[0]
+        target_square = target[1] * columns + target[0]
+        frames = {}
+        for viewpoint in VIEWPOINTS:
+            if outcome != outcomes.NO_ATTACK:
+                # An attack shows both ranks to everyone
+                ranks = attacker, defender
+            elif viewpoint == side or attacker_seen:
+                ranks = attacker, protocol.NO_RANK
+            else:
+                ranks = protocol.NO_RANK, protocol.NO_RANK
+            frames[viewpoint] = protocol.encode(protocol.MOVED, self.game_id, self.game.ply, side,
+                                                source_square, target_square, outcome, *ranks)
+        self.turn = 1 - side
+        self._publish(frames)
+
+    def record_pass(self, side: int) -> None:
+        frame = protocol.encode(protocol.MOVED, self.game_id, self.game.ply, side, protocol.NO_SQUARE,
+                                protocol.NO_SQUARE, outcomes.NO_ATTACK, protocol.NO_RANK, protocol.NO_RANK)
+        self.turn = 1 - side
+        self._publish({viewpoint: frame for viewpoint in VIEWPOINTS})
+
+    def record_end(self, winner: int, reason: int) -> None:
+        frame = protocol.encode(protocol.GAME_OVER, self.game_id, winner, reason)
+        self._publish({viewpoint: frame for viewpoint in VIEWPOINTS})
@@ -0,0 +1,317 @@
+"""
+Tournament
+
+Round-robin tournaments between presets, optionally played by different AI
+variants. Every entrant plays every other entrant a number of games on each
+side of the board, games run across a process pool and every finished game is
+appended to a JSONL cache so an interrupted run picks up where it stopped.
+Results are aggregated into win rates and Elo ratings and written to a CSV
+summary table:
+
+    python stratego/tournament.py --presets 1 2 3 --ai heuristic random
+"""
+import argparse
+import csv
+import json
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from config import config
+from stratego_game import Stratego, EndReason, USER, OPPONENT, DRAW
+from strategies import STRATEGIES, make_strategy
+
+INITIAL_RATING = 1500
+
+
+@dataclass(frozen=True)
+class Entrant:
+    """
+    A preset played by an AI variant
+
+    Attributes
+    ----------
+    preset : int
+        preset id
+    ai : str
+        name of the strategy playing the preset, a key of STRATEGIES
+    """
+    preset: int
+    ai: str = 'heuristic'
+
+    @property
+    def name(self) -> str:
+        return f'{self.preset}/{self.ai}'
+
+
+@dataclass(frozen=True)
+class Pairing:
+    """
+    One scheduled game
+
+    Attributes
+    ----------
+    key : str
+        unique key of the game, used by the result cache
+    user : Entrant
+        entrant playing the user side
+    opponent : Entrant
+        entrant playing the opponent side
+    seed : int | None
+        master seed of the tournament
+    """
+    key: str
+    user: Entrant
+    opponent: Entrant
+    seed: int | None
+
+    @property
+    def game_index(self) -> int:
+        # Stable across runs and schedules, so a cached game can always be replayed on its own
+        return zlib.crc32(self.key.encode())
+
+
+def schedule(entrants: list[Entrant], games: int, seed: int | None = None) -> list[Pairing]:
+    """
+    Builds a round-robin schedule where every entrant meets every other entrant on both sides
+    :param entrants: Entrants of the tournament
+    :param games: Games per ordered pair of entrants
+    :param seed: Master seed of the tournament
+    :return: Every game of the tournament
+    """
+    pairings = []
+    for user in entrants:
+        for opponent in entrants:
+            if user == opponent:
+                continue
+            for number in range(games):
+                key = f'{seed}:{user.name} vs {opponent.name} #{number}'
+                pairings.append(Pairing(key, user, opponent, seed))
+    return pairings
+
+
+def play_match(pairing: Pairing, max_plies: int | None = None, rollout_workers: int | None = None) -> dict:
+    """
+    Plays one game to the end, the user side moves first
+    :param pairing: Game to play
+    :param max_plies: Moves after which the game is called a draw, None to only stop on the game rules
+    :param rollout_workers: Worker processes of sampling strategies, 0 to run rollouts in this process,
+        None for the configured number
+    :return: JSON-ready result of the game
+    """
+    game = Stratego(seed=pairing.seed, game_index=pairing.game_index)
+    game.apply_user_preset(pairing.user.preset)
+    game.apply_opponent_preset(pairing.opponent.preset)
+    game.start_game()
+
+    strategies = {USER: make_strategy(pairing.user.ai, rollout_workers),
+                  OPPONENT: make_strategy(pairing.opponent.ai, rollout_workers)}
+    side = USER
+    try:
+        while (result := game.check_game_over()) is None:
+            if max_plies is not None and game.ply >= max_plies:
+                result = DRAW, EndReason.PLY_LIMIT
+                break
+            # A side without moves passes, the game is drawn once neither side can move
+            game.play_turn(side, strategies[side])
+            side = OPPONENT if side == USER else USER
+    finally:
+        for strategy in strategies.values():
+            strategy.close()
+
+    winner, reason = result
+    return {
+        'key': pairing.key,
+        'user': pairing.user.name,
+        'opponent': pairing.opponent.name,
+        'winner': winner,
+        'reason': int(reason),
+        'plies': game.ply,
+        'user_moves': strategies[USER].moves,
+        'user_time': strategies[USER].total_time,
+        'opponent_moves': strategies[OPPONENT].moves,
+        'opponent_time': strategies[OPPONENT].total_time,
+    }
+
+
+def load_cache(name: str) -> dict[str, dict]:
+    """
+    Reads finished games from a result cache
+    :param name: Path of the cache file
+    :return: Results keyed by game key
+    """
+    results = {}
+    if not os.path.exists(name):
+        return results
+    with open(name, 'r') as file:
+        for line in file:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # Line cut short by an interrupted run, the game is simply played again
+                continue
+            results[result['key']] = result
+    return results
+
+
+def run_tournament(entrants: list[Entrant], games: int, seed: int | None = None, workers: int | None = None,
+                   cache_file: str | None = None, max_plies: int | None = None) -> list[dict]:
+    """
+    Plays every game of a round-robin tournament that is not in the cache yet
+    :param entrants: Entrants of the tournament
+    :param games: Games per ordered pair of entrants
+    :param seed: Master seed of the tournament
+    :param workers: Worker processes, 0 to play in this process, None for one per CPU
+    :param cache_file: Path of the result cache, None to keep nothing between runs
+    :param max_plies: Moves after which a game is called a draw, None to only stop on the game rules
+    :return: Results of every game in schedule order
+    """
+    pairings = schedule(entrants, games, seed)
+    results = load_cache(cache_file) if cache_file is not None else {}
+    pending = [pairing for pairing in pairings if pairing.key not in results]
+
+    cache = None
+    if cache_file is not None:
+        directory = os.path.dirname(cache_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        cache = open(cache_file, 'a')
+        if cache.tell() > 0:
+            with open(cache_file, 'rb') as file:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b'\n':
+                    # Close off the partial line of an interrupted run so the next result starts on its own line
+                    cache.write('\n')
+
+    def finish(result: dict) -> None:
+        results[result['key']] = result
+        if cache is not None:
+            cache.write(json.dumps(result) + '\n')
+            cache.flush()
+
+    try:
+        if workers == 0:
+            for pairing in pending:
+                finish(play_match(pairing, max_plies))
+        elif pending:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # Games already fill every worker, so sampling strategies roll out in their game's process
+                futures = [executor.submit(play_match, pairing, max_plies, 0) for pairing in pending]
+                for future in as_completed(futures):
+                    finish(future.result())
+    finally:
+        if cache is not None:
+            cache.close()
+
+    return [results[pairing.key] for pairing in pairings]
+
+
+def elo_ratings(results: list[dict], names: list[str], k_factor: float) -> dict[str, float]:
+    """
+    Rates entrants by applying an Elo update for every game in order
+    :param results: Game results, in schedule order so ratings don't depend on which worker finished first
+    :param names: Names of every entrant
+    :param k_factor: Largest rating change of a single game
+    :return: Rating of every entrant
+    """
+    ratings = {name: float(INITIAL_RATING) for name in names}
+    for result in results:
+        user, opponent = result['user'], result['opponent']
+        expected = 1 / (1 + 10 ** ((ratings[opponent] - ratings[user]) / 400))
+        score = {USER: 1.0, OPPONENT: 0.0, DRAW: 0.5}[result['winner']]
+        ratings[user] += k_factor * (score - expected)
+        ratings[opponent] -= k_factor * (score - expected)
+    return ratings
+
+
+def summarize(results: list[dict], entrants: list[Entrant], k_factor: float) -> list[dict]:
+    """
+    Aggregates results into one row per entrant, best rated first
+    :param results: Game results in schedule order
+    :param entrants: Entrants of the tournament
+    :param k_factor: Elo K-factor
+    :return: Summary rows
+    """
+    ratings = elo_ratings(results, [entrant.name for entrant in entrants], k_factor)
+    rows = {entrant.name: {'entrant': entrant.name, 'preset': entrant.preset, 'ai': entrant.ai,
+                           'games': 0, 'wins': 0, 'draws': 0, 'losses': 0}
+            for entrant in entrants}
+    moves = {entrant.name: 0 for entrant in entrants}
+    think_time = {entrant.name: 0.0 for entrant in entrants}
+
+    for result in results:
+        for side, name, prefix in ((USER, result['user'], 'user'), (OPPONENT, result['opponent'], 'opponent')):
+            moves[name] += result.get(f'{prefix}_moves', 0)
+            think_time[name] += result.get(f'{prefix}_time', 0.0)
+            row = rows[name]
+            row['games'] += 1
+            if result['winner'] == DRAW:
+                row['draws'] += 1
+            elif result['winner'] == side:
+                row['wins'] += 1
+            else:
+                row['losses'] += 1
+
+    for name, row in rows.items():
+        row['win_rate'] = round(row['wins'] / row['games'], 4) if row['games'] else 0.0
+        row['rating'] = round(ratings[name], 1)
+        row['move_ms'] = round(think_time[name] / moves[name] * 1000, 2) if moves[name] else 0.0
+
+    return sorted(rows.values(), key=lambda row: row['rating'], reverse=True)
+
+
+def preset_win_rates(rows: list[dict]) -> dict[int, float]:
+    """
+    Combines the summary rows of every AI variant playing the same preset
+    :param rows: Summary rows from summarize
+    :return: Win rate of every preset
+    """
+    wins = {}
+    games = {}
+    for row in rows:
+        wins[row['preset']] = wins.get(row['preset'], 0) + row['wins']
+        games[row['preset']] = games.get(row['preset'], 0) + row['games']
+    return {preset: wins[preset] / games[preset] if games[preset] else 0.0 for preset in wins}
+
+
+def write_summary(rows: list[dict], name: str) -> None:
+    directory = os.path.dirname(name)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(name, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    settings = config['tournament']
+    parser = argparse.ArgumentParser(description='Round-robin tournament between presets')
+    parser.add_argument('--presets', type=int, nargs='+', help='preset ids, defaults to every preset')
+    parser.add_argument('--ai', nargs='+', default=['heuristic'], choices=sorted(STRATEGIES))
+    parser.add_argument('--games', type=int, default=settings['games'], help='games per ordered pairing')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, 0 to play in this process')
+    parser.add_argument('--seed', type=int, default=config['seed'])
+    parser.add_argument('--max-plies', type=int, default=settings['max_plies'])
+    parser.add_argument('--cache', default=settings['cache_file'])
+    parser.add_argument('--summary', default=settings['summary_file'])
+    args = parser.parse_args()
+
+    preset_ids = args.presets if args.presets else sorted(Stratego().presets.keys())
+    tournament_entrants = [Entrant(preset, ai) for preset in preset_ids for ai in args.ai]
+    tournament_results = run_tournament(tournament_entrants, args.games, args.seed, args.workers, args.cache,
+                                        args.max_plies)
+    summary = summarize(tournament_results, tournament_entrants, settings['k_factor'])
+    write_summary(summary, args.summary)
+
+    print(f'{len(tournament_results)} games, summary written to {args.summary}')
+    print(f'{"entrant":<16}{"games":>7}{"wins":>7}{"draws":>7}{"losses":>8}{"win rate":>10}{"rating":>9}'
+          f'{"ms/move":>9}')
+    for summary_row in summary:
+        print(f'{summary_row["entrant"]:<16}{summary_row["games"]:>7}{summary_row["wins"]:>7}'
+              f'{summary_row["draws"]:>7}{summary_row["losses"]:>8}{summary_row["win_rate"]:>10.3f}'
+              f'{summary_row["rating"]:>9.1f}{summary_row["move_ms"]:>9.2f}')
+    if len(args.ai) > 1:
+        for preset_id, win_rate in sorted(preset_win_rates(summary).items()):
+            print(f'preset {preset_id}: win rate {win_rate:.3f}')
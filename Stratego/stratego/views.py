@@ -1,21 +1,34 @@
-import random
+import os
 
 import arcade
 from enum import Enum
 
+import outcomes
 from config import config
-from stratego_game import game
+from events import KeyPress, MouseMotion, MousePress
+from game_object import input_events
+from pieces import load_units
+from records import GameRecordWriter, GameRecordReader, UNFINISHED
+from replay import Replay
+from snapshot import load_snapshot, read_snapshot, save_snapshot, write_snapshot
+from stratego_game import game, EndReason, USER, OPPONENT, DRAW
 from sprites import sprite_manager
 
 # Are we running a debug mode?
 DEBUG = config['debug']
 
-# Number of loadable presets
-PRESET_COUNT = config['presets']['count']
+# Number of presets on one page of the setup screen, picked with keys 1-9
+PRESET_COUNT = min(config['presets']['count'], 9)
 
 # Which preset should the opponent use
 OPPONENT_PRESET = config['opponent']['preset']
 
+# Should finished games be written to the record file
+RECORD_GAMES = config['records']['enabled']
+
+# Game saved with F5 and loaded with F9
+SNAPSHOT_FILE = config['snapshots']['data_file']
+
 # Get screen height/width from config file
 SCREEN_HEIGHT = config['window']['height']
 SCREEN_WIDTH = config['window']['width']
@@ -29,15 +42,47 @@ BOARD_SIZE = config['board']['size']
 # The board should fit into the screen even if the screen is smaller
 BOARD_SIZE = min(BOARD_SIZE, SCREEN_HEIGHT)
 
-SQUARE_SIZE = int(BOARD_SIZE / ROW_COUNT)
+# The longer side of the board sets the square size
+SQUARE_SIZE = int(BOARD_SIZE / max(ROW_COUNT, COLUMN_COUNT))
+BOARD_WIDTH = SQUARE_SIZE * COLUMN_COUNT
+BOARD_HEIGHT = SQUARE_SIZE * ROW_COUNT
 
 # Margins on the edges of the board
-MARGIN_WIDTH = max(0, (SCREEN_WIDTH - BOARD_SIZE) / 2)
-MARGIN_HEIGHT = max(0, (SCREEN_HEIGHT - BOARD_SIZE) / 2)
+MARGIN_WIDTH = max(0, (SCREEN_WIDTH - BOARD_WIDTH) / 2)
+MARGIN_HEIGHT = max(0, (SCREEN_HEIGHT - BOARD_HEIGHT) / 2)
 
 # Position of board on screen
 BOARD_BL = (MARGIN_WIDTH, MARGIN_HEIGHT)
-BOARD_TR = (BOARD_BL[0] + BOARD_SIZE, BOARD_BL[1] + BOARD_SIZE)
+BOARD_TR = (BOARD_BL[0] + BOARD_WIDTH, BOARD_BL[1] + BOARD_HEIGHT)
+
+# Color of the lake squares
+LAKE_COLOR = arcade.color.STEEL_BLUE
+
+
+STALEMATE_REASONS = {
+    EndReason.NO_FLAGS: "Both flags were lost",
+    EndReason.NO_MOVES: "Neither side can move",
+    EndReason.REPETITION: "The same position came up too often",
+    EndReason.NO_PROGRESS: "Too many moves without an attack",
+}
+
+# Record file writer, opened on first use
+recorder = None
+
+
+def get_recorder() -> GameRecordWriter:
+    global recorder
+    if recorder is None:
+        recorder = GameRecordWriter(config['records']['data_file'], ROW_COUNT, COLUMN_COUNT)
+    return recorder
+
+
+def has_records() -> bool:
+    name = config['records']['data_file']
+    if not os.path.exists(name):
+        return False
+    with GameRecordReader(name) as reader:
+        return len(reader) > 0
 
 
 def grid_color(x: int, y: int) -> arcade.color:
@@ -93,10 +138,11 @@ class BoardView(arcade.View):
         self.local_grid_sprites = []
         self.grid_sprite_list = arcade.SpriteList()
         # Create a list of solid-color sprites to represent each grid location
-        for x in range(ROW_COUNT):
+        for x in range(COLUMN_COUNT):
             self.local_grid_sprites.append([])
-            for y in range(COLUMN_COUNT):
-                sprite = arcade.SpriteSolidColor(SQUARE_SIZE, SQUARE_SIZE, grid_color(x, y))
+            for y in range(ROW_COUNT):
+                color = LAKE_COLOR if (x, y) in game.board.lakes else grid_color(x, y)
+                sprite = arcade.SpriteSolidColor(SQUARE_SIZE, SQUARE_SIZE, color)
                 sprite.center_x = BOARD_BL[0] + SQUARE_SIZE * x + (SQUARE_SIZE / 2)
                 sprite.center_y = BOARD_BL[1] + SQUARE_SIZE * y + (SQUARE_SIZE / 2)
                 self.local_grid_sprites[x].append(sprite)
@@ -115,19 +161,18 @@ class BoardView(arcade.View):
         # Batch draw the grid sprites
         self.grid_sprite_list.draw()
 
-        for piece in filter(lambda p: p.x_pos is not None, game.user.alive_pieces):
+        # Only what the user may know is drawn, unless debug mode reveals everything
+        observation = game.observe(USER, reveal=DEBUG and self.show_hidden)
+        for piece in observation.own:
             x, y = to_screen_space(piece.x_pos, piece.y_pos)
             sprite = sprite_manager.get_user_sprite(piece.name)
             sprite.center_x = x
             sprite.center_y = y
             sprite.draw()
 
-        for piece in filter(lambda p: p.x_pos is not None, game.opponent.alive_pieces):
+        for piece in observation.enemy:
             x, y = to_screen_space(piece.x_pos, piece.y_pos)
-            name = "Unknown" if piece.is_hidden else piece.name
-            # Reveal info in debug mode
-            if DEBUG and self.show_hidden:
-                name = piece.name
+            name = "Unknown" if piece.strength is None else piece.name
             sprite = sprite_manager.get_opponent_sprite(name)
             sprite.center_x = x
             sprite.center_y = y
@@ -142,17 +187,22 @@ class BoardView(arcade.View):
         self.debug_msg(f'Show hidden: {self.show_hidden}')
         self.debug_msg('Press "Space" to flip')
 
+    def on_key_press(self, symbol: int, modifiers: int):
+        input_events.publish(KeyPress(symbol, modifiers))
+
     def on_mouse_press(self, x: int, y: int, button: int, modifiers: int):
         self.last_mouse_click = (x, y)
         self.selected_square = to_board_coord(x, y)
         self.reset_colors()
+        input_events.publish(MousePress(x, y, button, modifiers))
 
     def on_mouse_motion(self, x: int, y: int, dx: int, dy: int):
         self.last_mouse_pos = (x, y)
+        input_events.publish(MouseMotion(x, y, dx, dy))
 
     def reset_colors(self):
-        for x in range(ROW_COUNT):
-            for y in range(COLUMN_COUNT):
+        for x in range(COLUMN_COUNT):
+            for y in range(ROW_COUNT):
                 # I do not know why the default highlight color is white, but it is
                 self.local_grid_sprites[x][y].color = arcade.color.WHITE
 
@@ -168,8 +218,13 @@ class BoardView(arcade.View):
 
 
 class IntroView(BoardView):
+    def __init__(self):
+        super().__init__()
+        self.can_replay = False
+
     def on_show(self):
         arcade.set_background_color(arcade.color.BLACK)
+        self.can_replay = has_records()
 
     def on_draw(self):
         arcade.start_render()
@@ -177,12 +232,21 @@ class IntroView(BoardView):
                          arcade.color.WHITE, font_size=30, anchor_x="center")
         arcade.draw_text("Click to Start", SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 - 50,
                          arcade.color.WHITE, font_size=20, anchor_x="center")
+        if self.can_replay:
+            arcade.draw_text("Press R to replay the last recorded game", SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 - 90,
+                             arcade.color.WHITE, font_size=14, anchor_x="center")
 
     def on_mouse_press(self, x, y, button, modifiers):
         game_view = SetupView()
         game_view.setup()
         self.window.show_view(game_view)
 
+    def on_key_press(self, symbol: int, modifiers: int):
+        if symbol == arcade.key.R and self.can_replay:
+            replay_view = ReplayView(Replay.from_file(config['records']['data_file']))
+            replay_view.setup()
+            self.window.show_view(replay_view)
+
 
 class WinView(BoardView):
     def __init__(self):
@@ -225,8 +289,9 @@ class LoseView(BoardView):
 
 
 class StalemateView(BoardView):
-    def __init__(self):
+    def __init__(self, reason: EndReason = EndReason.NO_FLAGS):
         super().__init__()
+        self.reason = reason
 
     def on_show(self):
         arcade.set_background_color(arcade.color.GRAY)
@@ -235,6 +300,8 @@ class StalemateView(BoardView):
         arcade.start_render()
         arcade.draw_text("STALEMATE", SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2,
                          arcade.color.WHITE, font_size=30, anchor_x="center")
+        arcade.draw_text(STALEMATE_REASONS.get(self.reason, ""), SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 50,
+                         arcade.color.WHITE, font_size=16, anchor_x="center")
         arcade.draw_text("Click to Restart", SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 - 50,
                          arcade.color.WHITE, font_size=20, anchor_x="center")
 
@@ -251,6 +318,18 @@ class SetupView(BoardView):
     def __init__(self):
         super().__init__()
         self.current_index = 0
+        # Every preset in the library, number keys pick from one page of them at a time
+        self.preset_ids = sorted(game.presets.keys())
+        self.preset_page = 0
+
+    @property
+    def page_count(self) -> int:
+        return max(1, -(-len(self.preset_ids) // PRESET_COUNT))
+
+    @property
+    def page_presets(self) -> list[int]:
+        start = self.preset_page * PRESET_COUNT
+        return self.preset_ids[start:start + PRESET_COUNT]
 
     def setup(self):
         super().setup()
@@ -266,6 +345,7 @@ class SetupView(BoardView):
             pieces = game.user.alive_pieces
             if self.current_index < len(pieces):
                 if game.board.add_piece(grid_pos[0], grid_pos[1], pieces[self.current_index]):
+                    game.clear_observations()
                     self.current_index += 1
                 else:
                     print("Failed to place piece")
@@ -276,16 +356,27 @@ class SetupView(BoardView):
                 raise Exception("Unreachable!")
 
     def on_key_press(self, symbol: int, modifiers: int):
+        super().on_key_press(symbol, modifiers)
         # We already started placing pieces
         if self.current_index != 0:
             return
 
-        for index, key in enumerate(range(arcade.key.KEY_1, arcade.key.KEY_9)):
-            if index + 1 > PRESET_COUNT:
+        # Arrow keys page through the library, wrapping around at either end
+        if symbol == arcade.key.RIGHT:
+            self.preset_page = (self.preset_page + 1) % self.page_count
+            return
+        if symbol == arcade.key.LEFT:
+            self.preset_page = (self.preset_page - 1) % self.page_count
+            return
+
+        # Number keys pick a preset of the current page
+        preset_ids = self.page_presets
+        for index, key in enumerate(range(arcade.key.KEY_1, arcade.key.KEY_9 + 1)):
+            if index >= len(preset_ids):
                 # We have reached the maximum number of supported presets
                 break
             if key == symbol:
-                game.apply_user_preset(index + 1)
+                game.apply_user_preset(preset_ids[index])
                 self.start_game_view()
 
     def start_game_view(self):
@@ -320,14 +411,15 @@ class SetupView(BoardView):
             sprite.draw()
 
         arcade.draw_text(
-            'Press key [num] to select a preset!',
+            'Press key [num] to select a preset, [left]/[right] for more!',
             SCREEN_WIDTH / 2,
             MARGIN_HEIGHT / 2 + 6,
             arcade.color.BONE,
             font_size=16,
             anchor_x='center'
         )
-        preset_label = f'Presets: {" ".join([str(x + 1) for x in range(PRESET_COUNT)])}'
+        preset_label = (f'Presets: {" ".join(f"{key + 1}={preset}" for key, preset in enumerate(self.page_presets))}'
+                        f'  (page {self.preset_page + 1}/{self.page_count})')
         arcade.draw_text(
             preset_label,
             SCREEN_WIDTH / 2,
@@ -357,41 +449,72 @@ class GameView(BoardView):
         self.selected_piece = None
         self.opponents_turn = False
         self.state = GameViewState.NO_SELECTION
+        self.end_reason = EndReason.NONE
+        self.last_report = None
 
     def setup(self):
         super().setup()
-        if OPPONENT_PRESET == -1:
-            preset = random.randint(1, PRESET_COUNT)
+        if len(game.presets) == 0:
+            # No preset fits the army of this board size, deal the opponent's pieces out randomly
+            game.board.add_opponent_pieces(game.opponent, game.rng)
         else:
-            preset = OPPONENT_PRESET
-
-        if DEBUG:
-            print(f'Applying opponent preset: {preset}')
-        game.apply_opponent_preset(preset)
-        game.update_moves()
+            if OPPONENT_PRESET == -1:
+                preset = game.rng.choice(list(game.presets.keys()))
+            else:
+                preset = OPPONENT_PRESET
+
+            if DEBUG:
+                print(f'Applying opponent preset: {preset}')
+            game.apply_opponent_preset(preset)
+        game.start_game()
+
+        if RECORD_GAMES:
+            game.start_recording(get_recorder())
+
+    def strategy_turn(self, side: int, next_state: GameViewState):
+        """
+        Lets the side's strategy move, then hands the turn over or ends the game
+        :param side: Side to move
+        :param next_state: State to continue with if the game goes on
+        :return: None
+        """
+        report = game.play_turn(side)
+        self.last_report = report
+        result = game.check_game_over()
+        if result is not None:
+            winner, self.end_reason = result
+            self.state = {
+                USER: GameViewState.USER_WIN,
+                OPPONENT: GameViewState.OPPONENT_WIN,
+                DRAW: GameViewState.STALEMATE
+            }[winner]
+        else:
+            # Highlight the move
+            if report.source and report.target:
+                self.get_sprite(report.source).color = arcade.color.BLUEBERRY
+                self.get_sprite(report.target).color = arcade.color.TANGERINE_YELLOW
+            self.state = next_state
 
     def on_update(self, delta_time: float):
         match self.state:
+            case GameViewState.NO_SELECTION:
+                # The user side is played by a strategy instead of the mouse
+                if game.strategies[USER] is not None:
+                    self.strategy_turn(USER, GameViewState.OPPONENT_TURN)
             case GameViewState.OPPONENT_TURN:
-                opponent_from, opponent_to = game.opponent_turn()
-                if game.user.has_flag and not game.opponent.has_flag:
-                    self.state = GameViewState.USER_WIN
-                elif not game.user.has_flag and game.opponent.has_flag:
-                    self.state = GameViewState.OPPONENT_WIN
-                elif not game.user.has_flag and not game.opponent.has_flag:
-                    self.state = GameViewState.STALEMATE
-                else:
-                    # Highlight opponent move
-                    if opponent_from and opponent_to:
-                        self.get_sprite(opponent_from).color = arcade.color.BLUEBERRY
-                        self.get_sprite(opponent_to).color = arcade.color.TANGERINE_YELLOW
-                    self.state = GameViewState.NO_SELECTION
+                self.strategy_turn(OPPONENT, GameViewState.NO_SELECTION)
             case GameViewState.USER_WIN:
+                game.end_game(USER, self.end_reason)
+                game.close_strategies()
                 self.window.show_view(WinView())
             case GameViewState.OPPONENT_WIN:
+                game.end_game(OPPONENT, self.end_reason)
+                game.close_strategies()
                 self.window.show_view(LoseView())
             case GameViewState.STALEMATE:
-                self.window.show_view(StalemateView())
+                game.end_game(DRAW, self.end_reason)
+                game.close_strategies()
+                self.window.show_view(StalemateView(self.end_reason))
 
     def on_draw(self):
         super().on_draw()
@@ -401,6 +524,8 @@ class GameView(BoardView):
             self.debug_msg(f'Piece: None')
         self.debug_msg(f'Current state:')
         self.debug_msg(f'   {self.state}')
+        if self.last_report is not None:
+            self.debug_msg(f'Last AI move: {self.last_report.elapsed * 1000:.1f} ms')
 
         arcade.draw_text(
             f'Captured pieces:',
@@ -413,13 +538,9 @@ class GameView(BoardView):
         )
 
         pieces_names = sprite_manager.sprite_names
-        pieces_counts = []
-        for name in pieces_names:
-            count = 0
-            for piece in game.opponent.captured_pieces:
-                if piece.name == name:
-                    count += 1
-            pieces_counts.append(count)
+        unit_info = load_units()
+        captured_names = [unit_info[strength]['name'] for strength in game.observe(USER).enemy_captured]
+        pieces_counts = [captured_names.count(name) for name in pieces_names]
         list_grow_offset = (SQUARE_SIZE * max(0, len(pieces_counts) - pieces_counts.count(0) - 1))
         arcade.draw_rectangle_filled(
             SCREEN_WIDTH - (MARGIN_WIDTH / 2),
@@ -449,6 +570,9 @@ class GameView(BoardView):
 
     def on_mouse_press(self, x: int, y: int, button: int, modifiers: int):
         super().on_mouse_press(x, y, button, modifiers)
+        if game.strategies[USER] is not None:
+            # The user side is played by a strategy
+            return
         match self.state:
             case GameViewState.NO_SELECTION:
                 if self.selected_square is not None:
@@ -471,16 +595,10 @@ class GameView(BoardView):
                     assert (piece is not None)
                     moves = piece.moves
                     if self.selected_square in moves:
-                        # Try to move or attack
-                        opponent = game.board.is_occupied(self.selected_square[0], self.selected_square[1])
-                        if opponent is None:
-                            self.selected_piece.move(self.selected_square[0], self.selected_square[1])
-                            self.selected_piece = None
-                            self.state = GameViewState.OPPONENT_TURN
-                        else:
-                            self.selected_piece.attack(opponent)
-                            self.selected_piece = None
-                            self.state = GameViewState.OPPONENT_TURN
+                        # Move or attack
+                        game.take_move(self.selected_piece, self.selected_square[0], self.selected_square[1])
+                        self.selected_piece = None
+                        self.state = GameViewState.OPPONENT_TURN
                     else:
                         # We may have selected another piece
                         self.change_focus()
@@ -493,8 +611,43 @@ class GameView(BoardView):
                 pass
 
     def on_key_press(self, symbol: int, modifiers: int):
+        super().on_key_press(symbol, modifiers)
         if symbol == arcade.key.SPACE:
             self.show_hidden = not self.show_hidden
+        elif symbol == arcade.key.F5:
+            self.save_game()
+        elif symbol == arcade.key.F9:
+            self.load_game()
+
+    @property
+    def in_play(self) -> bool:
+        return self.state in (GameViewState.NO_SELECTION, GameViewState.PIECE_SELECTED, GameViewState.OPPONENT_TURN)
+
+    def save_game(self):
+        if not self.in_play:
+            return
+        turn = OPPONENT if self.state == GameViewState.OPPONENT_TURN else USER
+        write_snapshot(SNAPSHOT_FILE, save_snapshot(game, turn))
+        if DEBUG:
+            print(f'Saved game to {SNAPSHOT_FILE}')
+
+    def load_game(self):
+        if not self.in_play or not os.path.exists(SNAPSHOT_FILE):
+            return
+        try:
+            turn = load_snapshot(game, read_snapshot(SNAPSHOT_FILE))
+        except Exception as error:
+            # A save from another board or a damaged file, nothing was changed and the game goes on as it was
+            print(f'Could not load {SNAPSHOT_FILE}: {error}')
+            return
+        # The record of this game would not match the moves played after the load
+        if game.recorder is not None:
+            game.finish_recording(UNFINISHED)
+        self.selected_piece = None
+        self.reset_colors()
+        self.state = GameViewState.OPPONENT_TURN if turn == OPPONENT else GameViewState.NO_SELECTION
+        if DEBUG:
+            print(f'Loaded game from {SNAPSHOT_FILE}')
 
     def change_focus(self):
         piece = game.board.is_occupied(self.selected_square[0], self.selected_square[1])
@@ -504,6 +657,97 @@ class GameView(BoardView):
             moves = piece.moves
 
             for move in moves:
-                self.get_sprite(move).color = arcade.color.RUBY
+                # Warn about squares a revealed opponent piece could take us on next turn
+                danger = any(not threat.is_hidden and outcomes.resolve(threat, piece) == outcomes.ATTACKER_WINS
+                             for threat in game.board.threatened_by(move[0], move[1], game.opponent))
+                self.get_sprite(move).color = arcade.color.ORANGE if danger else arcade.color.RUBY
         else:
             self.selected_piece = None
+
+
+class ReplayView(BoardView):
+    """
+    View for scrubbing through a recorded game
+    Left/Right step a single ply, Up/Down jump 10 plies, Page Up/Down jump 100 plies,
+    Home/End go to either end and the bar under the board can be clicked or dragged.
+    """
+
+    def __init__(self, replay: Replay):
+        super().__init__()
+        self.replay = replay
+
+    def bar_fraction(self, x: int, y: int) -> float | None:
+        # Scrub bar sits in the bottom margin under the board
+        if not (BOARD_BL[0] <= x <= BOARD_TR[0] and 0 <= y <= BOARD_BL[1]):
+            return None
+        return (x - BOARD_BL[0]) / BOARD_WIDTH
+
+    def on_draw(self):
+        self.clear()
+        self.debug_msg_count = 0
+        self.grid_sprite_list.draw()
+
+        for x, y, side, name, hidden in self.replay.pieces():
+            if side == USER:
+                sprite = sprite_manager.get_user_sprite(name)
+            else:
+                if hidden and not (DEBUG and self.show_hidden):
+                    name = "Unknown"
+                sprite = sprite_manager.get_opponent_sprite(name)
+            sprite.center_x, sprite.center_y = to_screen_space(x, y)
+            sprite.draw()
+
+        # Progress bar
+        bar_y = BOARD_BL[1] / 2
+        arcade.draw_line(BOARD_BL[0], bar_y, BOARD_TR[0], bar_y, arcade.color.BONE, 4)
+        if self.replay.plies:
+            marker_x = BOARD_BL[0] + BOARD_WIDTH * self.replay.ply / self.replay.plies
+            arcade.draw_circle_filled(marker_x, bar_y, 8, arcade.color.TANGERINE_YELLOW)
+        arcade.draw_text(f'Ply {self.replay.ply} / {self.replay.plies}', SCREEN_WIDTH / 2, bar_y + 12,
+                         arcade.color.BONE, font_size=14, anchor_x='center')
+
+        self.debug_msg("Replay:")
+        self.debug_msg(f'Winner: {self.replay.winner}')
+        self.debug_msg(f'Show hidden: {self.show_hidden}')
+        self.debug_msg('Press "Space" to flip')
+
+    def seek(self, ply: int):
+        self.replay.seek(ply)
+        self.reset_colors()
+        if self.replay.last_move is not None:
+            move_from, move_to = self.replay.last_move
+            self.get_sprite(move_from).color = arcade.color.BLUEBERRY
+            self.get_sprite(move_to).color = arcade.color.TANGERINE_YELLOW
+
+    def on_key_press(self, symbol: int, modifiers: int):
+        super().on_key_press(symbol, modifiers)
+        match symbol:
+            case arcade.key.RIGHT:
+                self.seek(self.replay.ply + 1)
+            case arcade.key.LEFT:
+                self.seek(self.replay.ply - 1)
+            case arcade.key.UP:
+                self.seek(self.replay.ply + 10)
+            case arcade.key.DOWN:
+                self.seek(self.replay.ply - 10)
+            case arcade.key.PAGEUP:
+                self.seek(self.replay.ply + 100)
+            case arcade.key.PAGEDOWN:
+                self.seek(self.replay.ply - 100)
+            case arcade.key.HOME:
+                self.seek(0)
+            case arcade.key.END:
+                self.seek(self.replay.plies)
+            case arcade.key.SPACE:
+                self.show_hidden = not self.show_hidden
+            case arcade.key.ESCAPE:
+                self.window.show_view(IntroView())
+
+    def on_mouse_press(self, x: int, y: int, button: int, modifiers: int):
+        super().on_mouse_press(x, y, button, modifiers)
+        if (fraction := self.bar_fraction(x, y)) is not None:
+            self.seek(round(fraction * self.replay.plies))
+
+    def on_mouse_drag(self, x: int, y: int, dx: int, dy: int, buttons: int, modifiers: int):
+        if (fraction := self.bar_fraction(x, y)) is not None:
+            self.seek(round(fraction * self.replay.plies))
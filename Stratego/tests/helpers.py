@@ -0,0 +1,22 @@
+from stratego.stratego_game import Stratego
+
+
+def piece_of(player, strength: int):
+    return next(p for p in player.alive_pieces if p.strength == strength and p.x_pos is None)
+
+
+def place(game: Stratego, piece, x: int, y: int):
+    piece.move(x, y)
+    game.board.pieces.append(piece)
+    # Placing pieces by hand bypasses take_move, which keeps these up to date
+    game.rehash()
+    game.clear_observations()
+    return piece
+
+
+def new_game(seed: int = 0) -> Stratego:
+    game = Stratego(seed=seed)
+    game.apply_user_preset(1)
+    game.apply_opponent_preset(2)
+    game.start_game()
+    return game
@@ -0,0 +1,104 @@
+import contextlib
+import io
+import tracemalloc
+import unittest
+
+from stratego.allocations import AllocationProfiler, budgets
+from stratego.benchmark import profile_allocations, random_game
+from stratego.strategies import HeuristicStrategy
+from stratego.stratego_game import AllocationsMeasured, EndReason, USER, OPPONENT
+
+
+class TestAllocationProfiler(unittest.TestCase):
+    def setUp(self):
+        self.profiler = AllocationProfiler()
+
+    def tearDown(self):
+        self.profiler.stop()
+
+    def test_idle_until_started(self):
+        game = random_game(10, 0)
+        game.play_turn(USER, HeuristicStrategy())
+        self.assertEqual(game.allocations.stats, {})
+
+    def test_nested_scopes(self):
+        self.profiler.start()
+        self.assertTrue(tracemalloc.is_tracing())
+        with self.profiler.measure('outer'):
+            with self.profiler.measure('inner'):
+                scratch = bytearray(1 << 20)
+                del scratch
+            kept = bytearray(1 << 16)
+        inner = self.profiler.stats['inner']
+        outer = self.profiler.stats['outer']
+        self.assertGreaterEqual(inner.max_peak, 1 << 20)
+        self.assertLess(abs(inner.total_retained), 1 << 12)
+        # The outer peak covers what the inner scope allocated, and it still holds what it kept
+        self.assertGreaterEqual(outer.max_peak, inner.max_peak)
+        self.assertGreaterEqual(outer.total_retained, len(kept))
+
+        self.assertEqual(self.profiler.over_budget({'inner': 1 << 21, 'missing': 0}, 1), [])
+        with self.assertRaises(Exception):
+            self.profiler.check({'inner': 1 << 10}, 2)
+
+    def test_turn_phases(self):
+        game = random_game(10, 0)
+        game.allocations = self.profiler
+        self.profiler.start()
+        for _ in range(3):
+            game.play_turn(USER, HeuristicStrategy())
+        game.reset_pieces()
+        self.assertEqual({scope: stats.calls for scope, stats in self.profiler.stats.items()},
+                         {'moves': 3, 'choose': 3, 'take': 3, 'turn': 3, 'reset': 1})
+        turn = self.profiler.stats['turn']
+        for phase in ('moves', 'choose', 'take'):
+            self.assertLessEqual(self.profiler.stats[phase].max_peak, turn.max_peak)
+
+
+class TestProfiledGames(unittest.TestCase):
+    def test_game_reported_at_the_end(self):
+        tracing = tracemalloc.is_tracing()
+        game = random_game(10, 0)
+        game.profile_games = True
+        reports = []
+
+        def measured(event: AllocationsMeasured):
+            reports.append(event)
+        game.events.subscribe(AllocationsMeasured, measured)
+
+        game.start_game()
+        strategy = HeuristicStrategy()
+        for side in (USER, OPPONENT, USER):
+            game.play_turn(side, strategy)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            game.end_game(USER, EndReason.RESIGNED)
+
+        self.assertEqual(len(reports), 1)
+        stats = reports[0].stats
+        self.assertEqual((stats['game'].calls, stats['turn'].calls, stats['choose'].calls), (1, 3, 3))
+        self.assertGreaterEqual(stats['game'].max_peak, stats['turn'].max_peak)
+        self.assertIn('choose', output.getvalue())
+        # Tracing only lasts as long as the game
+        self.assertFalse(game.allocations.running)
+        self.assertEqual(tracemalloc.is_tracing(), tracing)
+
+        # The next game is reported on its own
+        game.start_game()
+        game.play_turn(OPPONENT, strategy)
+        with contextlib.redirect_stdout(io.StringIO()):
+            game.end_game(OPPONENT, EndReason.RESIGNED)
+        self.assertEqual((reports[1].stats['game'].calls, reports[1].stats['turn'].calls), (1, 1))
+        self.assertEqual(reports[0].stats['turn'].calls, 3)
+
+
+class TestAllocationBudgets(unittest.TestCase):
+    def test_configured_board_within_budgets(self):
+        profiler, pieces = profile_allocations(10, 30, 0)
+        self.assertEqual(pieces, 80)
+        self.assertTrue(set(budgets()) <= set(profiler.stats))
+        profiler.check(budgets(), pieces)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+
+import numpy as np
+
+from stratego.batch import BatchSimulator, EMPTY, USER, OPPONENT, DRAW, ONGOING
+
+
+class TestBatchSimulator(unittest.TestCase):
+    def test_random_setup_fills_zones(self):
+        simulator = BatchSimulator(8, seed=0)
+        simulator.setup_random()
+        for side in (USER, OPPONENT):
+            squares = simulator.setup_squares(side)
+            self.assertTrue((simulator.owners[:, squares] == side).all())
+            self.assertTrue(simulator.hidden[:, squares].all())
+        self.assertEqual(np.count_nonzero(simulator.ranks[0] != EMPTY), 80)
+
+    def test_games_finish(self):
+        simulator = BatchSimulator(16, policy='attack', seed=1)
+        simulator.setup_random()
+        winners = simulator.run(max_plies=3000)
+        self.assertFalse((winners == ONGOING).any())
+        self.assertTrue(np.isin(winners, (USER, OPPONENT, DRAW)).all())
+
+    def test_scout_moves(self):
+        simulator = BatchSimulator(1, seed=2)
+        ranks = np.full((1, 100), EMPTY, dtype=np.int8)
+        owners = np.full((1, 100), EMPTY, dtype=np.int8)
+        # User scout at (0, 0), opponent flag at (0, 9)
+        ranks[0, 0], owners[0, 0] = 2, USER
+        ranks[0, 90], owners[0, 90] = 0, OPPONENT
+        simulator.load(ranks, owners, owners != EMPTY, np.array([USER]))
+        # Scout can slide up the column onto the flag and along the row
+        self.assertEqual(np.count_nonzero(simulator.legal_moves()), 18)
+
+    def test_capture_flag(self):
+        simulator = BatchSimulator(1, policy='attack', seed=3)
+        ranks = np.full((1, 100), EMPTY, dtype=np.int8)
+        owners = np.full((1, 100), EMPTY, dtype=np.int8)
+        # User sergeant at (0, 8), hidden opponent flag at (0, 9)
+        ranks[0, 80], owners[0, 80] = 4, USER
+        ranks[0, 90], owners[0, 90] = 0, OPPONENT
+        simulator.load(ranks, owners, owners != EMPTY, np.array([USER]))
+        simulator.step()
+        self.assertEqual(simulator.winners[0], USER)
+        self.assertEqual(simulator.ranks[0, 90], 4)
+        self.assertFalse(simulator.hidden[0, 90])
+
+    def test_resolve(self):
+        simulator = BatchSimulator(1)
+        attackers = np.array([1, 10, 3, 10, 5, 2])
+        defenders = np.array([10, 1, 11, 11, 5, 0])
+        # Spy takes marshal, marshal takes spy, miner defuses, bomb holds, tie, flag taken
+        self.assertEqual(simulator.resolve(attackers, defenders).tolist(), [1, 1, 1, 2, 3, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from stratego.config import config
+from stratego.pieces import scale_counts, army_counts, FLAG
+from stratego.stratego_game import Stratego, USER, OPPONENT
+from stratego.benchmark import random_game
+
+
+class TestScaleCounts(unittest.TestCase):
+    def test_configured_army_unchanged(self):
+        counts = config['pieces']['counts']
+        self.assertEqual(scale_counts(counts, sum(counts.values())), counts)
+        self.assertEqual(army_counts(10, 4), counts)
+
+    def test_scaled_army_fills_zone(self):
+        counts = config['pieces']['counts']
+        for squares in (12, 40, 80, 97, 640):
+            with self.subTest(squares=squares):
+                scaled = scale_counts(counts, squares)
+                self.assertEqual(sum(scaled.values()), squares)
+                self.assertEqual(scaled[FLAG], 1)
+                self.assertEqual(list(scaled), list(counts))
+
+
+class TestBoardSizes(unittest.TestCase):
+    def test_setup_zones(self):
+        game = Stratego(rows=12, columns=8, setup_rows=3)
+        self.assertEqual(list(game.setup_zone(USER)), [0, 1, 2])
+        self.assertEqual(list(game.setup_zone(OPPONENT)), [11, 10, 9])
+        self.assertEqual(len(game.user.alive_pieces), 24)
+        self.assertFalse(game.board.add_piece(0, 3, game.user.alive_pieces[0]))
+        self.assertTrue(game.board.add_piece(7, 2, game.user.alive_pieces[0]))
+
+    def test_zones_must_fit(self):
+        with self.assertRaises(Exception):
+            Stratego(rows=6, columns=6, setup_rows=4)
+
+    def test_moves_stay_on_board(self):
+        game = Stratego(rows=6, columns=9, setup_rows=2)
+        game.board.add_opponent_pieces(game.opponent, game.rng)
+        self.assertTrue(all(piece.y_pos >= 4 for piece in game.opponent.alive_pieces))
+        game.update_moves()
+        for piece in game.opponent.alive_pieces:
+            for x, y in piece.moves:
+                self.assertTrue(0 <= x < 9 and 0 <= y < 6)
+
+    def test_large_board_plays(self):
+        game = random_game(20, 0)
+        self.assertEqual(len(game.board.pieces), 2 * 20 * 8)
+        for side in (OPPONENT, USER, OPPONENT):
+            report = game.play_turn(side, game.strategies[OPPONENT])
+            self.assertIsNotNone(report.target)
+
+
+if __name__ == '__main__':
+    unittest.main()
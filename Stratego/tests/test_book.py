@@ -0,0 +1,133 @@
+import os
+import tempfile
+import unittest
+
+from stratego.book import OpeningBook, position_key, record_self_play
+from stratego.stratego_game import USER, OPPONENT
+from stratego.strategies import BookStrategy, HeuristicStrategy, RandomStrategy, Strategy
+from tests.helpers import new_game
+
+
+class RecordingStrategy(RandomStrategy):
+    def __init__(self):
+        super().__init__()
+        self.log = []
+
+    def choose_move(self, game, side, deadline):
+        piece, move = super().choose_move(game, side, deadline)
+        self.log.append((piece.coords, move))
+        return piece, move
+
+
+class ScriptedStrategy(Strategy):
+    def __init__(self, moves):
+        super().__init__()
+        self.script = list(moves)
+
+    def choose_move(self, game, side, deadline):
+        source, move = self.script.pop(0)
+        return game.board.is_occupied(*source), move
+
+
+class FailingStrategy(Strategy):
+    def choose_move(self, game, side, deadline):
+        raise AssertionError('The book should have had a move')
+
+
+class TestBook(unittest.TestCase):
+    def test_lru_eviction(self):
+        book = OpeningBook(2, 10)
+        book.add(1, (0, 0), (0, 1))
+        book.add(2, (1, 0), (1, 1))
+        self.assertEqual(book.lookup(1), ((0, 0), (0, 1)))
+        book.add(3, (2, 0), (2, 1))
+        # 2 was used least recently
+        self.assertNotIn(2, book)
+        self.assertIsNone(book.lookup(2))
+        self.assertEqual((len(book), book.hits, book.misses), (2, 1, 1))
+
+    def test_save_load(self):
+        book = OpeningBook(10, 10)
+        for key in range(5):
+            book.add(2 ** 63 + key, (key, 3), (key, 4))
+        with tempfile.TemporaryDirectory() as directory:
+            name = os.path.join(directory, 'book', 'opening.strbook')
+            book.save(name)
+            loaded = OpeningBook.load(name, 3)
+        # Only the most recently used entries fit
+        self.assertEqual(len(loaded), 3)
+        self.assertNotIn(2 ** 63 + 1, loaded)
+        self.assertEqual(loaded.lookup(2 ** 63 + 4), ((4, 3), (4, 4)))
+
+    def test_load_other_columns(self):
+        book = OpeningBook(10, 12)
+        book.add(1, (11, 3), (11, 4))
+        with tempfile.TemporaryDirectory() as directory:
+            name = os.path.join(directory, 'opening.strbook')
+            book.save(name)
+            self.assertEqual(OpeningBook.load(name, 10, 12).lookup(1), ((11, 3), (11, 4)))
+            with self.assertRaises(Exception):
+                OpeningBook.load(name, 10, 10)
+
+        # A book of another board width is never consulted
+        game = new_game()
+        strategy = BookStrategy(HeuristicStrategy(), book, 12)
+        book.add(position_key(game, OPPONENT), (0, 0), (0, 1))
+        self.assertIsNotNone(game.play_turn(OPPONENT, strategy).target)
+        self.assertEqual((book.hits, book.misses), (0, 0))
+
+    def test_key_only_uses_visible_state(self):
+        game = new_game()
+        key = position_key(game, OPPONENT)
+        self.assertNotEqual(key, position_key(game, USER))
+
+        # Swapping two hidden user pieces is invisible to the opponent
+        marshal = next(p for p in game.user.alive_pieces if p.strength == 10)
+        scout = next(p for p in game.user.alive_pieces if p.strength == 2)
+        marshal_coords, scout_coords = marshal.coords, scout.coords
+        marshal.move(*scout_coords)
+        scout.move(*marshal_coords)
+        game.clear_observations()
+        self.assertEqual(position_key(game, OPPONENT), key)
+        self.assertNotEqual(position_key(game, USER), key)
+
+        scout.is_hidden = False
+        game.clear_observations()
+        self.assertNotEqual(position_key(game, OPPONENT), key)
+
+    def test_openings_cost_a_lookup(self):
+        user_moves = RecordingStrategy()
+        book = OpeningBook(100, 10)
+        record_self_play(book, new_game(), {USER: user_moves, OPPONENT: HeuristicStrategy()}, 6)
+        self.assertEqual(len(book), 6)
+
+        # Playing the same user moves again, every opponent move comes out of the book
+        game = new_game()
+        strategy = BookStrategy(FailingStrategy(), book, 12)
+        script = ScriptedStrategy(user_moves.log)
+        for _ in range(3):
+            game.play_turn(USER, script)
+            game.play_turn(OPPONENT, strategy)
+        self.assertEqual((book.hits, book.misses), (3, 0))
+
+    def test_book_move_is_played(self):
+        game = new_game()
+        piece = next(p for p in game.opponent.movable_pieces)
+        move = piece.moves[0]
+        book = OpeningBook(10, 10)
+        book.add(position_key(game, OPPONENT), piece.coords, move)
+
+        strategy = BookStrategy(HeuristicStrategy(), book, 12)
+        report = game.play_turn(OPPONENT, strategy)
+        self.assertEqual(report.target, move)
+        self.assertEqual(book.hits, 1)
+
+        # Moves that are not legal in the position are ignored
+        book.add(position_key(game, USER), (0, 0), (5, 5))
+        report = game.play_turn(USER, BookStrategy(RandomStrategy(), book, 12))
+        self.assertIsNotNone(report.target)
+        self.assertNotEqual(report.target, (5, 5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+from collections import deque
+
+import numpy as np
+
+from stratego.dataset import ENEMY_RANKS, HIDDEN, HISTORY, OWN_RANKS, DatasetReader, PositionEncoder, ShardWriter, \
+    export_game
+from stratego.strategies import HeuristicStrategy
+from stratego.stratego_game import Stratego, USER, OPPONENT, DRAW
+from tests.helpers import piece_of, place
+
+
+def set_up(game: Stratego):
+    game.reset_pieces()
+    game.apply_user_preset(sorted(game.presets.keys())[0])
+    game.apply_opponent_preset(sorted(game.presets.keys())[1])
+
+
+class TestEncoder(unittest.TestCase):
+    def setUp(self):
+        self.game = Stratego(seed=0)
+        place(self.game, piece_of(self.game.user, 4), 1, 0)
+        general = place(self.game, piece_of(self.game.opponent, 9), 2, 9)
+        general.is_hidden = False
+        place(self.game, piece_of(self.game.opponent, 11), 3, 8)
+        self.encoder = PositionEncoder(10, 10, 2)
+
+    def encode(self, side: int, moves: deque) -> np.ndarray:
+        record = np.zeros((), self.encoder.dtype)
+        self.encoder.encode(self.game, side, moves, record)
+        return self.encoder.planes(record[np.newaxis])[0]
+
+    def test_user_view(self):
+        planes = self.encode(USER, deque([((1, 1), (1, 0))]))
+        self.assertEqual(planes.shape, (HISTORY + 4, 10, 10))
+        self.assertEqual(planes[OWN_RANKS, 0, 1], 5)
+        self.assertEqual(planes[ENEMY_RANKS, 9, 2], 10)
+        # The bomb was never seen, only that something stands there
+        self.assertEqual((planes[ENEMY_RANKS, 8, 3], planes[HIDDEN, 8, 3]), (0, 1))
+        self.assertEqual((planes[OWN_RANKS].sum(), planes[ENEMY_RANKS].sum(), planes[HIDDEN].sum()), (5, 10, 1))
+        self.assertEqual((planes[HISTORY, 1, 1], planes[HISTORY + 1, 0, 1]), (1, 1))
+        self.assertEqual(planes[HISTORY:].sum(), 2)
+
+    def test_opponent_view(self):
+        planes = self.encode(OPPONENT, deque())
+        # The opponent sees the board turned, with its own army at the bottom
+        self.assertEqual((planes[OWN_RANKS, 0, 2], planes[OWN_RANKS, 1, 3]), (10, 12))
+        self.assertEqual((planes[HIDDEN, 9, 1], planes[ENEMY_RANKS].sum()), (1, 0))
+        self.assertEqual(planes[HISTORY:].sum(), 0)
+
+
+class TestDataset(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.game = Stratego(seed=0)
+        self.strategies = {USER: HeuristicStrategy(), OPPONENT: HeuristicStrategy()}
+        self.encoder = PositionEncoder(10, 10, 4)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_export(self):
+        winners = []
+        # Shards far smaller than a game
+        with ShardWriter(self.directory.name, self.encoder, 40 * self.encoder.dtype.itemsize) as writer:
+            for _ in range(2):
+                set_up(self.game)
+                winners.append(export_game(writer, self.game, self.strategies, max_plies=60))
+        self.assertEqual(writer.positions, 120)
+
+        reader = DatasetReader(self.directory.name)
+        self.assertEqual((len(reader), reader.games, [len(shard) for shard in reader.shards]), (120, 2, [40] * 3))
+        self.assertIsInstance(reader.shards[0], np.memmap)
+        records = np.concatenate(reader.shards)
+        self.assertEqual(records['game'].tolist(), [0] * 60 + [1] * 60)
+        self.assertEqual(records['ply'][:60].tolist(), list(range(60)))
+        self.assertEqual(records['side'][:4].tolist(), [USER, OPPONENT, USER, OPPONENT])
+        for game, winner in enumerate(winners):
+            outcomes = records['outcome'][records['game'] == game]
+            if winner == DRAW:
+                self.assertFalse(outcomes.any())
+            else:
+                self.assertEqual(set(outcomes[::2].tolist()), {1 if winner == USER else -1})
+
+        batches = list(reader.batches(32))
+        self.assertEqual([len(batch[0]) for batch in batches], [32, 8] * 3)
+        planes, source, target, outcome = batches[0]
+        # Every chosen move starts from one of the mover's own pieces
+        self.assertTrue(planes[np.arange(32), OWN_RANKS, source // 10, source % 10].all())
+        # The user's first move shows up in the history of the opponent's first position, turned around
+        x, y = target[0] % 10, target[0] // 10
+        self.assertEqual(planes[1, HISTORY + 1].sum(), 1)
+        self.assertEqual(planes[1, HISTORY + 1, 9 - y, x], 1)
+
+    def test_append(self):
+        with ShardWriter(self.directory.name, self.encoder, 1 << 20) as writer:
+            set_up(self.game)
+            export_game(writer, self.game, self.strategies, max_plies=10)
+        with ShardWriter(self.directory.name, self.encoder, 1 << 20) as writer:
+            self.assertEqual((writer.positions, writer.games), (10, 1))
+            set_up(self.game)
+            export_game(writer, self.game, self.strategies, max_plies=10)
+        reader = DatasetReader(self.directory.name)
+        self.assertEqual((len(reader), reader.games, len(reader.shards)), (20, 2, 2))
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ['manifest.json', 'shard-00000.npy',
+                                                                    'shard-00001.npy'])
+
+        with self.assertRaises(Exception):
+            ShardWriter(self.directory.name, PositionEncoder(10, 10, 2), 1 << 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
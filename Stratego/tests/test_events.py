@@ -0,0 +1,100 @@
+import gc
+import unittest
+
+from stratego import outcomes
+from stratego.events import EventBus
+# Events are dispatched by class, take them from the modules publishing them
+from stratego.game_object import CallBack, GameObject, KeyPress, MousePress, input_events
+from stratego.stratego_game import Stratego, EndReason, GameOver, PieceAttacked, PieceCaptured, PieceMoved, \
+    PieceRevealed, USER, OPPONENT
+from tests.helpers import piece_of, place
+
+
+class Listener:
+    def __init__(self):
+        self.events = []
+
+    def on_event(self, event):
+        self.events.append(event)
+
+
+class Button(GameObject):
+    def __init__(self):
+        super().__init__([CallBack.KEY_PRESS, CallBack.MOUSE_PRESS])
+        self.keys = []
+        self.clicks = []
+
+    def on_key_press(self, symbol: int, modifiers: int):
+        self.keys.append(symbol)
+
+    def on_mouse_press(self, x: int, y: int, button: int, modifiers: int):
+        self.clicks.append((x, y))
+
+
+class TestEvents(unittest.TestCase):
+    def test_subscribe_unsubscribe(self):
+        bus = EventBus()
+        listener = Listener()
+        bus.subscribe(KeyPress, listener.on_event)
+        # Subscribing twice is still one subscription
+        bus.subscribe(KeyPress, listener.on_event)
+        bus.publish(KeyPress(1, 0))
+        bus.publish(MousePress(0, 0, 1, 0))
+        self.assertEqual(listener.events, [KeyPress(1, 0)])
+
+        bus.unsubscribe(KeyPress, listener.on_event)
+        bus.publish(KeyPress(2, 0))
+        self.assertEqual(len(listener.events), 1)
+        self.assertFalse(bus.has_subscribers(KeyPress))
+
+    def test_subscribers_are_weak(self):
+        bus = EventBus()
+        listener = Listener()
+        bus.subscribe(KeyPress, listener.on_event)
+        self.assertTrue(bus.has_subscribers(KeyPress))
+        del listener
+        gc.collect()
+        self.assertFalse(bus.has_subscribers(KeyPress))
+        bus.publish(KeyPress(1, 0))
+
+    def test_game_objects_get_input(self):
+        button = Button()
+        input_events.publish(KeyPress(5, 0))
+        input_events.publish(MousePress(3, 4, 1, 0))
+        self.assertEqual((button.keys, button.clicks), ([5], [(3, 4)]))
+
+        button.unsubscribe([CallBack.KEY_PRESS])
+        input_events.publish(KeyPress(6, 0))
+        input_events.publish(MousePress(5, 6, 1, 0))
+        self.assertEqual((button.keys, button.clicks), ([5], [(3, 4), (5, 6)]))
+        button.unsubscribe()
+        self.assertFalse(input_events.has_subscribers(MousePress))
+
+    def test_game_events(self):
+        game = Stratego(seed=0)
+        sergeant = place(game, piece_of(game.user, 4), 0, 0)
+        general = place(game, piece_of(game.opponent, 9), 0, 2)
+        game.start_game()
+        listener = Listener()
+        for event_type in (PieceMoved, PieceAttacked, PieceCaptured, PieceRevealed, GameOver):
+            game.events.subscribe(event_type, listener.on_event)
+
+        game.take_move(sergeant, 0, 1)
+        self.assertEqual(listener.events, [PieceMoved(game, USER, sergeant, (0, 0), (0, 1))])
+        self.assertEqual(game.ply, 1)
+
+        listener.events.clear()
+        game.take_move(general, 0, 1)
+        self.assertEqual(listener.events, [
+            PieceAttacked(game, OPPONENT, general, sergeant, (0, 2), (0, 1), outcomes.ATTACKER_WINS),
+            PieceCaptured(game, USER, sergeant, (0, 1)),
+            PieceRevealed(game, OPPONENT, general),
+        ])
+
+        listener.events.clear()
+        game.end_game(OPPONENT, EndReason.NO_MOVES)
+        self.assertEqual(listener.events, [GameOver(game, OPPONENT, EndReason.NO_MOVES)])
+
+
+if __name__ == "__main__":
+    unittest.main()
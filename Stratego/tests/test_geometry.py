@@ -0,0 +1,53 @@
+import unittest
+
+import numpy as np
+
+from stratego.batch import BatchSimulator, EMPTY, USER
+from stratego.geometry import classic_lakes, board_geometry
+from stratego.pieces import Piece
+from stratego.stratego_game import Stratego
+
+CLASSIC = {(2, 4), (3, 4), (2, 5), (3, 5), (6, 4), (7, 4), (6, 5), (7, 5)}
+
+
+class TestGeometry(unittest.TestCase):
+    def test_classic_lakes(self):
+        self.assertEqual(classic_lakes(10, 10, 4), CLASSIC)
+        self.assertEqual(len(classic_lakes(20, 20, 8)), 8 * 4)
+        self.assertEqual(classic_lakes(8, 10, 4), frozenset())
+
+    def test_tables(self):
+        geometry = board_geometry(10, 10, frozenset(CLASSIC))
+        self.assertIs(geometry, board_geometry(10, 10, frozenset(CLASSIC)))
+        self.assertFalse(geometry.is_open(2, 4))
+        self.assertFalse(geometry.is_open(10, 0))
+        self.assertEqual(geometry.neighbors[(0, 0)], ((0, 1), (1, 0)))
+        # Up the column from (2, 0) the lake at (2, 4) cuts the ray short
+        self.assertEqual(geometry.ray((2, 0), 2, 9), ((2, 1), (2, 2), (2, 3)))
+        self.assertEqual(len(geometry.ray((0, 4), 9, 4)), 1)
+
+    def test_lakes_block_moves(self):
+        game = Stratego(seed=0)
+        scout = Piece('Scout', 2, move_limit=None)
+        sergeant = Piece('Sergeant', 4)
+        scout.move(2, 0)
+        sergeant.move(4, 4)
+        game.board.pieces.extend((scout, sergeant))
+        self.assertEqual(game.board.get_moves(scout),
+                         [(0, 0), (1, 0), (2, 1), (2, 2), (2, 3), (3, 0), (4, 0), (5, 0), (6, 0), (7, 0), (8, 0),
+                          (9, 0)])
+        self.assertFalse(game.board.can_move(2, 5, scout))
+        self.assertNotIn((3, 4), game.board.get_moves(sergeant))
+
+    def test_batch_lakes(self):
+        simulator = BatchSimulator(1, seed=0)
+        ranks = np.full((1, 100), EMPTY, dtype=np.int8)
+        owners = np.full((1, 100), EMPTY, dtype=np.int8)
+        # User scout at (2, 0), only the row and three squares up the column are open
+        ranks[0, 2], owners[0, 2] = 2, USER
+        simulator.load(ranks, owners, owners != EMPTY, np.array([USER]))
+        self.assertEqual(np.count_nonzero(simulator.legal_moves()), 12)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+from stratego.stratego_game import Stratego
+
+
+def snapshot(game: Stratego) -> list[tuple]:
+    return [(piece.coords, piece.is_hidden, piece.is_captured, list(piece.moves)) for piece in game.board.pieces]
+
+
+class TestMakeUnmake(unittest.TestCase):
+    def setUp(self):
+        self.game = Stratego(seed=7)
+        self.game.apply_user_preset(2)
+        self.game.apply_opponent_preset(1)
+        self.game.update_moves()
+        # Play into the middlegame so attacks are available
+        for _ in range(30):
+            self.game.opponent_turn()
+
+    def test_unmake_restores_state(self):
+        before = snapshot(self.game)
+        for piece in self.game.board.alive_pieces:
+            for move in list(piece.moves):
+                delta = self.game.board.make_move(piece, *move)
+                self.game.board.unmake_move(delta)
+                self.assertEqual(snapshot(self.game), before)
+
+    def test_updated_moves_match_full_update(self):
+        for piece in self.game.opponent.movable_pieces:
+            for move in list(piece.moves):
+                delta = self.game.board.make_move(piece, *move)
+                incremental = snapshot(self.game)
+                self.game.update_moves()
+                full = snapshot(self.game)
+                # Captured pieces keep stale moves after a full update, compare only live ones
+                for inc, ref in zip(incremental, full):
+                    if not ref[2]:
+                        self.assertEqual(inc, ref)
+                self.game.board.unmake_move(delta)
+                self.game.update_moves()
+
+    def assert_threats_consistent(self):
+        board = self.game.board
+        for player in (self.game.user, self.game.opponent):
+            for x in range(board.columns):
+                for y in range(board.rows):
+                    expected = [id(p) for p in player.alive_pieces if (x, y) in p.moves]
+                    found = [id(p) for p in board.threatened_by(x, y, player)]
+                    self.assertEqual(sorted(found), sorted(expected))
+
+    def test_threat_map(self):
+        self.assert_threats_consistent()
+        piece = self.game.opponent.movable_pieces[0]
+        delta = self.game.board.make_move(piece, *piece.moves[0])
+        self.assert_threats_consistent()
+        self.game.board.unmake_move(delta)
+        self.assert_threats_consistent()
+        self.assertTrue(self.game.board.threatens(piece, *piece.moves[0]))
+
+    def test_threat_map_after_reset(self):
+        # Pieces keep their move lists when the board is cleared and they are put back
+        pieces = list(self.game.board.pieces)
+        self.game.board.reset_pieces()
+        self.game.board.pieces.extend(pieces)
+        self.game.update_moves()
+        self.assert_threats_consistent()
+
+    def test_line_of_play(self):
+        before = snapshot(self.game)
+        deltas = []
+        for _ in range(6):
+            for side in (self.game.opponent, self.game.user):
+                movable = side.movable_pieces
+                if not movable:
+                    continue
+                piece = self.game.rng.choice(movable)
+                deltas.append(self.game.board.make_move(piece, *self.game.rng.choice(piece.moves)))
+        for delta in reversed(deltas):
+            self.game.board.unmake_move(delta)
+        self.assertEqual(snapshot(self.game), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import dataclasses
+import unittest
+
+from stratego.observation import PUBLIC
+from stratego.stratego_game import Stratego, USER, OPPONENT
+from tests.helpers import piece_of, place
+
+
+class TestObservation(unittest.TestCase):
+    def setUp(self):
+        self.game = Stratego(seed=0)
+        self.sergeant = place(self.game, piece_of(self.game.user, 4), 0, 0)
+        self.general = place(self.game, piece_of(self.game.opponent, 9), 0, 2)
+        place(self.game, piece_of(self.game.opponent, 11), 5, 5)
+        self.game.start_game()
+
+    def test_viewpoints(self):
+        user = self.game.observe(USER)
+        self.assertEqual([(piece.coords, piece.strength) for piece in user.own], [((0, 0), 4)])
+        self.assertEqual(sorted((piece.coords, piece.strength) for piece in user.enemy),
+                         [((0, 2), None), ((5, 5), None)])
+        self.assertEqual(user.squares[(0, 2)].strength, None)
+        self.assertEqual(len(user.hidden_enemies), 2)
+
+        opponent = self.game.observe(OPPONENT)
+        self.assertEqual(sorted(piece.strength for piece in opponent.own), [9, 11])
+        self.assertEqual([piece.strength for piece in opponent.enemy], [None])
+
+        # Spectators sit in the user's seat but only see what both sides have seen
+        public = self.game.observe(PUBLIC)
+        self.assertEqual([piece.strength for piece in public.own], [None])
+        self.assertEqual(sorted(piece.strength for piece in self.game.observe(USER, reveal=True).enemy), [9, 11])
+
+    def test_built_once_per_position(self):
+        observation = self.game.observe(USER)
+        self.assertIs(self.game.observe(USER), observation)
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            observation.ply = 3
+        with self.assertRaises(TypeError):
+            observation.squares[(1, 1)] = None
+
+        # The general wins the attack and both ranks become known
+        self.game.take_move(self.sergeant, 0, 1)
+        self.game.take_move(self.general, 0, 1)
+        after = self.game.observe(USER)
+        self.assertIsNot(after, observation)
+        self.assertEqual((after.ply, after.own, after.own_captured), (2, (), (4,)))
+        self.assertEqual(after.squares[(0, 1)].strength, 9)
+        self.assertEqual(self.game.observe(OPPONENT).enemy_captured, (4,))
+        self.assertEqual([piece.strength for piece in self.game.observe(PUBLIC).enemy if not piece.is_hidden], [9])
+        # What the user knew before the move is unchanged
+        self.assertEqual(observation.squares[(0, 2)].strength, None)
+
+
+if __name__ == "__main__":
+    unittest.main()
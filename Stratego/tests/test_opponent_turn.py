@@ -0,0 +1,82 @@
+import unittest
+
+from stratego.config import config
+from stratego.stratego_game import Stratego, OPPONENT
+from tests.helpers import piece_of, place
+
+
+class TestOpponentTurn(unittest.TestCase):
+    def setUp(self):
+        self.game = Stratego(seed=0)
+
+    def test_spy_takes_marshal(self):
+        spy = place(self.game, piece_of(self.game.opponent, 1), 4, 5)
+        place(self.game, piece_of(self.game.opponent, 10), 8, 8)
+        marshal = place(self.game, piece_of(self.game.user, 10), 4, 4)
+        marshal.is_hidden = False
+        place(self.game, piece_of(self.game.user, 4), 0, 0)
+
+        previous_pos, move = self.game.opponent_turn()
+        self.assertEqual((previous_pos, move), ((4, 5), (4, 4)))
+        self.assertTrue(marshal.is_captured)
+        self.assertEqual(spy.coords, (4, 4))
+
+    def test_hidden_ranks_stay_hidden(self):
+        place(self.game, piece_of(self.game.opponent, 1), 4, 5)
+        place(self.game, piece_of(self.game.opponent, 10), 8, 8)
+        place(self.game, piece_of(self.game.user, 10), 4, 4)
+        place(self.game, piece_of(self.game.user, 4), 0, 0)
+
+        # The spy has no idea the marshal is next to it, the marshal moves forward instead
+        self.assertEqual(self.game.opponent_turn(), ((8, 8), (8, 7)))
+        observation = self.game.observe(OPPONENT)
+        self.assertEqual([piece.strength for piece in observation.enemy], [None, None])
+        self.assertEqual(sorted(piece.strength for piece in observation.own), [1, 10])
+
+    def test_avoids_known_stronger_piece(self):
+        sergeant = place(self.game, piece_of(self.game.opponent, 4), 0, 1)
+        general = place(self.game, piece_of(self.game.user, 9), 0, 0)
+        general.is_hidden = False
+
+        for _ in range(10):
+            self.game.update_moves()
+            self.assertNotEqual(self.game.opponent_turn()[1], (0, 0))
+            self.assertFalse(sergeant.is_captured)
+
+    def test_only_losing_moves_left(self):
+        sergeant = place(self.game, piece_of(self.game.opponent, 4), 0, 0)
+        place(self.game, piece_of(self.game.opponent, 0), 1, 0)
+        general = place(self.game, piece_of(self.game.user, 9), 0, 1)
+        general.is_hidden = False
+        self.game.update_moves()
+
+        self.assertEqual(self.game.heuristic_move(OPPONENT), (sergeant, (0, 1)))
+
+    def test_scout_probes_hidden_piece(self):
+        scout = place(self.game, piece_of(self.game.opponent, 2), 0, 9)
+        sergeant = place(self.game, piece_of(self.game.user, 4), 0, 2)
+
+        self.assertEqual(self.game.opponent_turn(), ((0, 9), (0, 2)))
+        # The scout loses but the sergeant is now known
+        self.assertTrue(scout.is_captured)
+        self.assertFalse(sergeant.is_hidden)
+
+    def test_unseeded_game(self):
+        self.assertIsNone(Stratego(seed=None).master_seed)
+        self.assertEqual(Stratego().master_seed, config['seed'])
+
+    def test_seeded_games_repeat(self):
+        def play(seed: int, game_index: int) -> list:
+            game = Stratego(seed=seed, game_index=game_index)
+            game.apply_user_preset(1)
+            game.board.add_opponent_pieces(game.opponent, game.rng)
+            game.start_game()
+            setup = [(piece.name, piece.coords) for piece in game.opponent.alive_pieces]
+            return setup + [game.opponent_turn() for _ in range(30)]
+
+        self.assertEqual(play(11, 3), play(11, 3))
+        self.assertNotEqual(play(11, 3), play(11, 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
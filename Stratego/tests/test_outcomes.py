@@ -0,0 +1,82 @@
+import json
+import unittest
+
+import numpy as np
+
+from stratego.batch import BatchSimulator
+from stratego.outcomes import OUTCOMES, ATTACKER_WINS, DEFENDER_WINS, BOTH_LOSE, build_table
+from stratego.pieces import Piece
+
+UNIT_DATA_FILENAME = "assets/units.json"
+units = json.load(open(UNIT_DATA_FILENAME, "r"))
+
+
+def make_piece(strength: int) -> Piece:
+    unit = units[strength]
+    return Piece(unit['name'], strength, unit['kill_marshal'], unit['defuse_bombs'], unit['move_limit'])
+
+
+def legacy_oracle(attacker: Piece, defender: Piece) -> int:
+    # Reference copy of the original can_kill based oracle
+    def can_kill(piece, other):
+        if piece.kill_marshal and other.strength == 10:
+            return True
+        elif piece.defuse_bombs and other.strength == 11:
+            return True
+        return piece.strength >= other.strength
+
+    if can_kill(attacker, defender) and can_kill(defender, attacker):
+        if attacker.kill_marshal != defender.kill_marshal or attacker.defuse_bombs != defender.defuse_bombs:
+            return ATTACKER_WINS
+        return BOTH_LOSE
+    elif can_kill(attacker, defender):
+        return ATTACKER_WINS
+    return DEFENDER_WINS
+
+
+class TestOutcomes(unittest.TestCase):
+    def test_table_shape(self):
+        self.assertEqual(len(OUTCOMES), len(units))
+        for row in OUTCOMES:
+            self.assertEqual(len(row), len(units))
+
+    def test_table_matches_legacy_oracle(self):
+        for a in range(len(units)):
+            for b in range(len(units)):
+                with self.subTest(attacker=a, defender=b):
+                    self.assertEqual(OUTCOMES[a][b], legacy_oracle(make_piece(a), make_piece(b)))
+
+    def test_attack_matches_table(self):
+        for a in range(len(units)):
+            for b in range(len(units)):
+                attacker, defender = make_piece(a), make_piece(b)
+                attacker.move(0, 0)
+                defender.move(0, 1)
+                attacker.attack(defender)
+                expected = OUTCOMES[a][b]
+                with self.subTest(attacker=a, defender=b):
+                    self.assertEqual(attacker.is_captured, expected != ATTACKER_WINS)
+                    self.assertEqual(defender.is_captured, expected != DEFENDER_WINS)
+
+    def test_batch_matches_table(self):
+        simulator = BatchSimulator(1)
+        attackers, defenders = np.divmod(np.arange(len(units) ** 2), len(units))
+        result = simulator.resolve(attackers, defenders).reshape(len(units), len(units))
+        self.assertEqual(result.tolist(), [list(row) for row in build_table(units)])
+
+    def test_special_cases(self):
+        self.assertEqual(OUTCOMES[1][10], ATTACKER_WINS)
+        self.assertEqual(OUTCOMES[10][1], ATTACKER_WINS)
+        self.assertEqual(OUTCOMES[3][11], ATTACKER_WINS)
+        self.assertEqual(OUTCOMES[10][11], DEFENDER_WINS)
+        self.assertEqual(OUTCOMES[1][9], DEFENDER_WINS)
+        self.assertEqual(OUTCOMES[7][7], BOTH_LOSE)
+
+    def test_custom_strength(self):
+        # Pieces outside the unit table fall back to the same rules
+        self.assertTrue(Piece("test", 47).can_kill(make_piece(10)))
+        self.assertIsNone(Piece("test", 47).attack_oracle(Piece("test", 47)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+
+from stratego.pieces import army_counts, load_units
+from stratego.presets import PresetLibrary, compile_preset, load_presets, import_json, write_library
+from stratego.stratego_game import Stratego
+
+PRESET_DATA_FILENAME = "assets/presets.json"
+presets_file = json.load(open(PRESET_DATA_FILENAME, "r"))
+
+
+class TestPresets(unittest.TestCase):
+    def test_load(self):
+        presets = load_presets(PRESET_DATA_FILENAME)
+        self.assertEqual(sorted(presets), [preset['index'] for preset in presets_file])
+        for preset in presets.values():
+            self.assertEqual(sorted(preset.order), list(range(40)))
+
+    def test_apply_matches_layout(self):
+        game = Stratego(seed=0)
+        game.apply_user_preset(2)
+        game.apply_opponent_preset(3)
+        layouts = {preset['index']: preset['layout'] for preset in presets_file}
+
+        user_names = [game.board.is_occupied(x, y).name for y in range(0, 4) for x in range(10)]
+        opponent_names = [game.board.is_occupied(x, y).name for y in range(9, 5, -1) for x in range(10)]
+        self.assertEqual(user_names, layouts[2])
+        self.assertEqual(opponent_names, layouts[3])
+        self.assertEqual(len(game.board.pieces), 80)
+
+    def test_invalid_layouts(self):
+        layout = list(presets_file[0]['layout'])
+        with self.assertRaises(Exception):
+            compile_preset(1, layout[:-1])
+        with self.assertRaises(Exception):
+            compile_preset(1, layout[:-1] + ["Marshal"])
+        with self.assertRaises(Exception):
+            compile_preset(1, layout[:-1] + ["Dragon"])
+
+    def test_load_skips_other_boards(self):
+        layout = list(presets_file[0]['layout'])
+        # The army of a 20 column board
+        units = load_units()
+        wide = [units[strength]['name'] for strength, count in army_counts(20, 4).items() for _ in range(count)]
+        with tempfile.TemporaryDirectory() as directory:
+            name = os.path.join(directory, 'presets.json')
+            with open(name, 'w') as file:
+                json.dump([{'index': 1, 'layout': layout}, {'index': 2, 'layout': wide}], file)
+            self.assertEqual(sorted(load_presets(name)), [1])
+
+            name = os.path.join(directory, 'broken.json')
+            with open(name, 'w') as file:
+                json.dump([{'index': 1, 'layout': layout}, {'index': 2, 'layout': layout[:-1]}], file)
+            with self.assertRaises(Exception):
+                load_presets(name)
+
+    def test_library_matches_json(self):
+        with tempfile.TemporaryDirectory() as directory:
+            name = os.path.join(directory, 'presets.strpre')
+            import_json(PRESET_DATA_FILENAME, name)
+            presets = load_presets(PRESET_DATA_FILENAME)
+            with PresetLibrary(name) as library:
+                self.assertEqual(len(library), len(presets))
+                self.assertEqual(library.keys(), sorted(presets))
+                for index, preset in presets.items():
+                    self.assertIn(index, library)
+                    self.assertEqual(library[index], preset)
+                self.assertNotIn(0, library)
+                with self.assertRaises(KeyError):
+                    library[0]
+
+    def test_large_library(self):
+        layouts = [preset['layout'] for preset in presets_file]
+        rng = random.Random(0)
+        generated = {}
+        for index in rng.sample(range(1, 1_000_000), 5000):
+            layout = list(rng.choice(layouts))
+            rng.shuffle(layout)
+            generated[index] = layout
+
+        with tempfile.TemporaryDirectory() as directory:
+            name = os.path.join(directory, 'presets.strpre')
+            write_library(generated, name)
+            with PresetLibrary(name) as library:
+                self.assertEqual(len(library), 5000)
+                for index in rng.sample(sorted(generated), 50):
+                    self.assertEqual(list(library[index].layout), generated[index])
+
+    def test_invalid_library_layout(self):
+        layout = list(presets_file[0]['layout'])
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(Exception):
+                write_library({1: layout[:-1] + ["Marshal"]}, os.path.join(directory, 'presets.strpre'))
+
+
+if __name__ == "__main__":
+    unittest.main()
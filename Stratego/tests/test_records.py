@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+
+from stratego.records import GameRecordWriter, GameRecordReader, MOVE, UNFINISHED
+from stratego.stratego_game import Stratego, OPPONENT
+
+
+class TestRecords(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.name = os.path.join(self.directory.name, "games.strec")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        with GameRecordWriter(self.name, 10, 10) as writer:
+            for plies in (5, 12):
+                game = Stratego(seed=0, game_index=plies)
+                game.apply_user_preset(1)
+                game.apply_opponent_preset(2)
+                game.update_moves()
+                game.start_recording(writer)
+                for _ in range(plies):
+                    game.opponent_turn()
+                game.finish_recording(OPPONENT, 3)
+
+        with GameRecordReader(self.name) as reader:
+            self.assertEqual(len(reader), 2)
+            self.assertEqual(reader.plies.tolist(), [5, 12])
+            self.assertEqual(reader.winners.tolist(), [OPPONENT, OPPONENT])
+            game = reader[1]
+            self.assertEqual(len(game.setup), 80)
+            self.assertTrue((game.moves['kind'] == MOVE).all())
+            self.assertEqual(game.reason, 3)
+            # Opponent setup starts in the top row
+            self.assertIn(game.to_coords(game.setup[-1]['source'])[1], range(6, 10))
+
+    def test_append_and_unfinished(self):
+        with GameRecordWriter(self.name, 10, 10) as writer:
+            writer.begin_game([(0, 0, 0, 0)])
+            writer.record_move(0, (0, 0), (0, 1), 0)
+        # Reopening appends to the same file
+        with GameRecordWriter(self.name, 10, 10) as writer:
+            writer.begin_game([(0, 0, 0, 0)])
+            writer.end_game(0)
+        with GameRecordReader(self.name) as reader:
+            self.assertEqual(reader.winners.tolist(), [UNFINISHED, 0])
+            self.assertEqual(reader.plies.tolist(), [1, 0])
+
+    def test_crash_mid_game(self):
+        writer = GameRecordWriter(self.name, 10, 10)
+        writer.begin_game([(0, 0, 0, 0)])
+        writer.end_game(0)
+        writer.begin_game([(0, 1, 0, 0), (1, 1, 9, 0)])
+        writer.record_move(0, (1, 0), (1, 1), 0)
+        # The process dies part way through writing an entry, nothing closes the game
+        writer._file.write(b'\x01\x00\x05')
+        writer._file.close()
+
+        with GameRecordWriter(self.name, 10, 10) as writer:
+            writer.begin_game([(0, 2, 0, 0), (1, 2, 9, 0), (0, 3, 0, 0)])
+            writer.record_move(0, (2, 0), (2, 1), 0)
+            writer.end_game(1)
+        with GameRecordReader(self.name) as reader:
+            self.assertEqual(reader.winners.tolist(), [0, 1])
+            self.assertEqual(reader.plies.tolist(), [0, 1])
+            self.assertEqual(len(reader[1].setup), 3)
+
+    def test_size_mismatch(self):
+        GameRecordWriter(self.name, 10, 10).close()
+        with self.assertRaises(Exception):
+            GameRecordWriter(self.name, 20, 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+
+from stratego.records import GameRecordWriter, GameRecordReader
+from stratego.replay import Replay
+from stratego.stratego_game import Stratego, OPPONENT
+
+
+def board_state(game: Stratego) -> list[tuple[int, int, int, str, bool]]:
+    pieces = [(piece.x_pos, piece.y_pos, game.side_of(piece), piece.name, piece.is_hidden)
+              for piece in game.board.alive_pieces if piece.x_pos is not None]
+    return sorted(pieces, key=lambda p: (p[1], p[0]))
+
+
+class TestReplay(unittest.TestCase):
+    def test_seek_matches_game(self):
+        directory = tempfile.TemporaryDirectory()
+        name = os.path.join(directory.name, "games.strec")
+
+        # Play the opponent AI against a passive user and remember every state
+        game = Stratego(seed=4)
+        game.apply_user_preset(1)
+        game.apply_opponent_preset(3)
+        game.update_moves()
+        states = [board_state(game)]
+        with GameRecordWriter(name, 10, 10) as writer:
+            game.start_recording(writer)
+            for _ in range(40):
+                game.opponent_turn()
+                states.append(board_state(game))
+            game.finish_recording(OPPONENT)
+
+        with GameRecordReader(name) as reader:
+            replay = Replay(reader[0], reader.rows, reader.columns, keyframe_interval=8)
+        self.assertEqual(replay.plies, 40)
+        # Jump around in both directions
+        for ply in [40, 0, 17, 16, 3, 39, 8, 9, 25, 24, 40]:
+            replay.seek(ply)
+            with self.subTest(ply=ply):
+                self.assertEqual(replay.ply, ply)
+                self.assertEqual(sorted(replay.pieces(), key=lambda p: (p[1], p[0])), states[ply])
+        directory.cleanup()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+
+from stratego.stratego_game import Stratego, EndReason, USER, OPPONENT, DRAW
+from tests.helpers import new_game, piece_of, place
+
+
+class TestRules(unittest.TestCase):
+    def setUp(self):
+        self.game = Stratego(seed=0)
+        place(self.game, piece_of(self.game.user, 0), 0, 0)
+        place(self.game, piece_of(self.game.opponent, 0), 9, 9)
+        self.user_piece = place(self.game, piece_of(self.game.user, 5), 2, 2)
+        self.opponent_piece = place(self.game, piece_of(self.game.opponent, 5), 7, 7)
+        self.game.start_game()
+
+    def shuffle(self, times: int):
+        # Both sides step right and back again
+        for _ in range(times):
+            for piece in (self.user_piece, self.opponent_piece):
+                self.game.take_move(piece, piece.x_pos + 1, piece.y_pos)
+            for piece in (self.user_piece, self.opponent_piece):
+                self.game.take_move(piece, piece.x_pos - 1, piece.y_pos)
+
+    def test_ongoing(self):
+        self.assertIsNone(self.game.check_game_over())
+
+    def test_repetition(self):
+        self.shuffle(1)
+        self.assertIsNone(self.game.check_game_over())
+        self.shuffle(1)
+        self.assertEqual(self.game.check_game_over(), (DRAW, EndReason.REPETITION))
+
+    def test_position_key_incremental(self):
+        game = new_game(3)
+        for _ in range(40):
+            game.opponent_turn()
+            key = game.position_key()
+            game.rehash()
+            self.assertEqual(game.position_key(), key)
+
+    def test_no_progress(self):
+        self.game.max_repetitions = 1000
+        self.game.no_capture_limit = 12
+        self.shuffle(2)
+        self.assertIsNone(self.game.check_game_over())
+        self.shuffle(1)
+        self.assertEqual(self.game.check_game_over(), (DRAW, EndReason.NO_PROGRESS))
+
+    def test_capture_resets_counters(self):
+        self.shuffle(1)
+        self.opponent_piece.move(3, 2)
+        self.game.take_move(self.user_piece, 3, 2)
+        self.assertEqual(self.game.plies_since_capture, 0)
+        self.assertEqual(len(self.game.position_counts), 1)
+
+    def test_no_moves(self):
+        for piece in (self.user_piece, self.opponent_piece):
+            piece.is_captured = True
+            piece.move(None, None)
+        self.game.update_moves()
+        self.assertEqual(self.game.check_game_over(), (DRAW, EndReason.NO_MOVES))
+
+    def test_flag_captured(self):
+        flag = self.game.board.is_occupied(9, 9)
+        self.opponent_piece.move(5, 5)
+        self.user_piece.move(9, 8)
+        self.game.take_move(self.user_piece, 9, 9)
+        self.assertTrue(flag.is_captured)
+        self.assertEqual(self.game.check_game_over(), (USER, EndReason.FLAG_CAPTURED))
+        self.assertNotEqual(self.game.check_game_over()[0], OPPONENT)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import time
+import unittest
+
+import numpy as np
+
+from stratego import sampling
+from stratego.sampling import MOVED, MOVED_FAR, UNMOVED, RolloutSearch, SharedTask, determinize, run_rollouts, \
+    run_shared, unit_move_limits
+from stratego.stratego_game import Stratego, USER, OPPONENT
+from stratego.strategies import SamplingStrategy
+from tests.helpers import new_game, piece_of, place
+
+
+class TestSampling(unittest.TestCase):
+    def test_determinize_respects_observations(self):
+        move_limits = unit_move_limits()
+        pool = np.array([0, 11, 11, 2, 2, 5, 7, 10], dtype=np.int8)
+        seen = np.array([MOVED_FAR, MOVED, MOVED, UNMOVED, UNMOVED, UNMOVED, UNMOVED, MOVED], dtype=np.int8)
+        rng = np.random.default_rng(0)
+        for _ in range(200):
+            ranks = determinize(rng, pool, seen, move_limits)
+            self.assertEqual(sorted(ranks.tolist()), sorted(pool.tolist()))
+            self.assertIsNone(move_limits[ranks[0]])
+            for rank in ranks[seen != UNMOVED]:
+                self.assertNotEqual(move_limits[rank], 0)
+
+    def test_determinize_with_pieces_off_the_board(self):
+        move_limits = unit_move_limits()
+        # One scout among many bombs, the scout must always be dealt to the piece that jumped
+        pool = np.array([2] + [11] * 20, dtype=np.int8)
+        seen = np.array([MOVED_FAR, UNMOVED, UNMOVED], dtype=np.int8)
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            self.assertEqual(determinize(rng, pool, seen, move_limits).tolist(), [2, 11, 11])
+
+    def test_rollouts_stop_at_deadline(self):
+        game = new_game()
+        candidates = [(piece, move) for piece in game.user.movable_pieces for move in piece.moves]
+        task = RolloutSearch(workers=0, samples=2, plies=1000).encode(game, USER, candidates)
+        task.stop_at = time.time() - 1
+
+        start = time.perf_counter()
+        scores, played = run_rollouts(task)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual(played, 2)
+        # Nothing was played out, every candidate is scored by the material left after it
+        self.assertTrue(((scores >= 0) & (scores <= 2)).all())
+
+    def test_observed_moves(self):
+        game = Stratego(seed=0)
+        scout = place(game, piece_of(game.opponent, 2), 0, 9)
+        sergeant = place(game, piece_of(game.opponent, 4), 5, 9)
+        game.start_game()
+        game.take_move(sergeant, 5, 8)
+        self.assertTrue(sergeant.has_moved)
+        self.assertFalse(sergeant.has_moved_far)
+        game.take_move(scout, 0, 4)
+        self.assertTrue(scout.has_moved_far)
+
+        task = RolloutSearch(workers=0).encode(game, USER, [])
+        self.assertEqual(task.seen[task.unknown.tolist().index(4 * 10 + 0)], MOVED_FAR)
+        self.assertEqual(task.seen[task.unknown.tolist().index(8 * 10 + 5)], MOVED)
+
+    def test_encode_hides_unknown_ranks(self):
+        game = new_game()
+        revealed = game.opponent.alive_pieces[5]
+        revealed.is_hidden = False
+
+        candidates = [(piece, move) for piece in game.user.movable_pieces for move in piece.moves]
+        task = RolloutSearch(workers=0).encode(game, USER, candidates)
+        self.assertEqual(len(task.unknown), 39)
+        self.assertEqual(len(task.pool), 39)
+        self.assertTrue((task.ranks[task.unknown] == -1).all())
+        self.assertEqual(task.ranks[revealed.y_pos * 10 + revealed.x_pos], revealed.strength)
+        self.assertEqual(np.count_nonzero(task.owners == USER), 40)
+
+    def test_takes_the_flag(self):
+        game = Stratego(seed=0)
+        flag = place(game, piece_of(game.opponent, 0), 5, 5)
+        flag.is_hidden = False
+        place(game, piece_of(game.opponent, 11), 0, 9)
+        place(game, piece_of(game.opponent, 4), 9, 9)
+        place(game, piece_of(game.user, 4), 5, 4)
+        place(game, piece_of(game.user, 0), 0, 0)
+        game.start_game()
+
+        strategy = SamplingStrategy(RolloutSearch(workers=0, samples=4, plies=10, max_tasks=2))
+        report = game.play_turn(USER, strategy)
+        self.assertEqual(report.target, (5, 5))
+        self.assertFalse(game.opponent.has_flag)
+        self.assertEqual(strategy.search.last_samples, 8)
+
+    def test_shared_task(self):
+        game = new_game()
+        candidates = [(piece, move) for piece in game.user.movable_pieces for move in piece.moves]
+        task = RolloutSearch(workers=0, samples=2, plies=10).encode(game, USER, candidates)
+        task.seed = 7
+
+        shared = SharedTask.create(task, 3)
+        try:
+            view = shared.task(7, None, task.policy)
+            for field in ('ranks', 'owners', 'hidden', 'unknown', 'seen', 'pool', 'sources', 'targets', 'lakes'):
+                self.assertTrue(np.array_equal(getattr(view, field), getattr(task, field)), field)
+                self.assertEqual(getattr(view, field).dtype, getattr(task, field).dtype, field)
+            self.assertEqual((view.side, view.samples, view.plies, view.rows, view.columns),
+                             (task.side, task.samples, task.plies, task.rows, task.columns))
+
+            # A worker reads the position in place and leaves its scores in its slot only
+            self.assertEqual(run_shared(shared.name, 1, 7, None, task.policy), 2)
+            expected, _ = run_rollouts(task)
+            self.assertTrue(np.array_equal(shared.scores[1], expected))
+            self.assertFalse(shared.scores[[0, 2]].any())
+            self.assertFalse(sampling._attached.arrays['ranks'].flags.writeable)
+        finally:
+            sampling._attached.release()
+            sampling._attached = None
+            shared.release()
+
+    def test_worker_pool(self):
+        game = new_game()
+        strategy = SamplingStrategy(RolloutSearch(workers=2, samples=2, plies=10, max_tasks=3))
+        try:
+            for side in (USER, OPPONENT):
+                report = game.play_turn(side, strategy)
+                self.assertIsNotNone(report.target)
+                self.assertEqual(strategy.search.last_samples, 6)
+        finally:
+            strategy.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
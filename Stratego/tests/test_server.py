@@ -0,0 +1,263 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+
+from stratego import outcomes, protocol
+from stratego.load_test import run_load_test
+from stratego.server import GameServer, Session
+from stratego.stratego_game import GameOver, PieceAttacked, PieceMoved, Stratego, USER, OPPONENT
+from stratego.strategies import HeuristicStrategy
+from stratego.sync import PUBLIC
+
+
+class TestProtocol(unittest.TestCase):
+    def test_round_trip(self):
+        frame = protocol.encode(protocol.SNAPSHOT, 7, 0, USER, USER, tail=bytes(range(100)))
+        length, kind = protocol.HEADER.unpack_from(frame)
+        self.assertEqual((length, kind), (110, protocol.SNAPSHOT))
+        fields, tail = protocol.decode(kind, frame[protocol.HEADER.size:])
+        self.assertEqual(fields, (7, 0, USER, USER))
+        self.assertEqual(tail, bytes(range(100)))
+
+    def test_bad_frames(self):
+        with self.assertRaises(Exception):
+            protocol.decode(99, b'')
+        with self.assertRaises(Exception):
+            protocol.decode(protocol.MOVE, b'\x01')
+
+
+class BlockingStrategy(HeuristicStrategy):
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+        self.thinking = False
+        self.closed_while_thinking = None
+
+    def choose_move(self, game, side, deadline):
+        self.thinking = True
+        self.release.wait(5)
+        self.thinking = False
+        return super().choose_move(game, side, deadline)
+
+    def close(self):
+        self.closed_while_thinking = self.thinking
+
+
+class TestSession(unittest.TestCase):
+    def test_setup_without_presets(self):
+        game = Stratego(seed=0)
+        # No preset fits the army, both sides are dealt out randomly
+        game.presets = {}
+        session = Session(1, game, protocol.VS_AI, None)
+        session.apply_preset(USER, protocol.ANY_PRESET)
+        session.apply_preset(OPPONENT, 5)
+        self.assertEqual(len(game.board.pieces), 80)
+        self.assertEqual({piece.y_pos for piece in game.user.alive_pieces}, set(game.setup_zone(USER)))
+        self.assertEqual({piece.y_pos for piece in game.opponent.alive_pieces}, set(game.setup_zone(OPPONENT)))
+
+
+class TestServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.checkpoints = tempfile.TemporaryDirectory()
+        self.server = GameServer('127.0.0.1', 0, ai_workers=2, seed=7, checkpoint_directory=self.checkpoints.name)
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.close()
+        self.checkpoints.cleanup()
+
+    async def connect(self):
+        return await asyncio.open_connection('127.0.0.1', self.server.port)
+
+    async def test_game_against_ai(self):
+        reader, writer = await self.connect()
+        writer.write(protocol.encode(protocol.CREATE, protocol.VS_AI, protocol.ANY_PRESET))
+        kind, (game_id, side, rows, columns), _ = await protocol.read_message(reader)
+        self.assertEqual((kind, side, rows, columns), (protocol.JOINED, USER, 10, 10))
+        kind, (snapshot_id, ply, turn, viewpoint), board = await protocol.read_message(reader)
+        self.assertEqual((kind, snapshot_id, ply, turn, viewpoint), (protocol.SNAPSHOT, game_id, 0, USER, USER))
+        self.assertEqual(len(board), 100)
+        # Enemy ranks are never sent, lakes are
+        self.assertEqual(board.count(protocol.HIDDEN), 40)
+        self.assertEqual(board.count(protocol.LAKE), 8)
+
+        # Moving out of turn order or off the piece's moves is refused
+        writer.write(protocol.encode(protocol.MOVE, 0, 99))
+        kind, (code,), _ = await protocol.read_message(reader)
+        self.assertEqual((kind, code), (protocol.ERROR, protocol.ILLEGAL_MOVE))
+
+        game = self.server.sessions[game_id].game
+        piece, move = next((piece, move) for piece in game.user.movable_pieces for move in piece.moves)
+        writer.write(protocol.encode(protocol.MOVE, piece.y_pos * 10 + piece.x_pos, move[1] * 10 + move[0]))
+        kind, fields, _ = await protocol.read_message(reader)
+        self.assertEqual((kind, fields[:3]), (protocol.MOVED, (game_id, 1, USER)))
+        # The AI answers straight away
+        kind, fields, _ = await protocol.read_message(reader)
+        self.assertEqual((kind, fields[:3]), (protocol.MOVED, (game_id, 2, OPPONENT)))
+
+        writer.write(protocol.encode(protocol.LEAVE))
+        # The server closes the connection once the game is given up
+        self.assertIsNone(await protocol.read_message(reader))
+        writer.close()
+        await writer.wait_closed()
+
+    async def test_leave_during_ai_turn(self):
+        reader, writer = await self.connect()
+        writer.write(protocol.encode(protocol.CREATE, protocol.VS_AI, protocol.ANY_PRESET))
+        _, (game_id, _, _, _), _ = await protocol.read_message(reader)
+        await protocol.read_message(reader)
+        session = self.server.sessions[game_id]
+        strategy = session.strategy = BlockingStrategy()
+
+        game = session.game
+        piece, move = next((piece, move) for piece in game.user.movable_pieces for move in piece.moves)
+        writer.write(protocol.encode(protocol.MOVE, piece.y_pos * 10 + piece.x_pos, move[1] * 10 + move[0]))
+        await protocol.read_message(reader)
+        while not strategy.thinking:
+            await asyncio.sleep(0.01)
+
+        events = []
+
+        def record(event):
+            events.append(type(event).__name__)
+        for event in (PieceMoved, PieceAttacked, GameOver):
+            game.events.subscribe(event, record)
+
+        # The strategy is only closed, and the game only ended, once the turn being played is over
+        self.server._leave(session, USER)
+        self.assertIsNone(strategy.closed_while_thinking)
+        self.assertEqual(events, [])
+        strategy.release.set()
+        while strategy.closed_while_thinking is None or 'GameOver' not in events:
+            await asyncio.sleep(0.01)
+        self.assertFalse(strategy.closed_while_thinking)
+        self.assertIn(events, (['PieceMoved', 'GameOver'], ['PieceAttacked', 'GameOver']))
+        writer.close()
+        await writer.wait_closed()
+
+    async def test_game_between_humans(self):
+        creator_reader, creator = await self.connect()
+        creator.write(protocol.encode(protocol.CREATE, protocol.VS_HUMAN, protocol.ANY_PRESET))
+        _, (game_id, side, _, _), _ = await protocol.read_message(creator_reader)
+        self.assertEqual(side, USER)
+
+        joiner_reader, joiner = await self.connect()
+        joiner.write(protocol.encode(protocol.JOIN, game_id, protocol.ANY_PRESET))
+        _, (_, side, _, _), _ = await protocol.read_message(joiner_reader)
+        self.assertEqual(side, OPPONENT)
+        for reader in (creator_reader, joiner_reader):
+            kind, _, _ = await protocol.read_message(reader)
+            self.assertEqual(kind, protocol.SNAPSHOT)
+
+        # A third player can't join, and leaving gives the game to the other side
+        third_reader, third = await self.connect()
+        third.write(protocol.encode(protocol.JOIN, game_id, protocol.ANY_PRESET))
+        kind, (code,), _ = await protocol.read_message(third_reader)
+        self.assertEqual((kind, code), (protocol.ERROR, protocol.GAME_FULL))
+        third.close()
+
+        joiner.write(protocol.encode(protocol.LEAVE))
+        kind, (_, winner, _), _ = await protocol.read_message(creator_reader)
+        self.assertEqual((kind, winner), (protocol.GAME_OVER, USER))
+        creator.close()
+
+    async def test_spectator_watches_many_games(self):
+        players = []
+        game_ids = []
+        for _ in range(2):
+            reader, writer = await self.connect()
+            writer.write(protocol.encode(protocol.CREATE, protocol.VS_AI, protocol.ANY_PRESET))
+            _, (game_id, _, _, _), _ = await protocol.read_message(reader)
+            await protocol.read_message(reader)
+            players.append((reader, writer))
+            game_ids.append(game_id)
+
+        # The first game is a move in before the spectator arrives
+        game = self.server.sessions[game_ids[0]].game
+        piece, move = next((piece, move) for piece in game.user.movable_pieces for move in piece.moves)
+        reader, writer = players[0]
+        writer.write(protocol.encode(protocol.MOVE, piece.y_pos * 10 + piece.x_pos, move[1] * 10 + move[0]))
+        for _ in range(2):
+            await protocol.read_message(reader)
+
+        spectator_reader, spectator = await self.connect()
+        for game_id in game_ids:
+            spectator.write(protocol.encode(protocol.WATCH, game_id))
+        frames = [await protocol.read_message(spectator_reader) for _ in range(4)]
+        # A snapshot and the moves since for the first game, a snapshot for the second
+        self.assertEqual([(kind, fields[0]) for kind, fields, _ in frames],
+                         [(protocol.SNAPSHOT, game_ids[0]), (protocol.MOVED, game_ids[0]),
+                          (protocol.MOVED, game_ids[0]), (protocol.SNAPSHOT, game_ids[1])])
+        kind, (_, ply, _, viewpoint), board = frames[0]
+        self.assertEqual((ply, viewpoint), (0, PUBLIC))
+        # Spectators see no ranks at the start, a plain move shows no rank either
+        self.assertEqual(board.count(protocol.HIDDEN) + board.count(protocol.OWN_HIDDEN), 80)
+        if frames[1][1][5] == outcomes.NO_ATTACK:
+            self.assertEqual(frames[1][1][6], protocol.NO_RANK)
+
+        # Leaving ends the game for the spectator too
+        reader, writer = players[1]
+        writer.write(protocol.encode(protocol.LEAVE))
+        kind, (game_id, winner, _), _ = await protocol.read_message(spectator_reader)
+        self.assertEqual((kind, game_id, winner), (protocol.GAME_OVER, game_ids[1], OPPONENT))
+
+        for _, writer in players + [(spectator_reader, spectator)]:
+            writer.close()
+            await writer.wait_closed()
+
+    async def test_resume_after_crash(self):
+        reader, writer = await self.connect()
+        writer.write(protocol.encode(protocol.CREATE, protocol.VS_AI, protocol.ANY_PRESET))
+        _, (game_id, _, _, _), _ = await protocol.read_message(reader)
+        await protocol.read_message(reader)
+        game = self.server.sessions[game_id].game
+        piece, move = next((piece, move) for piece in game.user.movable_pieces for move in piece.moves)
+        writer.write(protocol.encode(protocol.MOVE, piece.y_pos * 10 + piece.x_pos, move[1] * 10 + move[0]))
+        for _ in range(2):
+            await protocol.read_message(reader)
+        self.assertEqual(os.listdir(self.checkpoints.name), [f'game-{game_id}.strsnap'])
+
+        # Another server on the same directory stands in for this one after a crash
+        other = GameServer('127.0.0.1', 0, ai_workers=1, seed=7, checkpoint_directory=self.checkpoints.name)
+        await other.start()
+        try:
+            self.assertEqual(list(other.sessions), [game_id])
+            resumed = other.sessions[game_id].game
+            self.assertEqual((resumed.ply, resumed.position_key()), (2, game.position_key()))
+
+            other_reader, other_writer = await asyncio.open_connection('127.0.0.1', other.port)
+            other_writer.write(protocol.encode(protocol.RESUME, game_id, OPPONENT))
+            kind, (code,), _ = await protocol.read_message(other_reader)
+            self.assertEqual((kind, code), (protocol.ERROR, protocol.GAME_FULL))
+            other_writer.write(protocol.encode(protocol.RESUME, game_id, USER))
+            kind, (joined_id, side, _, _), _ = await protocol.read_message(other_reader)
+            self.assertEqual((kind, joined_id, side), (protocol.JOINED, game_id, USER))
+            kind, (_, ply, turn, _), _ = await protocol.read_message(other_reader)
+            self.assertEqual((kind, ply, turn), (protocol.SNAPSHOT, 2, USER))
+
+            piece, move = next((piece, move) for piece in resumed.user.movable_pieces for move in piece.moves)
+            other_writer.write(protocol.encode(protocol.MOVE, piece.y_pos * 10 + piece.x_pos,
+                                               move[1] * 10 + move[0]))
+            for expected in ((3, USER), (4, OPPONENT)):
+                kind, fields, _ = await protocol.read_message(other_reader)
+                self.assertEqual((kind, fields[1:3]), (protocol.MOVED, expected))
+
+            # Giving the game up ends it for good
+            other_writer.write(protocol.encode(protocol.LEAVE))
+            self.assertIsNone(await protocol.read_message(other_reader))
+            self.assertEqual(os.listdir(self.checkpoints.name), [])
+            other_writer.close()
+        finally:
+            await other.close()
+        writer.close()
+
+    async def test_load(self):
+        stats = await run_load_test('127.0.0.1', self.server.port, 8, 5, seed=3)
+        self.assertEqual((stats.sessions, stats.completed, stats.errors), (8, 8, 0))
+        self.assertEqual(len(stats.latencies), 40)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import tempfile
+import time
+import unittest
+
+from stratego import protocol
+from stratego.benchmark import random_game
+from stratego.board import Board
+from stratego.server import Session
+from stratego.snapshot import HEADER, PIECE, load_snapshot, read_snapshot, save_snapshot, write_snapshot
+from stratego.strategies import HeuristicStrategy
+from stratego.stratego_game import Stratego, USER, OPPONENT
+
+
+def play(game: Stratego, side: int, strategy, turns: int) -> tuple[int, list]:
+    moves = []
+    for _ in range(turns):
+        if game.check_game_over() is not None:
+            break
+        report = game.play_turn(side, strategy)
+        moves.append((report.source, report.target))
+        side = OPPONENT if side == USER else USER
+    return side, moves
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.strategy = HeuristicStrategy()
+        self.game = random_game(10, 3)
+        self.side, _ = play(self.game, USER, self.strategy, 30)
+
+    def test_round_trip(self):
+        data = save_snapshot(self.game, self.side)
+        other = random_game(10, 9)
+        self.assertEqual(load_snapshot(other, data), self.side)
+        self.assertEqual(save_snapshot(other, self.side), data)
+        for piece, restored in zip(self.game.user.pieces + self.game.opponent.pieces,
+                                   other.user.pieces + other.opponent.pieces):
+            self.assertEqual((piece.coords, piece.is_hidden, piece.is_captured, piece.has_moved, piece.moves),
+                             (restored.coords, restored.is_hidden, restored.is_captured, restored.has_moved,
+                              restored.moves))
+        self.assertEqual(other.position_key(), self.game.position_key())
+
+        # The restored game plays on exactly like the saved one, random choices included
+        _, moves = play(self.game, self.side, self.strategy, 40)
+        _, restored_moves = play(other, self.side, self.strategy, 40)
+        self.assertEqual(moves, restored_moves)
+
+    def test_restores_threats(self):
+        other = random_game(10, 9)
+        load_snapshot(other, save_snapshot(self.game, self.side))
+        for x in range(10):
+            for y in range(10):
+                self.assertEqual({id(piece) for piece in other.board.threatened_by(x, y, other.opponent)},
+                                 {id(piece) for piece in other.opponent.alive_pieces if (x, y) in piece.moves})
+
+    def test_other_board(self):
+        data = save_snapshot(self.game, self.side)
+        with self.assertRaises(Exception):
+            load_snapshot(random_game(20, 3), data)
+        with self.assertRaises(Exception):
+            load_snapshot(random_game(10, 3), data[:HEADER.size + 5])
+        with self.assertRaises(Exception):
+            load_snapshot(random_game(10, 3), b'STRGREC\0' + data[8:])
+
+    def test_failed_load_leaves_game_alone(self):
+        other = random_game(10, 9)
+        before = save_snapshot(other, USER)
+        data = bytearray(save_snapshot(self.game, self.side))
+        # The first piece moves in the snapshot, the tenth has another rank
+        rank = data[HEADER.size + 9 * PIECE.size]
+        data[HEADER.size + 9 * PIECE.size] = (rank + 1) % 12
+        with self.assertRaises(Exception):
+            load_snapshot(other, bytes(data))
+        self.assertEqual(save_snapshot(other, USER), before)
+
+        data = bytearray(save_snapshot(self.game, self.side))
+        data[HEADER.size + 2:HEADER.size + 4] = (200).to_bytes(2, 'little')
+        with self.assertRaises(Exception):
+            load_snapshot(other, bytes(data))
+        self.assertEqual(save_snapshot(other, USER), before)
+
+    def test_other_lakes(self):
+        other = random_game(10, 9)
+        other.board = Board(10, 10, other.user, other.opponent, setup_rows=other.setup_rows, lakes=frozenset())
+        with self.assertRaises(Exception):
+            load_snapshot(other, save_snapshot(self.game, self.side))
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            name = os.path.join(directory, 'saves', 'game.strsnap')
+            data = save_snapshot(self.game, self.side)
+            write_snapshot(name, data)
+            self.assertEqual(read_snapshot(name), data)
+            self.assertEqual(os.listdir(os.path.dirname(name)), ['game.strsnap'])
+
+    def test_fast(self):
+        other = random_game(10, 9)
+        start = time.perf_counter()
+        for _ in range(100):
+            load_snapshot(other, save_snapshot(self.game, self.side))
+        # Generous for slow machines, it takes well under a millisecond
+        self.assertLess((time.perf_counter() - start) / 100, 0.005)
+
+    def test_session_checkpoint(self):
+        session = Session(1, Stratego(seed=0), protocol.VS_AI, None)
+        session.apply_preset(USER, protocol.ANY_PRESET)
+        session.apply_preset(OPPONENT, protocol.ANY_PRESET)
+        session.game.start_game()
+        session.turn = OPPONENT
+        session.save_checkpoint()
+        checkpoint = session.checkpoint
+        session.game.play_turn(OPPONENT, self.strategy)
+        session.turn = USER
+
+        session.restore(checkpoint)
+        self.assertEqual((session.turn, session.feed.turn, session.game.ply), (OPPONENT, OPPONENT, 0))
+        self.assertEqual(save_snapshot(session.game, OPPONENT), checkpoint)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import time
+import unittest
+
+from stratego import outcomes
+from stratego.stratego_game import USER, OPPONENT
+from stratego.strategies import HeuristicStrategy, RandomStrategy, Strategy, make_strategy
+from tests.helpers import new_game
+
+
+class SlowStrategy(Strategy):
+    name = 'slow'
+
+    def choose_move(self, game, side, deadline):
+        time.sleep(0.02)
+        return None
+
+
+class TestStrategies(unittest.TestCase):
+    def test_heuristic_matches_opponent_turn(self):
+        by_turn = new_game(3)
+        by_strategy = new_game(3)
+        strategy = HeuristicStrategy()
+        for _ in range(10):
+            self.assertEqual(by_turn.play_turn(USER, RandomStrategy()).target,
+                             by_strategy.play_turn(USER, RandomStrategy()).target)
+            report = by_strategy.play_turn(OPPONENT, strategy)
+            self.assertEqual(by_turn.opponent_turn(), (report.source, report.target))
+        self.assertEqual(strategy.moves, 10)
+        self.assertGreater(strategy.total_time, 0)
+
+    def test_either_side(self):
+        game = new_game(0)
+        for side in (USER, OPPONENT, USER, OPPONENT):
+            own = game.players(side)[0]
+            report = game.play_turn(side, HeuristicStrategy())
+            self.assertEqual(report.side, side)
+            self.assertTrue(any(piece.coords == report.target for piece in own.alive_pieces)
+                            or report.outcome != outcomes.NO_ATTACK)
+
+    def test_random_moves_are_legal(self):
+        game = new_game(1)
+        strategy = RandomStrategy()
+        for ply in range(20):
+            side = USER if ply % 2 == 0 else OPPONENT
+            game.update_moves()
+            legal = {(piece.coords, move) for piece in game.players(side)[0].movable_pieces for move in piece.moves}
+            report = game.play_turn(side, strategy)
+            self.assertIn((report.source, report.target), legal)
+
+    def test_choose_move_required(self):
+        class Unfinished(Strategy):
+            name = 'unfinished'
+
+        # Caught when the strategy is made, not in the middle of a game
+        with self.assertRaises(TypeError):
+            Unfinished()
+
+    def test_budget(self):
+        game = new_game(0)
+        strategy = SlowStrategy()
+        game.move_budget = 0.01
+        report = game.play_turn(USER, strategy)
+        self.assertIsNone(report.target)
+        self.assertTrue(report.over_budget)
+        self.assertEqual(strategy.overruns, 1)
+
+        game.move_budget = None
+        self.assertFalse(game.play_turn(USER, strategy).over_budget)
+
+    def test_configured_strategies(self):
+        game = new_game(0)
+        self.assertIsNone(game.strategies[USER])
+        with self.assertRaises(Exception):
+            game.play_turn(USER)
+        self.assertEqual(game.strategies[OPPONENT].name, HeuristicStrategy.name)
+        with self.assertRaises(Exception):
+            make_strategy('clairvoyant')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+
+from stratego import outcomes, protocol
+from stratego.stratego_game import Stratego, USER, OPPONENT
+from stratego.sync import GameFeed, PUBLIC, VIEWPOINTS, encode_board
+from tests.helpers import piece_of, place
+
+
+def read(frame: bytes) -> tuple[int, tuple, bytes]:
+    _, kind = protocol.HEADER.unpack_from(frame)
+    fields, tail = protocol.decode(kind, frame[protocol.HEADER.size:])
+    return kind, fields, tail
+
+
+class TestSync(unittest.TestCase):
+    def setUp(self):
+        self.game = Stratego(seed=0)
+        self.sergeant = place(self.game, piece_of(self.game.user, 4), 0, 0)
+        self.general = place(self.game, piece_of(self.game.opponent, 9), 5, 5)
+        place(self.game, piece_of(self.game.user, 0), 9, 0)
+        place(self.game, piece_of(self.game.opponent, 0), 9, 9)
+        self.game.start_game()
+        self.feed = GameFeed(3, self.game, snapshot_interval=4)
+        self.feed.snapshot()
+        self.frames = {viewpoint: [] for viewpoint in VIEWPOINTS}
+        for viewpoint in VIEWPOINTS:
+            self.feed.subscribe(viewpoint, self.frames[viewpoint].append)
+
+    def test_moves_are_filtered_by_viewpoint(self):
+        self.game.take_move(self.sergeant, 0, 1)
+        ranks = {viewpoint: read(frames[-1])[1][6:] for viewpoint, frames in self.frames.items()}
+        # Only the side that moved sees the rank of a piece nobody has seen
+        self.assertEqual(ranks, {USER: (4, protocol.NO_RANK), OPPONENT: (protocol.NO_RANK, protocol.NO_RANK),
+                                 PUBLIC: (protocol.NO_RANK, protocol.NO_RANK)})
+
+        # An attack shows both ranks to everyone, and the winner stays known after it
+        self.general.move(0, 2)
+        self.game.take_move(self.general, 0, 1)
+        for frames in self.frames.values():
+            kind, (game_id, ply, side, source, target, outcome, attacker, defender), _ = read(frames[-1])
+            self.assertEqual((kind, game_id, ply, side), (protocol.MOVED, 3, 2, OPPONENT))
+            self.assertEqual((source, target, outcome, attacker, defender), (20, 10, outcomes.ATTACKER_WINS, 9, 4))
+        self.game.take_move(self.general, 1, 1)
+        self.assertEqual(read(self.frames[USER][-1])[1][6], 9)
+
+    def test_late_subscriber_catches_up(self):
+        self.game.take_move(self.sergeant, 0, 1)
+        self.game.take_move(self.general, 5, 4)
+        late = []
+        self.feed.subscribe(PUBLIC, late.append)
+        self.assertEqual([read(frame)[0] for frame in late], [protocol.SNAPSHOT, protocol.MOVED, protocol.MOVED])
+        self.assertEqual(late[1:], self.frames[PUBLIC][1:])
+
+        # A snapshot every few moves bounds what a late subscriber is sent
+        for y in (0, 1, 0):
+            self.game.take_move(self.sergeant, 0, y)
+            self.game.take_move(self.general, 5, 5 - y)
+        later = []
+        self.feed.subscribe(PUBLIC, later.append)
+        kind, (_, ply, turn, viewpoint), board = read(later[0])
+        self.assertEqual((kind, ply, turn, viewpoint), (protocol.SNAPSHOT, 8, USER, PUBLIC))
+        self.assertLess(len(later), 1 + self.feed.snapshot_interval)
+        self.assertEqual(board, encode_board(self.game, PUBLIC))
+
+        self.feed.unsubscribe(PUBLIC, later.append)
+        self.game.take_move(self.sergeant, 0, 1)
+        self.assertEqual(len(later), 1)
+
+    def test_frame_size_does_not_grow_with_the_board(self):
+        sizes = set()
+        for size in (10, 20, 40):
+            game = Stratego(seed=0, rows=size, columns=size, setup_rows=1)
+            piece = place(game, piece_of(game.user, 4), 0, 0)
+            game.start_game()
+            frames = []
+            feed = GameFeed(1, game)
+            feed.subscribe(USER, frames.append)
+            game.take_move(piece, 0, 1)
+            sizes.add(len(frames[0]))
+        self.assertEqual(len(sizes), 1)
+
+    def test_public_board(self):
+        self.sergeant.is_hidden = False
+        self.game.clear_observations()
+        board = encode_board(self.game, PUBLIC)
+        self.assertEqual(board[0], 4)
+        self.assertEqual(board[9], protocol.OWN_HIDDEN)
+        self.assertEqual(board[55], protocol.HIDDEN)
+        self.assertEqual(encode_board(self.game, USER)[9], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
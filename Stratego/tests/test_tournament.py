@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+
+from stratego.stratego_game import EndReason, USER, OPPONENT, DRAW
+from stratego.tournament import Entrant, elo_ratings, load_cache, play_match, preset_win_rates, run_tournament, \
+    schedule, summarize
+
+ENTRANTS = [Entrant(1), Entrant(2, 'random')]
+
+
+class TestTournament(unittest.TestCase):
+    def test_schedule(self):
+        entrants = [Entrant(1), Entrant(2), Entrant(3)]
+        pairings = schedule(entrants, 2, seed=0)
+        # Every ordered pair of different entrants, twice
+        self.assertEqual(len(pairings), 3 * 2 * 2)
+        self.assertEqual(len({pairing.key for pairing in pairings}), len(pairings))
+        self.assertFalse(any(pairing.user == pairing.opponent for pairing in pairings))
+        self.assertNotEqual({pairing.key for pairing in schedule(entrants, 2, seed=1)},
+                            {pairing.key for pairing in pairings})
+
+    def test_seeded_match(self):
+        pairing = schedule(ENTRANTS, 1, seed=0)[0]
+        first = play_match(pairing, max_plies=12)
+        second = play_match(pairing, max_plies=12)
+        for key in ('winner', 'reason', 'plies', 'user_moves', 'opponent_moves'):
+            self.assertEqual(first[key], second[key])
+        # Cut short by the harness, which is told apart from a draw by the rules
+        self.assertEqual((first['plies'], first['winner'], first['reason']), (12, DRAW, EndReason.PLY_LIMIT))
+
+    def test_elo(self):
+        results = [{'user': 'a', 'opponent': 'b', 'winner': USER}]
+        ratings = elo_ratings(results, ['a', 'b'], 16)
+        self.assertAlmostEqual(ratings['a'], 1508)
+        self.assertAlmostEqual(ratings['b'], 1492)
+
+        results.append({'user': 'b', 'opponent': 'a', 'winner': DRAW})
+        ratings = elo_ratings(results, ['a', 'b'], 16)
+        self.assertAlmostEqual(ratings['a'] + ratings['b'], 3000)
+        self.assertLess(ratings['a'], 1508)
+
+    def test_summary(self):
+        entrants = [Entrant(1), Entrant(1, 'random'), Entrant(2)]
+        results = [
+            {'user': '1/heuristic', 'opponent': '2/heuristic', 'winner': USER},
+            {'user': '2/heuristic', 'opponent': '1/random', 'winner': USER},
+            {'user': '1/random', 'opponent': '1/heuristic', 'winner': DRAW},
+            {'user': '2/heuristic', 'opponent': '1/heuristic', 'winner': OPPONENT},
+        ]
+        rows = {row['entrant']: row for row in summarize(results, entrants, 16)}
+        self.assertEqual((rows['1/heuristic']['wins'], rows['1/heuristic']['draws'], rows['1/heuristic']['losses']),
+                         (2, 1, 0))
+        self.assertEqual(rows['2/heuristic']['win_rate'], round(1 / 3, 4))
+        self.assertEqual(preset_win_rates(list(rows.values())), {1: 2 / 5, 2: 1 / 3})
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache_file = os.path.join(directory, 'results.jsonl')
+            results = run_tournament(ENTRANTS, 1, seed=0, workers=0, cache_file=cache_file, max_plies=8)
+            self.assertEqual(len(results), 2)
+
+            # An interrupted run leaves a partial line behind, it is ignored and nothing is played again
+            with open(cache_file, 'a') as file:
+                file.write('{"key": "0:1/heur')
+            self.assertEqual(len(load_cache(cache_file)), 2)
+            self.assertEqual(run_tournament(ENTRANTS, 1, seed=0, workers=0, cache_file=cache_file, max_plies=8),
+                             results)
+            with open(cache_file, 'r') as file:
+                self.assertEqual(sum(1 for line in file if line.endswith('}\n')), 2)
+
+            # A second game per pairing only plays the new games, across worker processes
+            results = run_tournament(ENTRANTS, 2, seed=0, workers=2, cache_file=cache_file, max_plies=8)
+            self.assertEqual(len(results), 4)
+            self.assertEqual(len(load_cache(cache_file)), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()